@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+__author__ = 'Akinava'
+__author_email__ = 'akinava@gmail.com'
+__copyright__ = 'Copyright © 2019'
+__license__ = 'MIT License'
+__version__ = [0, 0]
+
+
+from utilit import Singleton
+from metrics import Metrics
+from clock import get_loop_time
+import settings
+
+
+class TokenBucket:
+    __slots__ = ('tokens', 'update_time')
+
+    def __init__(self, tokens, update_time):
+        self.tokens = tokens
+        self.update_time = update_time
+
+    def take(self, now, rate, burst):
+        self.tokens = min(burst, self.tokens + max(0, now - self.update_time) * rate)
+        self.update_time = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class PackageLayout:
+    # where the package_id_marker byte sits and which lengths a package
+    # with this id may have, variable length fields leave the top open
+    __slots__ = ('id_offset', 'lengths')
+
+    def __init__(self, id_offset):
+        self.id_offset = id_offset
+        self.lengths = {}
+
+    def add(self, package_id, min_length, max_length):
+        self.lengths.setdefault(package_id, []).append((min_length, max_length))
+
+    def accepts(self, raw_message):
+        if len(raw_message) <= self.id_offset:
+            return False
+        for min_length, max_length in self.lengths.get(raw_message[self.id_offset], ()):
+            if len(raw_message) >= min_length and (max_length is None or len(raw_message) <= max_length):
+                return True
+        return False
+
+
+class Admission(Singleton):
+    # the checks run from the cheapest, a dropped datagram never
+    # reaches the parser or the worker pipes
+    def __init__(self):
+        if hasattr(self, '_Admission__layouts'):
+            return
+        self.__layouts = []
+        self.__min_length = 0
+        self.__sources = {}
+        self.__global_bucket = TokenBucket(settings.admission_global_burst, get_loop_time())
+        self.__shed_length = Metrics().counter('datagrams_shed', reason='length')
+        self.__shed_package_id = Metrics().counter('datagrams_shed', reason='package_id')
+        self.__shed_source_rate = Metrics().counter('datagrams_shed', reason='source_rate')
+        self.__shed_global_rate = Metrics().counter('datagrams_shed', reason='global_rate')
+
+    def compile(self, protocol):
+        layouts = {}
+        min_lengths = []
+        check_package_id = True
+        for package in protocol.get('package', []):
+            id_offset, min_length, max_length = self.__get_package_layout(package)
+            min_lengths.append(min_length)
+            if id_offset is None or 'package_id_marker' not in package:
+                # one package with an unknown id position makes any id possible
+                check_package_id = False
+                continue
+            layouts.setdefault(id_offset, PackageLayout(id_offset)).add(package['package_id_marker'], min_length, max_length)
+        self.__layouts = list(layouts.values()) if check_package_id else []
+        self.__min_length = min(min_lengths, default=0)
+
+    def __get_package_layout(self, package):
+        id_offset = None
+        variable_offset = False
+        min_length = 0
+        max_length = 0
+        for part in package['structure']:
+            if part['name'] == 'package_id_marker' and not variable_offset:
+                id_offset = min_length
+            if isinstance(part['length'], dict):
+                min_length += part['length'].get('min', 0)
+                max_length = None
+                variable_offset = True
+                continue
+            min_length += part['length']
+            if max_length is not None:
+                max_length += part['length']
+        return id_offset, min_length, max_length
+
+    def admit(self, raw_message, remote_addr, known_source):
+        if raw_message and not self.__has_valid_layout(raw_message):
+            return False
+        now = get_loop_time()
+        if not self.__take_source_token(remote_addr, now):
+            self.__shed_source_rate.inc()
+            return False
+        # datagrams of pool connections do not spend the global budget,
+        # a flood from strangers can not cut the swarm off
+        if not known_source and not self.__global_bucket.take(
+                now, settings.admission_global_rate, settings.admission_global_burst):
+            self.__shed_global_rate.inc()
+            return False
+        return True
+
+    def __has_valid_layout(self, raw_message):
+        if len(raw_message) < self.__min_length:
+            self.__shed_length.inc()
+            return False
+        if settings.request_encrypted_protocol or not self.__layouts:
+            # the package id of an encrypted message is behind the cipher
+            return True
+        for layout in self.__layouts:
+            if layout.accepts(raw_message):
+                return True
+        self.__shed_package_id.inc()
+        return False
+
+    def __take_source_token(self, remote_addr, now):
+        bucket = self.__sources.get(remote_addr)
+        if bucket is None:
+            if len(self.__sources) >= settings.admission_sources_max:
+                del self.__sources[next(iter(self.__sources))]
+            bucket = TokenBucket(settings.admission_source_burst, now)
+            self.__sources[remote_addr] = bucket
+        return bucket.take(now, settings.admission_source_rate, settings.admission_source_burst)
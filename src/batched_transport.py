@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+__author__ = 'Akinava'
+__author_email__ = 'akinava@gmail.com'
+__copyright__ = 'Copyright © 2019'
+__license__ = 'MIT License'
+__version__ = [0, 0]
+
+
+import os
+import sys
+import errno
+import ctypes
+import socket
+import struct
+import asyncio
+from collections import deque
+from settings import logger
+
+
+DATAGRAM_MAX_LENGTH = 2048
+BATCH_LENGTH = 64
+MSG_TRUNC = 0x20
+MSG_DONTWAIT = 0x40
+
+
+class IoVec(ctypes.Structure):
+    _fields_ = [
+        ('iov_base', ctypes.c_void_p),
+        ('iov_len', ctypes.c_size_t)]
+
+
+class MsgHdr(ctypes.Structure):
+    _fields_ = [
+        ('msg_name', ctypes.c_void_p),
+        ('msg_namelen', ctypes.c_uint32),
+        ('msg_iov', ctypes.POINTER(IoVec)),
+        ('msg_iovlen', ctypes.c_size_t),
+        ('msg_control', ctypes.c_void_p),
+        ('msg_controllen', ctypes.c_size_t),
+        ('msg_flags', ctypes.c_int)]
+
+
+class MMsgHdr(ctypes.Structure):
+    _fields_ = [
+        ('msg_hdr', MsgHdr),
+        ('msg_len', ctypes.c_uint)]
+
+
+class SockAddrIn(ctypes.Structure):
+    _fields_ = [
+        ('sin_family', ctypes.c_ushort),
+        ('sin_port', ctypes.c_uint16),
+        ('sin_addr', ctypes.c_uint8 * 4),
+        ('sin_zero', ctypes.c_uint8 * 8)]
+
+
+def load_libc():
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        libc.recvmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(MMsgHdr), ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+        libc.sendmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(MMsgHdr), ctypes.c_uint, ctypes.c_int]
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+libc = load_libc()
+SOCKADDR_LENGTH = ctypes.sizeof(SockAddrIn)
+SOCKADDR_STRUCT = struct.Struct('>2xH4s')
+IOVEC_LENGTH = ctypes.sizeof(IoVec)
+IOV_LEN_OFFSET = IoVec.iov_len.offset
+IOV_LEN_STRUCT = struct.Struct('N')
+MMSGHDR_LENGTH = ctypes.sizeof(MMsgHdr)
+MSG_LEN_OFFSET = MMsgHdr.msg_len.offset
+MSG_LEN_STRUCT = struct.Struct('I')
+MSG_FLAGS_OFFSET = MsgHdr.msg_flags.offset
+MSG_FLAGS_STRUCT = struct.Struct('i')
+PACKED_ADDRS_MAX_LENGTH = 4096
+
+
+class MessagesRing:
+    # one preallocated buffer and message headers reused by every syscall
+    def __init__(self, batch_length):
+        self.batch_length = batch_length
+        self.buffer = bytearray(batch_length * DATAGRAM_MAX_LENGTH)
+        self.view = memoryview(self.buffer)
+        self.c_buffer = (ctypes.c_char * len(self.buffer)).from_buffer(self.buffer)
+        self.addrs = (SockAddrIn * batch_length)()
+        self.addrs_view = memoryview(self.addrs).cast('B')
+        self.packed_addrs = {}
+        self.iovecs = (IoVec * batch_length)()
+        self.messages = (MMsgHdr * batch_length)()
+        self.iovecs_view = memoryview(self.iovecs).cast('B')
+        self.messages_view = memoryview(self.messages).cast('B')
+        buffer_addr = ctypes.addressof(self.c_buffer)
+        for index in range(batch_length):
+            self.iovecs[index].iov_base = buffer_addr + index * DATAGRAM_MAX_LENGTH
+            self.iovecs[index].iov_len = DATAGRAM_MAX_LENGTH
+            self.messages[index].msg_hdr.msg_name = ctypes.addressof(self.addrs[index])
+            self.messages[index].msg_hdr.msg_namelen = SOCKADDR_LENGTH
+            self.messages[index].msg_hdr.msg_iov = ctypes.pointer(self.iovecs[index])
+            self.messages[index].msg_hdr.msg_iovlen = 1
+
+    def get_messages(self, length):
+        for index in range(length):
+            flags, = MSG_FLAGS_STRUCT.unpack_from(self.messages_view, index * MMSGHDR_LENGTH + MSG_FLAGS_OFFSET)
+            if flags & MSG_TRUNC:
+                continue
+            offset = index * DATAGRAM_MAX_LENGTH
+            message_length, = MSG_LEN_STRUCT.unpack_from(self.messages_view, index * MMSGHDR_LENGTH + MSG_LEN_OFFSET)
+            port, host = SOCKADDR_STRUCT.unpack_from(self.addrs_view, index * SOCKADDR_LENGTH)
+            yield self.view[offset: offset + message_length], (socket.inet_ntoa(host), port)
+
+    def set_message(self, index, data, remote_addr):
+        offset = index * DATAGRAM_MAX_LENGTH
+        self.view[offset: offset + len(data)] = data
+        IOV_LEN_STRUCT.pack_into(self.iovecs_view, index * IOVEC_LENGTH + IOV_LEN_OFFSET, len(data))
+        addr_offset = index * SOCKADDR_LENGTH
+        self.addrs_view[addr_offset: addr_offset + SOCKADDR_LENGTH] = self.__pack_addr(remote_addr)
+
+    def __pack_addr(self, remote_addr):
+        packed_addr = self.packed_addrs.get(remote_addr)
+        if packed_addr is None:
+            if len(self.packed_addrs) >= PACKED_ADDRS_MAX_LENGTH:
+                self.packed_addrs.clear()
+            addr = SockAddrIn(socket.AF_INET, socket.htons(remote_addr[1]))
+            addr.sin_addr[:] = socket.inet_aton(remote_addr[0])
+            packed_addr = bytes(addr)
+            self.packed_addrs[remote_addr] = packed_addr
+        return packed_addr
+
+
+class BatchedDatagramTransport(asyncio.DatagramTransport):
+    def __init__(self, loop, sock, protocol, batch_length=BATCH_LENGTH):
+        super(BatchedDatagramTransport, self).__init__(extra={'socket': sock, 'sockname': sock.getsockname()})
+        self.__loop = loop
+        self.__sock = sock
+        self.__fileno = sock.fileno()
+        self.__protocol = protocol
+        self.__closing = False
+        self.__send_queue = deque()
+        self.__flush_scheduled = False
+        self.__writer_added = False
+        self.__use_mmsg = libc is not None and sock.family == socket.AF_INET
+        self.__receive_ring = MessagesRing(batch_length)
+        self.__send_ring = MessagesRing(batch_length)
+        self.__loop.call_soon(self.__protocol.connection_made, self)
+        self.__loop.add_reader(self.__fileno, self.__read_ready)
+
+    def sendto(self, data, addr=None):
+        if self.__closing:
+            return
+        self.__send_queue.append((data, addr))
+        if self.__flush_scheduled or self.__writer_added:
+            return
+        self.__flush_scheduled = True
+        self.__loop.call_soon(self.__flush)
+
+    def get_write_buffer_size(self):
+        return sum(len(data) for data, _ in self.__send_queue)
+
+    def is_closing(self):
+        return self.__closing
+
+    def close(self):
+        if self.__closing:
+            return
+        self.__closing = True
+        self.__loop.remove_reader(self.__fileno)
+        if self.__writer_added:
+            self.__loop.remove_writer(self.__fileno)
+        self.__send_queue.clear()
+        self.__loop.call_soon(self.__connection_lost)
+
+    def abort(self):
+        self.close()
+
+    def __connection_lost(self):
+        try:
+            self.__protocol.connection_lost(None)
+        finally:
+            self.__sock.close()
+
+    def __read_ready(self):
+        if self.__use_mmsg:
+            self.__receive_mmsg()
+        else:
+            self.__receive_from()
+
+    def __receive_mmsg(self):
+        ring = self.__receive_ring
+        while not self.__closing:
+            received = libc.recvmmsg(self.__fileno, ring.messages, ring.batch_length, MSG_DONTWAIT, None)
+            if received < 0:
+                self.__report_errno(ctypes.get_errno())
+                return
+            for view, remote_addr in ring.get_messages(received):
+                self.__protocol.datagram_received(bytes(view), remote_addr)
+            if received < ring.batch_length:
+                return
+
+    def __receive_from(self):
+        ring = self.__receive_ring
+        for index in range(ring.batch_length):
+            if self.__closing:
+                return
+            offset = index * DATAGRAM_MAX_LENGTH
+            try:
+                length, remote_addr = self.__sock.recvfrom_into(ring.view[offset: offset + DATAGRAM_MAX_LENGTH])
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                self.__protocol.error_received(e)
+                return
+            self.__protocol.datagram_received(bytes(ring.view[offset: offset + length]), remote_addr)
+
+    def __flush(self):
+        self.__flush_scheduled = False
+        if self.__closing:
+            return
+        if self.__use_mmsg:
+            self.__send_mmsg()
+        else:
+            self.__send_to()
+        if self.__send_queue and not self.__writer_added:
+            self.__writer_added = True
+            self.__loop.add_writer(self.__fileno, self.__write_ready)
+
+    def __write_ready(self):
+        self.__loop.remove_writer(self.__fileno)
+        self.__writer_added = False
+        self.__flush()
+
+    def __send_mmsg(self):
+        ring = self.__send_ring
+        while self.__send_queue:
+            batch_length = 0
+            for data, remote_addr in self.__send_queue:
+                if batch_length == ring.batch_length:
+                    break
+                if len(data) > DATAGRAM_MAX_LENGTH or remote_addr is None:
+                    break
+                ring.set_message(batch_length, data, remote_addr)
+                batch_length += 1
+            if batch_length == 0:
+                if not self.__send_one(*self.__send_queue[0]):
+                    return
+                self.__send_queue.popleft()
+                continue
+            sent = libc.sendmmsg(self.__fileno, ring.messages, batch_length, MSG_DONTWAIT)
+            if sent < 0:
+                if not self.__report_errno(ctypes.get_errno()):
+                    return
+                self.__send_queue.popleft()
+                continue
+            for _ in range(sent):
+                self.__send_queue.popleft()
+            if sent < batch_length:
+                return
+
+    def __send_to(self):
+        while self.__send_queue:
+            if not self.__send_one(*self.__send_queue[0]):
+                return
+            self.__send_queue.popleft()
+
+    def __send_one(self, data, remote_addr):
+        try:
+            self.__sock.sendto(data, remote_addr)
+        except (BlockingIOError, InterruptedError):
+            return False
+        except OSError as e:
+            self.__protocol.error_received(e)
+        return True
+
+    def __report_errno(self, error_number):
+        if error_number in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+            return False
+        self.__protocol.error_received(OSError(error_number, os.strerror(error_number)))
+        return True
+
+
+async def create_batched_endpoint(protocol_factory, local_addr, reuse_port=False):
+    loop = asyncio.get_running_loop()
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        if reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind(local_addr)
+        sock.setblocking(False)
+    except OSError:
+        sock.close()
+        raise
+    protocol = protocol_factory()
+    transport = BatchedDatagramTransport(loop, sock, protocol)
+    if libc is None:
+        logger.info('recvmmsg/sendmmsg are not available, batched transport uses recvfrom_into')
+    return transport, protocol
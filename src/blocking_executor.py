@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+__author__ = 'Akinava'
+__author_email__ = 'akinava@gmail.com'
+__copyright__ = 'Copyright © 2019'
+__license__ = 'MIT License'
+__version__ = [0, 0]
+
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from utilit import Singleton
+import settings
+
+
+class BlockingExecutor(Singleton):
+    # handlers run on the loop, blocking work is awaited from here; a
+    # pool or Peers write made by the work is queued to the loop by
+    # StateWriter
+    def __init__(self):
+        if hasattr(self, '_BlockingExecutor__executor'):
+            return
+        self.__executor = None
+
+    def run(self, function, *args):
+        if self.__executor is None:
+            self.__executor = ThreadPoolExecutor(
+                max_workers=settings.blocking_workers, thread_name_prefix='blocking')
+        return asyncio.get_running_loop().run_in_executor(self.__executor, function, *args)
+
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+__author__ = 'Akinava'
+__author_email__ = 'akinava@gmail.com'
+__copyright__ = 'Copyright © 2019'
+__license__ = 'MIT License'
+__version__ = [0, 0]
+
+
+from enum import Enum
+from collections import OrderedDict
+from connection import Connection
+from utilit import Singleton
+from peer_score import PeerScore
+import settings
+
+
+class ConnectionType(str, Enum):
+    client = 'client'
+    server = 'server'
+
+
+class SwarmStatus(str, Enum):
+    in_progress = 'in progress'
+    done = 'done'
+
+
+class DeliveryStrategy(str, Enum):
+    # tried in this order, a remembered strategy of the peer is tried first
+    direct = 'direct'
+    port_prediction = 'port prediction'
+    relay = 'relay'
+
+
+class PubKeys(Singleton):
+    # the same peer is announced by many servers, keep one key object
+    # and one fingerprint and B58 form per pub key for the most recently seen keys
+    def __init__(self):
+        if hasattr(self, '_PubKeys__pub_keys'):
+            return
+        self.__pub_keys = OrderedDict()
+        self.__fingerprints = OrderedDict()
+        self.__packed_pub_keys = OrderedDict()
+
+    def intern(self, pub_key):
+        if pub_key is None:
+            return None
+        interned_pub_key = self.__pub_keys.get(pub_key)
+        if interned_pub_key is not None:
+            self.__pub_keys.move_to_end(pub_key)
+            return interned_pub_key
+        self.__put(self.__pub_keys, pub_key, pub_key)
+        return pub_key
+
+    def get_fingerprint(self, pub_key, make_fingerprint):
+        return self.__get(self.__fingerprints, pub_key, make_fingerprint)
+
+    def get_packed(self, pub_key, pack):
+        return self.__get(self.__packed_pub_keys, pub_key, lambda: pack(pub_key))
+
+    def __get(self, items, pub_key, make_value):
+        value = items.get(pub_key)
+        if value is not None:
+            items.move_to_end(pub_key)
+            return value
+        value = make_value()
+        self.__put(items, pub_key, value)
+        return value
+
+    def __put(self, items, pub_key, value):
+        items[pub_key] = value
+        if len(items) > settings.pub_keys_cache_size:
+            items.popitem(last=False)
+
+
+class ClientConnection(Connection):
+    __slots__ = ('type', 'swarm_status', '__score', '__fingerprint')
+    # set only on the few connections that go through a relay client
+    relay = None
+
+    def __init__(self, *args, **kwargs):
+        self.__fingerprint = None
+        self.__score = None
+        super(ClientConnection, self).__init__(*args, **kwargs)
+
+    @property
+    def score(self):
+        # most announced neighbours are never scored, the score is made
+        # when it is first read
+        if self.__score is None:
+            self.__score = PeerScore()
+        return self.__score
+
+    @score.setter
+    def score(self, score):
+        self.__score = score
+
+    def set_pub_key(self, pub_key):
+        self.__fingerprint = None
+        super(ClientConnection, self).set_pub_key(PubKeys().intern(pub_key))
+
+    def get_fingerprint(self):
+        if self.__fingerprint is None:
+            self.__fingerprint = PubKeys().get_fingerprint(
+                self.get_pub_key(), super(ClientConnection, self).get_fingerprint)
+        return self.__fingerprint
@@ -6,73 +6,423 @@ __license__ = 'MIT License'
 __version__ = [0, 0]
 
 
-import time
+import random
+import asyncio
 from handler import Handler
 from datagram import Datagram
 import settings
 from settings import logger
 from peers import Peers
+from delivery import Delivery
+from codec import Codecs
+from servers_list_cache import ServersListCache
+from client_connection import ClientConnection, ConnectionType, SwarmStatus, DeliveryStrategy
+from workers import WorkerChannel
+from keepalive import Keepalive
+from metrics import Metrics
+from relay import RelayDatagram, RelayProbeDatagram, RelayProbes, RelayTransport
+from fingerprint_cache import FingerprintCache
+from admission import Admission
+from clock import get_loop_time
+from peer_score import choose_weighted
+from utilit import Singleton
+
+
+class HandlerMetrics(Singleton):
+    # a handler is made per call, the per datagram counters are looked up once here
+    def __init__(self):
+        if hasattr(self, 'datagrams_in'):
+            return
+        self.datagrams_in = Metrics().counter('datagrams_in')
+        self.datagrams_in_bytes = Metrics().counter('datagrams_in_bytes')
+        self.relay_forwarded = Metrics().counter('relay_forwarded')
+        self.relay_dropped = Metrics().counter('relay_dropped')
+        self.__datagrams_out = {}
+
+    def get_datagrams_out(self, package_name):
+        counter = self.__datagrams_out.get(package_name)
+        if counter is None:
+            counter = Metrics().counter('datagrams_out', package=package_name)
+            self.__datagrams_out[package_name] = counter
+        return counter
+
+
+class NeighboursWaiters(Singleton):
+    def __init__(self):
+        if hasattr(self, '_NeighboursWaiters__waiters'):
+            return
+        self.__waiters = {}
+
+    def add(self, remote_addr):
+        future = asyncio.get_event_loop().create_future()
+        self.__waiters.setdefault(remote_addr, set()).add(future)
+        return future
+
+    def remove(self, remote_addr, future):
+        waiters = self.__waiters.get(remote_addr)
+        if waiters is None:
+            return
+        waiters.discard(future)
+        if not waiters:
+            del self.__waiters[remote_addr]
+
+    def received(self, remote_addr):
+        for future in self.__waiters.pop(remote_addr, ()):
+            if not future.done():
+                future.set_result(True)
 
 
 class ClientHandler(Handler):
+    def datagram_received(self, raw_message, remote_addr):
+        if not Admission().admit(raw_message, remote_addr, self.net_pool.get_connection_by_addr(remote_addr) is not None):
+            return
+        if not WorkerChannel().is_owner(remote_addr):
+            WorkerChannel().forward(raw_message, remote_addr)
+            return
+        self.handle_datagram(raw_message, remote_addr)
+
+    def handle_datagram(self, raw_message, remote_addr):
+        handler_metrics = HandlerMetrics()
+        handler_metrics.datagrams_in.inc()
+        handler_metrics.datagrams_in_bytes.inc(len(raw_message))
+        Keepalive().received(remote_addr)
+        super(ClientHandler, self).datagram_received(raw_message, remote_addr)
+        Delivery().received(remote_addr)
+
+    def send(self, **kwargs):
+        super(ClientHandler, self).send(**kwargs)
+        response = kwargs['response']
+        HandlerMetrics().get_datagrams_out(response.package_protocol['name']).inc()
+        Keepalive().sent(response.connection.get_remote_addr())
+
     def extended_get_pub_key(self, request):
-        def copy_connection_property(connection_src, connection_dst):
-            connection_dst.set_pub_key(connection_src.get_pub_key())
-            connection_dst.set_encrypt_marker(connection_src.get_encrypt_marker())
-            connection_dst.sent_message_time = connection_src.sent_message_time
+        def copy_connection_property(key_material, connection_dst):
+            if key_material.connection is connection_dst:
+                return
+            connection_dst.set_pub_key(key_material.pub_key)
+            connection_dst.set_encrypt_marker(key_material.encrypt_marker)
+            connection_dst.sent_message_time = key_material.connection.sent_message_time
 
         fingerprint = request.raw_message[: self.crypt_tools.fingerprint_length]
-        connection = self.net_pool.get_connection_by_fingerprint(fingerprint)
-        if connection is None:
+        key_material, cached = FingerprintCache().get(fingerprint)
+        if not cached:
+            connection = self.net_pool.get_connection_by_fingerprint(fingerprint)
+            if connection is None:
+                FingerprintCache().put_unknown(fingerprint)
+                return None
+            key_material = FingerprintCache().put(fingerprint, connection)
+        if key_material is None:
             return None
 
-        copy_connection_property(connection, request.connection)
-        return connection.get_pub_key()
+        copy_connection_property(key_material, request.connection)
+        return key_material.pub_key
 
     def hpn_neighbours_client_request(self, request):
-        response = Datagram(request.connection)
-        self.__delivered_by_direct_send(request, response)
+        return asyncio.ensure_future(self.__do_hpn_neighbours_client_request(request))
+
+    async def __do_hpn_neighbours_client_request(self, request):
+        delivered, = await self.__delivered_by_direct_send(request, [Datagram(request.connection)])
+        return delivered
 
-    def __do_hpn_servers_request(self, request, receiving_connection):
-        response = Datagram(receiving_connection)
-        if self.__delivered_by_direct_send(request, response):
+    async def __do_hpn_servers_request(self, request, receiving_connections):
+        delivered = await self.__delivered_by_strategies(request, receiving_connections)
+        for receiving_connection, connection_delivered in zip(receiving_connections, delivered):
+            if connection_delivered:
+                # a punched neighbour is kept with its score even if it was never stored
+                Peers().add_client_peer(receiving_connection)
+            else:
+                Peers().update_peer_score(receiving_connection, ConnectionType.client)
+        logger.info('punch batch from {}: {} delivered, {} lost'.format(
+            request.connection, delivered.count(True), delivered.count(False)))
+        server = '{}:{}'.format(*request.connection.get_remote_addr())
+        Metrics().counter('punch_delivered', server=server).inc(delivered.count(True))
+        Metrics().counter('punch_lost', server=server).inc(delivered.count(False))
+        if any(delivered):
             self.__has_enough_client_connections()
-        # TODO next delivery strategy
-
-    def __delivered_by_direct_send(self, request, response):
-        def sent_message_is_over_time_out(sent_message_time):
-            return sent_message_time + settings.peer_timeout_seconds < time.time()
-
-        first_sent_message_time = time.time()
-        self.net_pool.add_connection(response.connection)
-        while response.connection.message_was_never_received():
-            if response.connection.last_sent_message_is_over_ping_time():
-                self.send(request=request, response=response)
-            if sent_message_is_over_time_out(first_sent_message_time):
-                logger.warn('message {} to {} is lost'.format(response.package_protocol['name'], response.connection))
-                self.net_pool.disconnect(response.connection)
-                return False
-            time.sleep(0.1)
-        logger.debug('message {} to {} is delivered'.format(response.package_protocol['name'], response.connection))
-        return True
+        return delivered
+
+    async def __delivered_by_strategies(self, request, connections):
+        # every round moves the lost connections to their next strategy,
+        # connections on the same strategy share one delivery batch
+        delivered = [False] * len(connections)
+        tried = [set() for _ in connections]
+        pending = list(range(len(connections)))
+        while pending:
+            for index in pending:
+                if self.__reached_us(connections[index]):
+                    # the peer came in by itself while a strategy was timing out
+                    delivered[index] = True
+                    self.__strategy_delivered(connections[index], DeliveryStrategy.direct)
+            pending = [index for index in pending if not delivered[index]]
+            indexes_by_strategy = {}
+            for index in pending:
+                strategy = self.__get_next_strategy(connections[index], tried[index])
+                if strategy is None:
+                    continue
+                tried[index].add(strategy)
+                indexes_by_strategy.setdefault(strategy, []).append(index)
+            if not indexes_by_strategy:
+                break
+            strategies_delivered = await asyncio.gather(*(
+                self.__delivered_by_strategy(strategy, request, [connections[index] for index in indexes])
+                for strategy, indexes in indexes_by_strategy.items()))
+            for (strategy, indexes), strategy_delivered in zip(indexes_by_strategy.items(), strategies_delivered):
+                Metrics().counter('punch_strategy_lost', strategy=strategy.value).inc(strategy_delivered.count(False))
+                for index, connection_delivered in zip(indexes, strategy_delivered):
+                    if connection_delivered:
+                        delivered[index] = True
+                        self.__strategy_delivered(connections[index], strategy)
+            pending = [index for index in pending if not delivered[index]]
+        return delivered
+
+    def __reached_us(self, connection):
+        return self.net_pool.get_connection_by_addr(connection.get_remote_addr()) is not None
+
+    def __strategy_delivered(self, connection, strategy):
+        Metrics().counter('punch_strategy_delivered', strategy=strategy.value).inc()
+        Peers().set_delivery_strategy(connection, strategy.value)
+
+    def __get_next_strategy(self, connection, tried):
+        if not tried:
+            strategy = Peers().get_delivery_strategy(connection)
+            if strategy is not None:
+                return DeliveryStrategy(strategy)
+        for strategy in DeliveryStrategy:
+            if strategy not in tried:
+                return strategy
+        return None
+
+    async def __delivered_by_strategy(self, strategy, request, connections):
+        if strategy == DeliveryStrategy.port_prediction:
+            return await self.__delivered_by_port_prediction(request, connections)
+        if strategy == DeliveryStrategy.relay:
+            return await self.__delivered_by_relay(request, connections)
+        return await self.__delivered_by_direct_send(
+            request, [Datagram(connection) for connection in connections], settings.delivery_tier_timeout_seconds)
+
+    async def __delivered_by_port_prediction(self, request, connections):
+        # a symmetric NAT usually maps the next session of the peer
+        # to a port close to the one the server saw
+        responses = []
+        owners = []
+        for index, connection in enumerate(connections):
+            for predicted_connection in self.__get_predicted_connections(connection):
+                responses.append(Datagram(predicted_connection))
+                owners.append(index)
+        delivered = [False] * len(connections)
+        if not responses:
+            return delivered
+        predicted_delivered = await self.__delivered_by_direct_send(
+            request, responses, settings.delivery_tier_timeout_seconds)
+        for index, response_delivered in zip(owners, predicted_delivered):
+            if response_delivered:
+                delivered[index] = True
+        return delivered
+
+    def __get_predicted_connections(self, connection):
+        host, port = connection.get_remote_addr()
+        predicted_connections = []
+        for distance in range(1, settings.port_prediction_range + 1):
+            for predicted_port in (port + distance, port - distance):
+                if not 0 < predicted_port < 65536:
+                    continue
+                predicted_connection = self.net_pool.create_connection((host, predicted_port), self.transport)
+                if self.net_pool.get_connection(predicted_connection) is not None or \
+                        self.net_pool.is_pending_connection(predicted_connection):
+                    continue
+                self.__copy_peer_property(connection, predicted_connection)
+                predicted_connections.append(predicted_connection)
+        return predicted_connections
+
+    async def __delivered_by_relay(self, request, connections):
+        delivered = [False] * len(connections)
+        relay_connections = await self.__get_relay_connections(connections)
+        relay_transports = {}
+        responses = []
+        relayed_owners = []
+        for index, relay_connection in enumerate(relay_connections):
+            if relay_connection is None or self.__reached_us(connections[index]):
+                # a peer that came in during the probes is left to the next round
+                continue
+            relay_transport = relay_transports.get(relay_connection.get_remote_addr())
+            if relay_transport is None:
+                relay_transport = RelayTransport(self, relay_connection)
+                relay_transports[relay_connection.get_remote_addr()] = relay_transport
+            connection = connections[index]
+            relayed_connection = self.net_pool.create_connection(connection.get_remote_addr(), relay_transport)
+            self.__copy_peer_property(connection, relayed_connection)
+            relayed_connection.score = connection.score
+            relayed_connection.relay = relay_transport
+            responses.append(Datagram(relayed_connection))
+            relayed_owners.append(index)
+        if not responses:
+            return delivered
+        relayed_delivered = await self.__delivered_by_direct_send(
+            request, responses, settings.delivery_tier_timeout_seconds)
+        for index, response_delivered in zip(relayed_owners, relayed_delivered):
+            delivered[index] = response_delivered
+        return delivered
+
+    async def __get_relay_connections(self, connections):
+        # a few neighbours are asked which of the peers they have in the
+        # pool, the relay of a peer is one of the neighbours that said yes
+        receiving_addrs = {connection.get_remote_addr() for connection in connections}
+        candidates = [
+            relay_connection for relay_connection in self.net_pool.get_all_client_connections()
+            if relay_connection.relay is None and relay_connection.get_remote_addr() not in receiving_addrs]
+        candidates = random.sample(candidates, min(settings.relay_choice_attempts, len(candidates)))
+        probes = [(connection, relay_connection) for connection in connections for relay_connection in candidates]
+        answers = await asyncio.gather(*(
+            self.__probe_relay(relay_connection, connection) for connection, relay_connection in probes))
+        reachable = {}
+        for (connection, relay_connection), reachable_via_relay in zip(probes, answers):
+            if reachable_via_relay:
+                reachable.setdefault(connection.get_remote_addr(), []).append(relay_connection)
+        return [
+            choose_weighted(reachable.get(connection.get_remote_addr()), lambda relay_connection: relay_connection.score)
+            for connection in connections]
+
+    async def __probe_relay(self, relay_connection, connection):
+        relay_addr, target_addr = relay_connection.get_remote_addr(), connection.get_remote_addr()
+        future = RelayProbes().expect(relay_addr, target_addr)
+        request = Datagram(relay_connection)
+        request.set_package_protocol({'response': 'hpn_relay_probe'})
+        self.send(request=request, response=RelayProbeDatagram(relay_connection, relay_addr=target_addr))
+        try:
+            return await asyncio.wait_for(future, settings.relay_probe_timeout_seconds)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            RelayProbes().forget(relay_addr, target_addr, future)
+
+    def __copy_peer_property(self, connection_src, connection_dst):
+        connection_dst.set_pub_key(connection_src.get_pub_key())
+        connection_dst.set_encrypt_marker(connection_src.get_encrypt_marker())
+        connection_dst.type = connection_src.type
+
+    def hpn_pong(self, request):
+        self.send(request=request, response=Datagram(request.connection))
+
+    def handle_pong(self, request):
+        # the datagram has already moved the keepalive deadline of the peer
+        return
+
+    def hpn_relayed_message(self, request):
+        # a neighbour asks to pass the message to one of our neighbours
+        target_connection = self.net_pool.get_connection_by_addr(request.unpack_message['relay_addr'])
+        if not self.__is_relay_peer(request.connection) or \
+                target_connection is None or not self.__is_relay_peer(target_connection):
+            HandlerMetrics().relay_dropped.inc()
+            return
+        response = RelayDatagram(
+            target_connection,
+            relay_addr=request.connection.get_remote_addr(),
+            relay_message=request.unpack_message['relay_message'])
+        self.send(request=request, response=response)
+        HandlerMetrics().relay_forwarded.inc()
+
+    def hpn_relay_probe_response(self, request):
+        if not self.__is_relay_peer(request.connection):
+            HandlerMetrics().relay_dropped.inc()
+            return
+        target_connection = self.net_pool.get_connection_by_addr(request.unpack_message['relay_addr'])
+        response = RelayProbeDatagram(
+            request.connection,
+            relay_addr=request.unpack_message['relay_addr'],
+            relay_reachable=target_connection is not None and target_connection is not request.connection and
+            self.__is_relay_peer(target_connection))
+        self.send(request=request, response=response)
+
+    def handle_relay_probe_response(self, request):
+        RelayProbes().resolve(
+            request.connection.get_remote_addr(),
+            request.unpack_message['relay_addr'],
+            bool(request.unpack_message['relay_reachable']))
+
+    def handle_relayed_message(self, request):
+        # the relayed message is handled as a datagram of the source,
+        # the source joins the pool only if the handler verified it
+        source_addr = request.unpack_message['relay_addr']
+        relay_message = request.unpack_message['relay_message']
+        if not self.__is_relay_peer(request.connection):
+            HandlerMetrics().relay_dropped.inc()
+            return
+        if not Admission().admit(relay_message, source_addr, self.net_pool.get_connection_by_addr(source_addr) is not None):
+            return
+        source_connection = self.net_pool.create_connection(source_addr, None)
+        known_source = self.net_pool.get_connection(source_connection) is source_connection or \
+            self.net_pool.is_pending_connection(source_connection)
+        if known_source and source_connection.relay is None:
+            # a peer we talk to directly never comes through a relay
+            HandlerMetrics().relay_dropped.inc()
+            return
+        if not known_source:
+            relay_transport = RelayTransport(self, request.connection)
+            source_connection = ClientConnection(remote_addr=source_addr, transport=relay_transport)
+            source_connection.relay = relay_transport
+            source_connection.type = ConnectionType.client
+            self.net_pool.add_pending_connection(source_connection)
+        self.handle_datagram(relay_message, source_addr)
+        if known_source:
+            return
+        if source_connection.message_was_never_received():
+            self.net_pool.disconnect(source_connection)
+            return
+        self.net_pool.confirm_connection(source_connection)
+
+    def __is_relay_peer(self, connection):
+        if not self.net_pool.is_client_connection(connection) or connection.relay is not None:
+            return False
+        return not settings.request_encrypted_protocol or bool(connection.get_encrypt_marker())
+
+    def get_relay_addr(self, **kwargs):
+        return kwargs['response'].relay_addr
+
+    def get_relay_message(self, **kwargs):
+        return kwargs['response'].relay_message
+
+    def get_relay_reachable(self, **kwargs):
+        return 1 if kwargs['response'].relay_reachable else 0
+
+    async def __delivered_by_direct_send(self, request, responses, timeout=None):
+        # the guessed and relayed connections join the pool only when
+        # the peer has answered with a message the handler verified
+        for response in responses:
+            self.net_pool.add_pending_connection(response.connection)
+        delivered = await Delivery().deliver_batch(
+            [(response.connection, self.__make_sender(request, response)) for response in responses], timeout)
+        for response, response_delivered in zip(responses, delivered):
+            if response_delivered:
+                logger.debug('message {} to {} is delivered'.format(response.package_protocol['name'], response.connection))
+                self.net_pool.confirm_connection(response.connection)
+                continue
+            logger.warn('message {} to {} is lost'.format(response.package_protocol['name'], response.connection))
+            self.net_pool.disconnect(response.connection)
+        return delivered
+
+    def __make_sender(self, request, response):
+        return lambda: self.send(request=request, response=response)
 
     def hpn_servers_request(self, request):
+        NeighboursWaiters().received(request.connection.get_remote_addr())
         self.__handle_disconnect_flag(request)
         neighbours_connections = self.__get_neighbours_connections_from_hpn_server_response(request)
-        self.__update_server_last_response_field(request)
+        self.__update_server_last_response_field(request, neighbours_connections)
+        receiving_connections = []
         for receiving_connection in neighbours_connections:
             if self.__known_connection(receiving_connection):
                 logger.debug('connection {} exist in net_pool'.format(receiving_connection))
                 continue
-            self.run_stream(target=self.__do_hpn_servers_request, request=request, receiving_connection=receiving_connection)
+            receiving_connections.append(receiving_connection)
+        if receiving_connections:
+            asyncio.ensure_future(self.__do_hpn_servers_request(request=request, receiving_connections=receiving_connections))
 
-    def __update_server_last_response_field(self, request):
-        neighbours_connections = self.__get_neighbours_connections_from_hpn_server_response(request)
+    def __update_server_last_response_field(self, request, neighbours_connections):
         if len(neighbours_connections) > 0:
             Peers().update_peer_last_response_field(request.connection)
 
     def __known_connection(self, connection):
-        return connection in self.net_pool.get_all_client_connections()
+        return self.net_pool.is_client_connection(connection) or self.net_pool.is_pending_connection(connection)
 
     def __handle_disconnect_flag(self, request):
         if request.unpack_message['disconnect_flag']:
@@ -90,9 +440,13 @@ class ClientHandler(Handler):
             remote_addr=neighbour_data['hpn_clients_addr'],
             transport=self.transport,
         )
+        if self.net_pool.get_connection(neighbour_connection) is neighbour_connection or \
+                self.net_pool.is_pending_connection(neighbour_connection):
+            return neighbour_connection
         neighbour_connection.set_pub_key(neighbour_data['hpn_clients_pub_key'])
         neighbour_connection.set_encrypt_marker(settings.request_encrypted_protocol)
-        neighbour_connection.type = 'client'
+        neighbour_connection.type = ConnectionType.client
+        neighbour_connection.score = Peers().get_peer_score(neighbour_connection, ConnectionType.client)
         return neighbour_connection
 
     def hpn_servers_list(self, request):
@@ -100,22 +454,36 @@ class ClientHandler(Handler):
         self.send(request=request, response=response)
 
     def get_hpn_servers_list(self, **kwargs):
+        peers = Peers()
+        hpn_servers_list = ServersListCache().get(peers.servers_version)
+        if hpn_servers_list is not None:
+            return hpn_servers_list
         hpn_servers_list = []
         parser = self.parser()
         hpn_servers_list_max_length = parser.protocol['list']['hpn_servers_list']['length']['max']
-        servers_data = Peers().get_servers_list(hpn_servers_list_max_length)
+        servers_data = peers.get_servers_list(hpn_servers_list_max_length)
         for server_data in servers_data:
             hpn_servers_list.append(self.pack_server(server_data))
+        ServersListCache().put(
+            servers_version=peers.servers_version,
+            expiry_time=peers.get_servers_list_expiry_time(hpn_servers_list_max_length),
+            servers_list=hpn_servers_list)
         return hpn_servers_list
 
     def pack_server(self, server_data):
+        codec = Codecs().get_codec('hpn_servers_list')
+        if codec is not None and codec.verified:
+            return codec.pack(codec.get_values(self, server_data=server_data))
         server_data_structure = self.parser().protocol['list']['hpn_servers_list']['structure']
-        return self.make_message_by_structure(
+        message = self.make_message_by_structure(
             structure=server_data_structure,
             server_data=server_data)
+        if codec is not None:
+            Codecs().verify(codec, codec.pack(codec.get_values(self, server_data=server_data)), message)
+        return message
 
     def get_hpn_servers_pub_key(self, **kwargs):
-        return kwargs['server_data']['pub_key']
+        return Peers().get_pub_key(kwargs['server_data'])
 
     def get_hpn_servers_protocol(self, **kwargs):
         return kwargs['server_data']['protocol']
@@ -135,11 +503,13 @@ class ClientHandler(Handler):
         Peers().add_client_peer(request.connection)
 
     def __has_enough_client_connections(self):
-        if self.net_pool.swarm_status != 'in progress':
+        if self.net_pool.swarm_status != SwarmStatus.in_progress:
             return
         if not self.net_pool.has_enough_client_connections():
             return
-        self.net_pool.swarm_status = 'done'
+        self.net_pool.swarm_status = SwarmStatus.done
+        Metrics().gauge('swarm_done_seconds').set(get_loop_time() - self.net_pool.swarm_start_time)
+        WorkerChannel().send('swarm_status', SwarmStatus.done)
         if not hasattr(self, 'init'):
             return
         self.init()
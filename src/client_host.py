@@ -12,9 +12,21 @@ from host import Host
 from protocol import PROTOCOL
 from peers import Peers
 from datagram import Datagram
-from utilit import update_obj, Stream
-from client_handler import ClientHandler
+from utilit import update_obj
+from client_handler import ClientHandler, NeighboursWaiters
 from client_net_pool import ClientNetPool
+from swarm import SwarmMaintainer
+from codec import Codecs
+from client_connection import ConnectionType, SwarmStatus
+from peer_score import PeerScore
+from workers import WorkerChannel
+from state_writer import StateWriter
+from batched_transport import create_batched_endpoint
+from keepalive import Keepalive, KEEPALIVE_PROTOCOL
+from metrics import Metrics, MetricsReporter
+from relay import RELAY_PROTOCOL
+from admission import Admission
+from clock import get_loop_time
 
 
 class Client(Host):
@@ -22,17 +34,94 @@ class Client(Host):
         extended_protocol = self.__extend_protocol(PROTOCOL, protocol)
         extended_handler = self.__extend_handler(handler)
         super(Client, self).__init__(net_pool=ClientNetPool, handler=extended_handler, protocol=extended_protocol)
-        self.net_pool.swarm_status = 'in progress'
+        self.net_pool.swarm_status = SwarmStatus.in_progress
 
     async def run(self):
+        self.net_pool.swarm_start_time = get_loop_time()
+        StateWriter().start(asyncio.get_running_loop())
+        Peers().load_async()
         await self.create_default_listener()
+        self.__register_pool_metrics()
         ping_task = asyncio.create_task(self.ping())
         swarm_task = asyncio.create_task(self.__serve_swarm())
+        if settings.metrics_file or settings.metrics_port:
+            asyncio.create_task(MetricsReporter(
+                metrics_file=settings.metrics_file,
+                metrics_port=settings.metrics_port,
+                dump_seconds=settings.metrics_dump_seconds).serve())
         await ping_task
         await swarm_task
 
+    def __register_pool_metrics(self):
+        Metrics().gauge('pool_connections', callback=lambda: len(self.net_pool.connections_list))
+        Metrics().gauge(
+            'pool_connections', callback=lambda: len(self.net_pool.get_all_client_connections()), type=ConnectionType.client.value)
+        Metrics().gauge(
+            'pool_connections', callback=lambda: len(self.net_pool.get_server_connections()), type=ConnectionType.server.value)
+
+    async def ping(self):
+        Keepalive().start(send_ping=self.__send_ping, disconnect=self.net_pool.disconnect)
+        for connection in list(self.net_pool.connections_list):
+            Keepalive().track(connection)
+        while not self.default_listener.is_closing():
+            await asyncio.sleep(settings.peer_ping_time_seconds)
+
+    def __send_ping(self, connection):
+        if connection.type == ConnectionType.client:
+            request = Datagram(connection)
+            request.set_package_protocol({'response': 'hpn_ping'})
+            self.handler().send(request=request, response=Datagram(connection))
+        else:
+            # a server does not know hpn_ping, an empty datagram keeps the NAT mapping open
+            self.default_listener.sendto(b'', connection.get_remote_addr())
+        Metrics().counter('pings_out').inc()
+
+    async def run_worker(self, pipe, worker_index, workers_count):
+        WorkerChannel().attach(pipe, worker_index, workers_count)
+        WorkerChannel().on('datagram', self.__handle_forwarded_datagram)
+        WorkerChannel().on('swarm_status', self.__set_swarm_status)
+        report_task = asyncio.create_task(self.__report_client_connections())
+        await self.run()
+        report_task.cancel()
+
+    async def create_default_listener(self):
+        if not WorkerChannel().is_active() and not settings.batched_transport:
+            return await super(Client, self).create_default_listener()
+        local_addr = (settings.local_host, settings.default_port)
+        reuse_port = WorkerChannel().is_active()
+        if settings.batched_transport:
+            self.default_listener, self.__listener_handler = await create_batched_endpoint(
+                self.handler,
+                local_addr=local_addr,
+                reuse_port=reuse_port)
+            return
+        loop = asyncio.get_running_loop()
+        self.default_listener, self.__listener_handler = await loop.create_datagram_endpoint(
+            self.handler,
+            local_addr=local_addr,
+            reuse_port=reuse_port)
+
+    def __handle_forwarded_datagram(self, raw_message, remote_addr):
+        self.__listener_handler.handle_datagram(raw_message, remote_addr)
+
+    def __set_swarm_status(self, swarm_status):
+        if self.net_pool.swarm_status == swarm_status:
+            return
+        self.net_pool.swarm_status = SwarmStatus(swarm_status)
+        handler = self.handler()
+        if hasattr(handler, 'init'):
+            handler.init()
+
+    async def __report_client_connections(self):
+        while True:
+            WorkerChannel().send('client_connections', len(self.net_pool.get_all_client_connections()))
+            await asyncio.sleep(settings.peer_ping_time_seconds)
+
     def __extend_protocol(self, base_protocol, client_protocol):
-        return update_obj(base_protocol, client_protocol)
+        extended_protocol = update_obj(update_obj(update_obj(base_protocol, RELAY_PROTOCOL), KEEPALIVE_PROTOCOL), client_protocol)
+        Codecs().compile(extended_protocol)
+        Admission().compile(extended_protocol)
+        return extended_protocol
 
     def __extend_handler(self, user_handler):
         class ExtendHandler(user_handler, ClientHandler):
@@ -40,51 +129,82 @@ class Client(Host):
         return ExtendHandler
 
     async def __serve_swarm(self):
-        while not self.default_listener.is_closing():
-            if self.net_pool.has_enough_client_connections():
-                await asyncio.sleep(settings.peer_ping_time_seconds)
-                continue
-            if self.__has_server_connection():
-                await asyncio.sleep(settings.peer_ping_time_seconds)
-                continue
-            self.__find_new_connections()
-
-    def __has_server_connection(self):
-        return len(self.net_pool.get_server_connections()) > 0
-
-    def __find_new_connections(self):
-        if self.net_pool.has_client_connection():
-            self.__connect_via_client()
-        else:
-            self.__connect_via_server()
+        swarm_maintainer = SwarmMaintainer(
+            net_pool=self.net_pool,
+            connect_via_client=self.__connect_via_client,
+            connect_via_server=self.__connect_via_server)
+        await swarm_maintainer.serve(self.default_listener)
 
-    def __connect_via_client(self):
-        connection = self.net_pool.get_random_client_connection()
-        self.handler().do_neighbour_client_request(connection)
+    async def __connect_via_client(self, connection):
+        # the attempt stays in flight until the neighbours come back in
+        # hpn_servers_request or the peer timeout passes
+        remote_addr = connection.get_remote_addr()
+        neighbours = NeighboursWaiters().add(remote_addr)
+        try:
+            self.handler().do_neighbour_client_request(connection)
+            return await asyncio.wait_for(neighbours, settings.peer_timeout_seconds)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            NeighboursWaiters().remove(remote_addr, neighbours)
 
-    def __connect_via_server(self):
-        server_data = Peers().get_random_server_from_file()
-        if server_data:
-            self.__do_neighbour_client_request_to_server(server_data)
-            return
-        raise Exception('Error: no server data in peers.json file')
+    async def __connect_via_server(self, backoff):
+        await Peers().wait_bootstrap_ready()
+        if Peers().get_random_server_from_file() is None:
+            raise Exception('Error: no server data in peers.json file')
+        servers_data = Peers().get_bootstrap_servers(
+            settings.bootstrap_servers_count,
+            accept=lambda server_data: backoff.is_ready(self.__get_server_addr(server_data)))
+        if not servers_data:
+            return False
+        requests = [asyncio.ensure_future(self.__do_neighbour_client_request_to_server(server_data, backoff)) for server_data in servers_data]
+        try:
+            for request in asyncio.as_completed(requests):
+                if await request:
+                    return True
+            return False
+        finally:
+            for request in requests:
+                request.cancel()
 
-    def __do_neighbour_client_request_to_server(self, server_data):
+    async def __do_neighbour_client_request_to_server(self, server_data, backoff):
         server_protocol = server_data['protocol']
-        if server_protocol == 'udp':
-            self.__udp_neighbour_client_request_to_server(server_data)
-        else:
+        if server_protocol != 'udp':
             raise Exception('Error: {} protocol handler not implemented yet'.format(server_protocol))
+        delivered = await self.__udp_neighbour_client_request_to_server(server_data)
+        if delivered:
+            backoff.succeeded(self.__get_server_addr(server_data))
+        else:
+            backoff.failed(self.__get_server_addr(server_data))
+        return delivered
 
-    def __udp_neighbour_client_request_to_server(self, server_data):
+    async def __udp_neighbour_client_request_to_server(self, server_data):
         server_connection = self.__make_server_connection(server_data)
+        known_connection = self.__is_known_connection(server_connection)
         request = Datagram(connection=server_connection)
         request.set_package_protocol({'response': 'hpn_neighbours_client_request'})
-        Stream().run_stream(target=self.handler().hpn_neighbours_client_request, request=request)
+        try:
+            delivered = await self.handler().hpn_neighbours_client_request(request)
+        except asyncio.CancelledError:
+            if not known_connection:
+                self.net_pool.disconnect(server_connection)
+            raise
+        Peers().update_peer_score(server_connection, ConnectionType.server)
+        return delivered
+
+    def __get_server_addr(self, server_data):
+        return server_data['host'], server_data['port']
+
+    def __is_known_connection(self, connection):
+        return self.net_pool.get_connection(connection) is connection or self.net_pool.is_pending_connection(connection)
 
     def __make_server_connection(self, server_data):
         server_connection = self.net_pool.create_connection((server_data['host'], server_data['port']), self.default_listener)
-        server_connection.set_pub_key(server_data['pub_key'])
+        if self.__is_known_connection(server_connection):
+            # a pooled connection is indexed by its key and type, it is not set up again
+            return server_connection
+        server_connection.score = PeerScore.from_peer(server_data)
+        server_connection.set_pub_key(Peers().get_pub_key(server_data))
         server_connection.set_encrypt_marker(settings.request_encrypted_protocol)
-        server_connection.type = server_data['type']
+        server_connection.type = ConnectionType(server_data['type'])
         return server_connection
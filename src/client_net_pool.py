@@ -6,51 +6,227 @@ __license__ = 'MIT License'
 __version__ = [0, 0]
 
 
+import heapq
 import random
 from net_pool import NetPool
+from client_connection import ClientConnection, ConnectionType
+from peer_score import choose_weighted
+from workers import WorkerChannel
+from keepalive import Keepalive
+from fingerprint_cache import FingerprintCache
+from state_writer import single_writer
 from settings import logger
 import settings
 
 
+class ConnectionGroup:
+    def __init__(self):
+        self.connections = []
+        self.__positions = {}
+
+    def __len__(self):
+        return len(self.connections)
+
+    def add(self, connection):
+        remote_addr = connection.get_remote_addr()
+        if remote_addr in self.__positions:
+            return
+        self.__positions[remote_addr] = len(self.connections)
+        self.connections.append(connection)
+
+    def remove(self, connection):
+        position = self.__positions.pop(connection.get_remote_addr(), None)
+        if position is None:
+            return
+        last_connection = self.connections.pop()
+        if position < len(self.connections):
+            self.connections[position] = last_connection
+            self.__positions[last_connection.get_remote_addr()] = position
+
+    def get_random(self):
+        return random.choice(self.connections) if self.connections else None
+
+    def get_weighted_random(self):
+        return choose_weighted(self.connections, lambda connection: connection.score)
+
+
 class ClientNetPool(NetPool):
+    def __init__(self):
+        super(ClientNetPool, self).__init__()
+        self.__all_connections = ConnectionGroup()
+        self.__connections_by_addr = {}
+        self.__connections_by_fingerprint = {}
+        self.__pending_by_addr = {}
+        self.__pending_by_fingerprint = {}
+        self.__groups_by_type = {}
+        self.connections_list = self.__all_connections.connections
+
     def has_enough_client_connections(self):
-        return len(self.get_all_client_connections()) >= settings.peer_connections
+        client_connections_length = len(self.__get_group(ConnectionType.client)) + WorkerChannel().other_client_connections
+        return client_connections_length >= settings.peer_connections
+
+    def create_connection(self, remote_addr, transport):
+        connection = self.__connections_by_addr.get(remote_addr) or self.__pending_by_addr.get(remote_addr)
+        if connection is not None:
+            return connection
+        return ClientConnection(remote_addr=remote_addr, transport=transport)
 
     def get_connection(self, connection):
-        return self.__group[self.__group.index(connection)]
+        return self.__connections_by_addr.get(connection.get_remote_addr())
+
+    def get_connection_by_addr(self, remote_addr):
+        return self.__connections_by_addr.get(remote_addr)
 
     def get_connection_by_fingerprint(self, fingerprint):
-        for connection in self.get_all_connections():
-            if connection.get_fingerprint() == fingerprint:
-                return connection
+        connection = self.__connections_by_fingerprint.get(fingerprint)
+        if connection is None:
+            connection = self.__pending_by_fingerprint.get(fingerprint)
+        return connection
+
+    def is_pending_connection(self, connection):
+        return self.__pending_by_addr.get(connection.get_remote_addr()) is connection
+
+    @single_writer
+    def add_pending_connection(self, connection):
+        # a connection waits here until its peer answers, it is found by
+        # the address and the fingerprint of the reply but it is not a
+        # neighbour yet, it does not count and it is not picked
+        remote_addr = connection.get_remote_addr()
+        if remote_addr in self.__connections_by_addr or remote_addr in self.__pending_by_addr:
+            return
+        self.__pending_by_addr[remote_addr] = connection
+        if connection.get_pub_key() is not None:
+            fingerprint = connection.get_fingerprint()
+            self.__pending_by_fingerprint[fingerprint] = connection
+            FingerprintCache().invalidate(fingerprint)
+        WorkerChannel().claim(remote_addr)
+
+    @single_writer
+    def confirm_connection(self, connection):
+        if self.is_pending_connection(connection):
+            self.add_connection(connection)
 
+    @single_writer
+    def add_connection(self, connection):
+        pool_connection = self.__connections_by_addr.get(connection.get_remote_addr())
+        if pool_connection is not None:
+            return
+        self.__remove_pending(connection)
+        self.__connections_by_addr[connection.get_remote_addr()] = connection
+        self.__all_connections.add(connection)
+        self.__index_fingerprint(connection)
+        self.__index_type(connection)
+        WorkerChannel().claim(connection.get_remote_addr())
+        Keepalive().track(connection)
+
+    @single_writer
+    def disconnect(self, connection):
+        if self.__remove_pending(connection):
+            WorkerChannel().release(connection.get_remote_addr())
+            return
+        pool_connection = self.__connections_by_addr.pop(connection.get_remote_addr(), None)
+        if pool_connection is None:
+            return
+        self.__all_connections.remove(pool_connection)
+        self.__unindex_fingerprint(pool_connection)
+        self.__unindex_type(pool_connection)
+        WorkerChannel().release(pool_connection.get_remote_addr())
+        Keepalive().forget(pool_connection.get_remote_addr())
+
+    @single_writer
+    def set_connection_type(self, connection, connection_type):
+        in_pool = self.get_connection(connection) is connection
+        if in_pool:
+            self.__unindex_type(connection)
+        connection.type = connection_type
+        if in_pool:
+            self.__index_type(connection)
+
+    @single_writer
     def copy_connection_property(self, src_connection, dst_connection):
         logger.info('src {}, dst {}'.format(src_connection, dst_connection))
+        in_pool = self.get_connection(dst_connection) is dst_connection
+        if in_pool:
+            self.__unindex_fingerprint(dst_connection)
         dst_connection.set_pub_key(src_connection.get_pub_key())
         dst_connection.set_encrypt_marker(src_connection.get_encrypt_marker())
-        dst_connection.type = src_connection.type
+        if in_pool:
+            self.__index_fingerprint(dst_connection)
+        self.set_connection_type(dst_connection, src_connection.type)
+
+    def clean_connections_list(self):
+        # Keepalive disconnects a connection when its timeout comes
+        return
 
-    def __put_connection_in_group(self, connection):
-        self.__group.append(connection)
+    def is_client_connection(self, connection):
+        pool_connection = self.get_connection(connection)
+        return pool_connection is not None and getattr(pool_connection, 'type', None) == ConnectionType.client
 
     def get_all_client_connections(self):
-        return self.__filter_connection_by_type('client')
+        return list(self.__get_group(ConnectionType.client).connections)
 
     def get_random_client_connection(self):
-        group = self.__filter_connection_by_type('client')
-        return random.choice(group) if group else None
+        return self.__get_group(ConnectionType.client).get_weighted_random()
+
+    def get_best_client_connections(self, count):
+        return heapq.nlargest(
+            count, self.__get_group(ConnectionType.client).connections,
+            key=lambda connection: connection.score.get_weight())
+
+    def get_connection_score(self, connection):
+        pool_connection = self.get_connection(connection)
+        if pool_connection is None:
+            return None
+        return pool_connection.score
+
+    def get_scores(self):
+        return {
+            '{}:{}'.format(*connection.get_remote_addr()): dict(
+                connection.score.pack(), type=getattr(connection, 'type', None), weight=connection.score.get_weight())
+            for connection in self.connections_list}
 
     def get_server_connections(self):
-        return self.__filter_connection_by_type('server')
+        return list(self.__get_group(ConnectionType.server).connections)
 
     def has_client_connection(self):
-        group = self.__filter_connection_by_type('client')
-        return len(group) > 0
-
-    def __filter_connection_by_type(self, my_type):
-        self.clean_connections_list()
-        group = []
-        for connection in self.connections_list:
-            if hasattr(connection, 'type') and connection.type == my_type:
-                group.append(connection)
-        return group
+        return len(self.__get_group(ConnectionType.client)) > 0
+
+    def __get_group(self, connection_type):
+        return self.__groups_by_type.get(connection_type) or ConnectionGroup()
+
+    def __remove_pending(self, connection):
+        if not self.is_pending_connection(connection):
+            return False
+        del self.__pending_by_addr[connection.get_remote_addr()]
+        if connection.get_pub_key() is not None:
+            fingerprint = connection.get_fingerprint()
+            if self.__pending_by_fingerprint.get(fingerprint) is connection:
+                del self.__pending_by_fingerprint[fingerprint]
+                FingerprintCache().invalidate(fingerprint)
+        return True
+
+    def __index_fingerprint(self, connection):
+        if connection.get_pub_key() is None:
+            return
+        fingerprint = connection.get_fingerprint()
+        self.__connections_by_fingerprint[fingerprint] = connection
+        FingerprintCache().invalidate(fingerprint)
+
+    def __unindex_fingerprint(self, connection):
+        if connection.get_pub_key() is None:
+            return
+        fingerprint = connection.get_fingerprint()
+        if self.__connections_by_fingerprint.get(fingerprint) is connection:
+            del self.__connections_by_fingerprint[fingerprint]
+            FingerprintCache().invalidate(fingerprint)
+
+    def __index_type(self, connection):
+        connection_type = getattr(connection, 'type', None)
+        if connection_type is None:
+            return
+        self.__groups_by_type.setdefault(connection_type, ConnectionGroup()).add(connection)
+
+    def __unindex_type(self, connection):
+        group = self.__groups_by_type.get(getattr(connection, 'type', None))
+        if group is not None:
+            group.remove(connection)
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+__author__ = 'Akinava'
+__author_email__ = 'akinava@gmail.com'
+__copyright__ = 'Copyright © 2019'
+__license__ = 'MIT License'
+__version__ = [0, 0]
+
+
+import time
+import asyncio
+
+
+def get_loop_time():
+    # deadlines follow the running loop, so a loop with a virtual clock
+    # moves them too; without a loop the monotonic clock is the one
+    # asyncio uses
+    try:
+        return asyncio.get_running_loop().time()
+    except RuntimeError:
+        return time.monotonic()
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+__author__ = 'Akinava'
+__author_email__ = 'akinava@gmail.com'
+__copyright__ = 'Copyright © 2019'
+__license__ = 'MIT License'
+__version__ = [0, 0]
+
+
+import socket
+import struct
+from utilit import Singleton
+from settings import logger
+
+
+INT_FORMATS = {1: 'B', 2: 'H', 4: 'I', 8: 'Q'}
+
+
+class CodecError(Exception):
+    pass
+
+
+class MarkersField:
+    def __init__(self, names, length, markers):
+        self.names = names
+        self.values_length = 1
+        self.format = self.__get_int_format(length)
+        bits_length = length * 8
+        self.masks = []
+        for name in names:
+            marker = markers[name]
+            shift = bits_length - marker['start_bit'] - marker['length']
+            self.masks.append((shift, (1 << marker['length']) - 1))
+
+    def __get_int_format(self, length):
+        if length not in INT_FORMATS:
+            raise CodecError('markers length {} is not supported'.format(length))
+        return INT_FORMATS[length]
+
+    def encode(self, values):
+        packed_value = 0
+        for (shift, mask), value in zip(self.masks, values):
+            packed_value |= (int(value) & mask) << shift
+        return packed_value,
+
+
+class ValueField:
+    def __init__(self, name, length, field_type):
+        self.names = (name,)
+        self.values_length = 1
+        if field_type == 'int':
+            if length not in INT_FORMATS:
+                raise CodecError('int length {} is not supported'.format(length))
+            self.format = INT_FORMATS[length]
+            self.encode = self.__encode_value
+        elif field_type == 'bool':
+            self.format = '?'
+            self.encode = self.__encode_value
+        elif field_type == 'str':
+            self.format = '{}s'.format(length)
+            self.encode = self.__encode_str
+        elif field_type == 'addr':
+            self.format = '4sH'
+            self.values_length = 2
+            self.encode = self.__encode_addr
+        elif field_type is None:
+            self.format = '{}s'.format(length)
+            self.encode = self.__encode_value
+        else:
+            raise CodecError('type {} is not supported'.format(field_type))
+
+    def __encode_value(self, values):
+        return values
+
+    def __encode_str(self, values):
+        value, = values
+        return value.encode(),
+
+    def __encode_addr(self, values):
+        (host, port), = values
+        return socket.inet_aton(host), port
+
+
+class Codec:
+    def __init__(self, name, structure, markers):
+        self.name = name
+        self.fields = [self.__compile_field(part, markers) for part in structure]
+        self.struct = struct.Struct('>' + ''.join(field.format for field in self.fields))
+        self.buffer = bytearray(self.struct.size)
+        self.verified = False
+        self.__getters = {}
+
+    def __compile_field(self, part, markers):
+        if isinstance(part['length'], dict):
+            raise CodecError('{} has variable length'.format(part['name']))
+        if part.get('type') == 'markers':
+            return MarkersField(part['name'], part['length'], markers)
+        return ValueField(part['name'], part['length'], part.get('type'))
+
+    def get_values(self, handler, **kwargs):
+        values = []
+        for field_getters in self.__get_getters(handler):
+            values.append([getter(handler, **kwargs) for getter in field_getters])
+        return values
+
+    def __get_getters(self, handler):
+        handler_class = type(handler)
+        getters = self.__getters.get(handler_class)
+        if getters is None:
+            getters = [[getattr(handler_class, 'get_{}'.format(name)) for name in field.names] for field in self.fields]
+            self.__getters[handler_class] = getters
+        return getters
+
+    def pack(self, values):
+        self.pack_into(self.buffer, 0, values)
+        return bytes(self.buffer)
+
+    def pack_into(self, buffer, offset, values):
+        packed_values = []
+        for field, field_values in zip(self.fields, values):
+            packed_values.extend(field.encode(field_values))
+        self.struct.pack_into(buffer, offset, *packed_values)
+
+
+class Codecs(Singleton):
+    def __init__(self):
+        if hasattr(self, '_Codecs__codecs'):
+            return
+        self.__codecs = {}
+
+    def compile(self, protocol):
+        markers = {marker['name']: marker for marker in protocol.get('marker', [])}
+        structures = [(package['name'], package['structure']) for package in protocol.get('package', [])]
+        structures += [(name, part['structure']) for name, part in protocol.get('list', {}).items()]
+        for name, structure in structures:
+            try:
+                self.__codecs[name] = Codec(name, structure, markers)
+            except CodecError as e:
+                logger.debug('codec {} is not compiled: {}'.format(name, e))
+
+    def get_codec(self, name):
+        return self.__codecs.get(name)
+
+    def verify(self, codec, packed_message, message):
+        if packed_message == message:
+            codec.verified = True
+            return
+        logger.warning('codec {} does not match the protocol parser and is disabled'.format(codec.name))
+        self.__codecs.pop(codec.name, None)
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+__author__ = 'Akinava'
+__author_email__ = 'akinava@gmail.com'
+__copyright__ = 'Copyright © 2019'
+__license__ = 'MIT License'
+__version__ = [0, 0]
+
+
+import asyncio
+from utilit import Singleton
+from timer_wheel import TimerWheel
+from metrics import Metrics
+import settings
+
+
+class DeliveryBatch:
+    def __init__(self, deliveries, loop):
+        self.deliveries = deliveries
+        self.futures = [loop.create_future() for _ in deliveries]
+        self.retransmit_timer = None
+
+    def get_pending_deliveries(self):
+        for delivery, future in zip(self.deliveries, self.futures):
+            if not future.done():
+                yield delivery
+
+
+class Delivery(Singleton):
+    def __init__(self):
+        if hasattr(self, 'wheel'):
+            return
+        self.wheel = TimerWheel()
+        self.__waiters = {}
+        self.__rtt = Metrics().histogram('delivery_rtt_seconds')
+        self.__delivered = Metrics().counter('delivery_delivered')
+        self.__lost = Metrics().counter('delivery_lost')
+
+    async def deliver(self, connection, send, timeout=None):
+        delivered, = await self.deliver_batch([(connection, send)], timeout)
+        return delivered
+
+    async def deliver_batch(self, deliveries, timeout=None):
+        loop = asyncio.get_running_loop()
+        batch = DeliveryBatch(deliveries, loop)
+        start_time = loop.time()
+        for (connection, _), future in zip(batch.deliveries, batch.futures):
+            if connection.message_was_never_received():
+                self.__waiters.setdefault(connection.get_remote_addr(), {})[future] = connection, start_time
+            else:
+                future.set_result(True)
+                connection.score.succeeded()
+        if timeout is None:
+            timeout = settings.peer_timeout_seconds
+        timeout_timer = self.wheel.schedule(timeout, self.__expire, batch)
+        self.__retransmit(batch)
+        try:
+            return list(await asyncio.gather(*batch.futures))
+        finally:
+            timeout_timer.cancel()
+            if batch.retransmit_timer is not None:
+                batch.retransmit_timer.cancel()
+            for (connection, _), future in zip(batch.deliveries, batch.futures):
+                self.__remove_waiter(connection.get_remote_addr(), future)
+
+    def received(self, remote_addr):
+        waiters = self.__waiters.get(remote_addr)
+        if waiters is None:
+            return
+        now = asyncio.get_event_loop().time()
+        for future, (connection, start_time) in list(waiters.items()):
+            if connection.message_was_never_received():
+                # the datagram did not pass the verification of the handler
+                continue
+            del waiters[future]
+            if not future.done():
+                future.set_result(True)
+                self.__delivered.inc()
+                self.__rtt.observe(now - start_time)
+                connection.score.succeeded(now - start_time)
+        if not waiters:
+            del self.__waiters[remote_addr]
+
+    def __retransmit(self, batch):
+        batch.retransmit_timer = None
+        pending = False
+        for connection, send in batch.get_pending_deliveries():
+            pending = True
+            if connection.last_sent_message_is_over_ping_time():
+                send()
+        if pending:
+            batch.retransmit_timer = self.wheel.schedule(settings.peer_ping_time_seconds, self.__retransmit, batch)
+
+    def __expire(self, batch):
+        for (connection, _), future in zip(batch.deliveries, batch.futures):
+            if not future.done():
+                future.set_result(False)
+                self.__lost.inc()
+                connection.score.failed()
+
+    def __remove_waiter(self, remote_addr, future):
+        waiters = self.__waiters.get(remote_addr)
+        if waiters is None:
+            return
+        waiters.pop(future, None)
+        if not waiters:
+            del self.__waiters[remote_addr]
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+__author__ = 'Akinava'
+__author_email__ = 'akinava@gmail.com'
+__copyright__ = 'Copyright © 2019'
+__license__ = 'MIT License'
+__version__ = [0, 0]
+
+
+from collections import OrderedDict
+from utilit import Singleton
+from metrics import Metrics
+from clock import get_loop_time
+import settings
+
+
+class KeyMaterial:
+    __slots__ = ('connection', 'pub_key', 'encrypt_marker')
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.pub_key = connection.get_pub_key()
+        self.encrypt_marker = connection.get_encrypt_marker()
+
+
+class FingerprintCache(Singleton):
+    # unknown fingerprints live in their own LRU, a flood of junk
+    # fingerprints can not push the known peers out
+    def __init__(self):
+        if hasattr(self, '_FingerprintCache__known'):
+            return
+        self.__known = OrderedDict()
+        self.__unknown = OrderedDict()
+        self.__hits = Metrics().counter('fingerprint_cache', result='hit')
+        self.__unknown_hits = Metrics().counter('fingerprint_cache', result='unknown_hit')
+        self.__misses = Metrics().counter('fingerprint_cache', result='miss')
+
+    def get(self, fingerprint):
+        key_material = self.__known.get(fingerprint)
+        if key_material is not None:
+            self.__known.move_to_end(fingerprint)
+            self.__hits.inc()
+            return key_material, True
+        expiry_time = self.__unknown.get(fingerprint)
+        if expiry_time is not None:
+            if expiry_time > get_loop_time():
+                self.__unknown_hits.inc()
+                return None, True
+            del self.__unknown[fingerprint]
+        self.__misses.inc()
+        return None, False
+
+    def put(self, fingerprint, connection):
+        self.__unknown.pop(fingerprint, None)
+        key_material = KeyMaterial(connection)
+        self.__known[fingerprint] = key_material
+        self.__known.move_to_end(fingerprint)
+        if len(self.__known) > settings.fingerprint_cache_size:
+            self.__known.popitem(last=False)
+        return key_material
+
+    def put_unknown(self, fingerprint):
+        self.__unknown[fingerprint] = get_loop_time() + settings.fingerprint_unknown_ttl_seconds
+        self.__unknown.move_to_end(fingerprint)
+        if len(self.__unknown) > settings.fingerprint_unknown_cache_size:
+            self.__unknown.popitem(last=False)
+
+    def invalidate(self, fingerprint):
+        self.__known.pop(fingerprint, None)
+        self.__unknown.pop(fingerprint, None)
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+__author__ = 'Akinava'
+__author_email__ = 'akinava@gmail.com'
+__copyright__ = 'Copyright © 2019'
+__license__ = 'MIT License'
+__version__ = [0, 0]
+
+
+import random
+import asyncio
+from crypt_tools import Tools as CryptTools
+from utilit import Singleton
+from timer_wheel import TimerWheel
+import settings
+
+
+KEEPALIVE_PROTOCOL = {
+    'package': [
+        {
+            'name': 'hpn_ping',
+            'package_id_marker': 0x64,
+            'define': [
+                'verify_package_length',
+                'verify_package_id_marker',
+                'verify_receiver_fingerprint',
+            ],
+            'response': 'hpn_pong',
+            'structure': [
+                {'name': 'package_id_marker', 'length': 1, 'type': 'int'},
+                {'name': 'receiver_fingerprint', 'length': CryptTools.fingerprint_length}]
+        },
+        {
+            'name': 'hpn_pong',
+            'package_id_marker': 0x65,
+            'define': [
+                'verify_package_length',
+                'verify_package_id_marker',
+                'verify_receiver_fingerprint',
+            ],
+            'response': 'handle_pong',
+            'structure': [
+                {'name': 'package_id_marker', 'length': 1, 'type': 'int'},
+                {'name': 'receiver_fingerprint', 'length': CryptTools.fingerprint_length}]
+        },
+    ],
+}
+
+
+class KeepaliveState:
+    __slots__ = ('connection', 'last_received', 'last_sent', 'timer')
+
+    def __init__(self, connection, now):
+        self.connection = connection
+        self.last_received = now
+        self.last_sent = now
+        self.timer = None
+
+
+class Keepalive(Singleton):
+    # received and sent datagrams only move the timestamps, the timer
+    # of the connection compares them with its deadline when it fires
+    def __init__(self):
+        if hasattr(self, 'wheel'):
+            return
+        self.wheel = TimerWheel()
+        self.__states = {}
+        self.__send_ping = None
+        self.__disconnect = None
+
+    def is_active(self):
+        return self.__send_ping is not None
+
+    def start(self, send_ping, disconnect):
+        self.__send_ping = send_ping
+        self.__disconnect = disconnect
+
+    def track(self, connection):
+        if not self.is_active():
+            return
+        remote_addr = connection.get_remote_addr()
+        if remote_addr in self.__states:
+            return
+        state = KeepaliveState(connection, self.__get_time())
+        self.__states[remote_addr] = state
+        self.__schedule(state, state.last_received)
+
+    def forget(self, remote_addr):
+        state = self.__states.pop(remote_addr, None)
+        if state is not None and state.timer is not None:
+            state.timer.cancel()
+
+    def received(self, remote_addr):
+        state = self.__states.get(remote_addr)
+        if state is not None:
+            state.last_received = self.__get_time()
+
+    def sent(self, remote_addr):
+        state = self.__states.get(remote_addr)
+        if state is not None:
+            state.last_sent = self.__get_time()
+
+    def __get_time(self):
+        return asyncio.get_event_loop().time()
+
+    def __get_ping_interval(self):
+        return settings.peer_ping_time_seconds * random.uniform(1 - settings.peer_ping_jitter, 1)
+
+    def __schedule(self, state, now):
+        ping_time = max(state.last_received, state.last_sent) + self.__get_ping_interval()
+        timeout_time = state.last_received + settings.peer_timeout_seconds
+        state.timer = self.wheel.schedule(min(ping_time, timeout_time) - now, self.__fire, state)
+
+    def __fire(self, state):
+        remote_addr = state.connection.get_remote_addr()
+        if self.__states.get(remote_addr) is not state:
+            return
+        now = self.__get_time()
+        if now - state.last_received >= settings.peer_timeout_seconds:
+            self.forget(remote_addr)
+            self.__disconnect(state.connection)
+            return
+        if now - max(state.last_received, state.last_sent) >= settings.peer_ping_time_seconds * (1 - settings.peer_ping_jitter):
+            self.__send_ping(state.connection)
+            state.last_sent = now
+        self.__schedule(state, now)
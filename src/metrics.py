@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+__author__ = 'Akinava'
+__author_email__ = 'akinava@gmail.com'
+__copyright__ = 'Copyright © 2019'
+__license__ = 'MIT License'
+__version__ = [0, 0]
+
+
+import os
+import json
+import time
+import bisect
+import asyncio
+from utilit import Singleton
+from blocking_executor import BlockingExecutor
+from settings import logger
+
+
+SECONDS_BOUNDS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+LAG_PROBE_SECONDS = 0.1
+STATS_REQUEST = b'stats'
+
+
+class Counter:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, value=1):
+        self.value += value
+
+    def get_value(self):
+        return self.value
+
+
+class Gauge:
+    __slots__ = ('value', 'callback')
+
+    def __init__(self, callback=None):
+        self.value = None
+        self.callback = callback
+
+    def set(self, value):
+        self.value = value
+
+    def get_value(self):
+        if self.callback is not None:
+            return self.callback()
+        return self.value
+
+
+class Histogram:
+    __slots__ = ('bounds', 'buckets', 'count', 'sum')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def get_value(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'buckets': dict(zip([str(bound) for bound in self.bounds] + ['inf'], self.buckets))}
+
+
+class Metrics(Singleton):
+    # metric objects are created once per name and labels, the hot path
+    # keeps the returned object and only touches its preallocated fields
+    def __init__(self):
+        if hasattr(self, 'start_time'):
+            return
+        self.start_time = time.time()
+        self.__metrics = {}
+
+    def counter(self, name, **labels):
+        return self.__get_metric(Counter, name, labels)
+
+    def gauge(self, name, callback=None, **labels):
+        gauge = self.__get_metric(Gauge, name, labels)
+        if callback is not None:
+            gauge.callback = callback
+        return gauge
+
+    def histogram(self, name, bounds=SECONDS_BOUNDS, **labels):
+        key = self.__get_key(name, labels)
+        metric = self.__metrics.get(key)
+        if metric is None:
+            metric = Histogram(bounds)
+            self.__metrics[key] = metric
+        return metric
+
+    def __get_metric(self, metric_class, name, labels):
+        key = self.__get_key(name, labels)
+        metric = self.__metrics.get(key)
+        if metric is None:
+            metric = metric_class()
+            self.__metrics[key] = metric
+        return metric
+
+    def __get_key(self, name, labels):
+        if not labels:
+            return name
+        return name, tuple(sorted(labels.items()))
+
+    def __format_key(self, key):
+        if isinstance(key, str):
+            return key
+        name, labels = key
+        return '{}{{{}}}'.format(name, ','.join('{}={}'.format(label, value) for label, value in labels))
+
+    def get_snapshot(self):
+        snapshot = {'uptime_seconds': time.time() - self.start_time}
+        for key, metric in list(self.__metrics.items()):
+            snapshot[self.__format_key(key)] = metric.get_value()
+        return snapshot
+
+
+class StatsProtocol(asyncio.DatagramProtocol):
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, raw_message, remote_addr):
+        if raw_message.strip() != STATS_REQUEST:
+            return
+        self.transport.sendto(json.dumps(Metrics().get_snapshot()).encode(), remote_addr)
+
+
+class MetricsReporter:
+    def __init__(self, metrics_file, metrics_port, dump_seconds):
+        self.metrics_file = metrics_file
+        self.metrics_port = metrics_port
+        self.dump_seconds = dump_seconds
+        self.__loop_lag = Metrics().histogram('loop_lag_seconds')
+
+    async def serve(self):
+        loop = asyncio.get_running_loop()
+        stats_listener = None
+        if self.metrics_port:
+            stats_listener, _ = await loop.create_datagram_endpoint(
+                StatsProtocol, local_addr=('127.0.0.1', self.metrics_port))
+        next_dump_time = loop.time() + self.dump_seconds
+        try:
+            while True:
+                probe_time = loop.time()
+                await asyncio.sleep(LAG_PROBE_SECONDS)
+                self.__loop_lag.observe(max(0, loop.time() - probe_time - LAG_PROBE_SECONDS))
+                if self.metrics_file and loop.time() >= next_dump_time:
+                    next_dump_time = loop.time() + self.dump_seconds
+                    await BlockingExecutor().run(self.__dump, Metrics().get_snapshot())
+        finally:
+            if stats_listener is not None:
+                stats_listener.close()
+
+    def __dump(self, snapshot):
+        tmp_file = self.metrics_file + '.tmp'
+        try:
+            with open(tmp_file, 'w') as f:
+                json.dump(snapshot, f, indent=2, sort_keys=True)
+            os.replace(tmp_file, self.metrics_file)
+        except OSError as e:
+            logger.warning('metrics dump to {} failed: {}'.format(self.metrics_file, e))
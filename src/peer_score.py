@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+__author__ = 'Akinava'
+__author_email__ = 'akinava@gmail.com'
+__copyright__ = 'Copyright © 2019'
+__license__ = 'MIT License'
+__version__ = [0, 0]
+
+
+import random
+import settings
+
+
+SELECTION_SAMPLE_LENGTH = 16
+RTT_MIN_SECONDS = 0.001
+SCORE_FIELDS = ('rtt', 'loss', 'successes', 'failures')
+
+
+class PeerScore:
+    __slots__ = SCORE_FIELDS
+
+    def __init__(self, rtt=None, loss=0.0, successes=0, failures=0):
+        self.rtt = rtt
+        self.loss = loss
+        self.successes = successes
+        self.failures = failures
+
+    @classmethod
+    def from_peer(cls, peer):
+        if peer is None:
+            return cls()
+        return cls(
+            rtt=peer.get('rtt'),
+            loss=peer.get('loss', 0.0),
+            successes=peer.get('successes', 0),
+            failures=peer.get('failures', 0))
+
+    def update_peer(self, peer):
+        for field in SCORE_FIELDS:
+            value = getattr(self, field)
+            if value is not None:
+                peer[field] = value
+
+    def pack(self):
+        return {field: getattr(self, field) for field in SCORE_FIELDS}
+
+    def succeeded(self, rtt=None):
+        alpha = settings.peer_score_alpha
+        if rtt is not None:
+            self.rtt = rtt if self.rtt is None else self.rtt + alpha * (rtt - self.rtt)
+        self.loss -= alpha * self.loss
+        self.successes += 1
+
+    def failed(self):
+        self.loss += settings.peer_score_alpha * (1 - self.loss)
+        self.failures += 1
+
+    def get_weight(self):
+        # the smoothed success rate keeps peers without history selectable
+        success_rate = (self.successes + 1) / (self.successes + self.failures + 2)
+        rtt = settings.peer_score_default_rtt_seconds if self.rtt is None else self.rtt
+        return (1 - self.loss) * success_rate / max(rtt, RTT_MIN_SECONDS)
+
+
+def choose_weighted(candidates, get_score):
+    # weights of a small random sample keep the choice O(1) for big lists
+    if not candidates:
+        return None
+    if len(candidates) > SELECTION_SAMPLE_LENGTH:
+        candidates = random.sample(candidates, SELECTION_SAMPLE_LENGTH)
+    weights = [get_score(candidate).get_weight() for candidate in candidates]
+    if sum(weights) <= 0:
+        return random.choice(candidates)
+    return random.choices(candidates, weights)[0]
@@ -7,30 +7,82 @@ __version__ = [0, 0]
 
 
 import json
+import time
+import asyncio
+import heapq
+import bisect
 import random
 from datetime import timedelta, datetime
 from cryptotool import B58
-from utilit import Singleton, now
+from utilit import Singleton
+from peers_storage import PeersStorage
+from peer_score import PeerScore, choose_weighted, SELECTION_SAMPLE_LENGTH
+from state_writer import single_writer
+from client_connection import PubKeys
+from workers import WorkerChannel
 import settings
 from settings import logger
 
 
+LOAD_CHUNK_LENGTH = 5000
+EARLY_SERVERS_LENGTH = 64
+ISO_DATA_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S')
+
+
 class Peers(Singleton):
     def __init__(self):
-        self.__load()
+        if hasattr(self, '_Peers__peers'):
+            return
+        self.servers_version = 0
+        self.loaded = False
+        self.__storage = PeersStorage(settings.peers_file)
+        self.__peers = {}
+        self.__peers_by_type = {}
+        self.__freshness_by_type = {}
+        self.__strategies = {}
+        self.__early_servers = []
+        self.__changed_keys = set()
+        self.__loading = False
+        self.__bootstrap_ready = None
+        self.__loader = self.__load()
+
+    def load_async(self):
+        if self.loaded or self.__loading:
+            return None
+        self.__loading = True
+        self.__bootstrap_ready = asyncio.Event()
+        return asyncio.ensure_future(self.__load_chunks())
+
+    async def __load_chunks(self):
+        try:
+            for _ in self.__loader:
+                await asyncio.sleep(0)
+        finally:
+            self.__loading = False
+
+    async def wait_bootstrap_ready(self):
+        if self.__loading and not self.__early_servers:
+            await self.__bootstrap_ready.wait()
 
+    @single_writer
     def update_peer_last_response_field(self, connection):
+        self.__ensure_loaded()
         server = self.__copy_connection_property(connection)
         server['protocol'] = 'udp'
         server['type'] = 'server'
         peer = self.__find_peer(server)
+        if peer is None:
+            peer = self.__add_peer(server)
+        connection.score.update_peer(peer)
         self.__update_peer_last_response(peer)
-        self.__save()
+        self.__save(peer)
 
+    @single_writer
     def add_client_peer(self, connection):
         host, port = connection.get_remote_addr()
         if port >= settings.host_max_user_port:
             return
+        self.__ensure_loaded()
         client = self.__copy_connection_property(connection)
         client['type'] = 'client'
         pool_client = self.__find_peer(client)
@@ -39,18 +91,65 @@ class Peers(Singleton):
             client = pool_client
         else:
             logger.info('add client {host}:{port} in peers'.format_map(client))
-            self.__peers.append(client)
+            client = self.__add_peer(client)
+        connection.score.update_peer(client)
         self.__update_peer_last_response(client)
-        self.__save()
+        self.__save(client)
 
+    def get_peer_score(self, connection, peer_type):
+        self.__ensure_loaded()
+        peer = self.__copy_connection_property(connection)
+        peer['type'] = peer_type
+        return PeerScore.from_peer(self.__find_peer(peer))
+
+    @single_writer
+    def update_peer_score(self, connection, peer_type):
+        self.__ensure_loaded()
+        peer = self.__copy_connection_property(connection)
+        peer['type'] = peer_type
+        peer = self.__find_peer(peer)
+        if peer is None:
+            return
+        connection.score.update_peer(peer)
+        self.__save(peer)
+
+    def get_delivery_strategy(self, connection):
+        self.__ensure_loaded()
+        return self.__strategies.get(self.__pack_pub_key(connection.get_pub_key()))
+
+    def get_pub_key(self, peer):
+        # a peer keeps its pub key B58 packed, as in the peers file
+        return self.__unpack_pub_key(peer.get('pub_key'))
+
+    @single_writer
+    def set_delivery_strategy(self, connection, strategy):
+        # kept by pub key, a client behind NAT comes back on another port
+        self.__ensure_loaded()
+        packed_pub_key = self.__pack_pub_key(connection.get_pub_key())
+        if packed_pub_key is None or self.__strategies.get(packed_pub_key) == strategy:
+            return
+        self.__strategies[packed_pub_key] = strategy
+        client = self.__copy_connection_property(connection)
+        client['type'] = 'client'
+        peer = self.__find_peer(client)
+        if peer is None:
+            if client['port'] >= settings.host_max_user_port:
+                # a port out of the user range is not kept, as in add_client_peer
+                return
+            peer = self.__add_peer(client)
+        peer['delivery_strategy'] = strategy
+        self.__save(peer)
+
+    @single_writer
     def save_servers_list(self, servers_list):
+        self.__ensure_loaded()
         for server_src in servers_list:
             host, port = server_src['hpn_servers_addr']
             server_dst = {
                 'type': 'server',
                 'host': host,
                 'port': port,
-                'pub_key': server_src['hpn_servers_pub_key'],
+                'pub_key': self.__pack_pub_key(server_src['hpn_servers_pub_key']),
                 'protocol': server_src['hpn_servers_protocol'],
             }
 
@@ -58,14 +157,28 @@ class Peers(Singleton):
                 logger.info('server {host}:{port} already in peers list'.format_map(server_dst))
                 continue
             logger.info('server {host}:{port} added in peers list'.format_map(server_dst))
-            self.__peers.append(server_dst)
-        self.__save()
+            self.__save(self.__add_peer(server_dst))
+
+    @single_writer
+    def import_peers_file(self, peers_file):
+        self.__ensure_loaded()
+        with open(peers_file, 'r') as f:
+            packed_peers = json.loads(f.read())
+        for packed_peer in packed_peers:
+            peer = self.__unpack_peer_property(packed_peer)
+            if self.__has_peer_in_list(peer):
+                continue
+            logger.info('import {type} {host}:{port} in peers list'.format_map(peer))
+            self.__save(self.__add_peer(peer))
 
     def __update_peer_last_response(self, peer):
-        peer['last_response'] = now()
+        self.__unindex_freshness(peer)
+        peer['last_response'] = time.time()
+        self.__index_freshness(peer)
+        self.__update_servers_version(peer)
 
     def __copy_connection_property(self, connection):
-        peer = {'pub_key': connection.get_pub_key()}
+        peer = {'pub_key': self.__pack_pub_key(connection.get_pub_key())}
         peer['host'], peer['port'] = connection.get_remote_addr()
         return peer
 
@@ -74,75 +187,184 @@ class Peers(Singleton):
         return False if peer is None else True
 
     def get_random_server_from_file(self):
-        servers = self.__filter_peers_by_type('server')
+        self.__ensure_loaded()
+        servers = self.__peers_by_type.get('server', [])
         if len(servers) == 0:
             return None
-        filtered_servers = self.__filter_peers_by_last_response_field(servers=servers, days_delta=settings.servers_timeout_days)
-        if len(filtered_servers) > 0:
-            return random.choice(filtered_servers)
-        return random.choice(servers)
+        if not self.loaded:
+            fresh_servers = self.__get_early_fresh_servers()
+            return choose_weighted(fresh_servers or servers, PeerScore.from_peer)
+        fresh_servers = self.__freshness_by_type.get('server', [])
+        fresh_start = self.__get_fresh_start(fresh_servers, days_delta=settings.servers_timeout_days)
+        if fresh_start < len(fresh_servers):
+            indexes = random.sample(
+                range(fresh_start, len(fresh_servers)), min(SELECTION_SAMPLE_LENGTH, len(fresh_servers) - fresh_start))
+            candidates = [self.__peers[fresh_servers[index][1]] for index in indexes]
+            return choose_weighted(candidates, PeerScore.from_peer)
+        return choose_weighted(servers, PeerScore.from_peer)
+
+    def get_bootstrap_servers(self, count, accept=None):
+        self.__ensure_loaded()
+        servers = self.__get_fresh_servers()
+        if len(servers) == 0:
+            servers = self.__peers_by_type.get('server', [])
+            if accept is not None:
+                servers = list(filter(accept, servers))
+            return random.sample(servers, min(count, len(servers)))
+        if accept is not None:
+            servers = list(filter(accept, servers))
+        return heapq.nlargest(count, servers, key=self.__get_bootstrap_rank)
+
+    def __get_bootstrap_rank(self, server):
+        return PeerScore.from_peer(server).get_weight(), server['last_response']
 
     def __find_peer(self, peer_data):
-        for peer in self.__peers:
-            equal = True
-            for key in ['host', 'port', 'pub_key', 'type']:
-                if peer.get(key) != peer_data.get(key):
-                    equal = False
-                    break
-            if equal:
-                return peer
-        return None
-
-    def get_servers_list(self, max):
-        servers = self.__filter_peers_by_type('server')
-        if len(servers) > 0:
-            servers = self.__filter_peers_by_last_response_field(servers=servers, days_delta=settings.servers_timeout_days)
-        return servers[: max]
-
-    def __filter_peers_by_last_response_field(self, servers, days_delta):
-        filtered_list = []
-        for peer in servers:
-            datatime_string = peer.get('last_response')
-            if datatime_string is None:
-                continue
-            if datetime.strptime(datatime_string, settings.DATA_FORMAT) + timedelta(days=days_delta) < datetime.now():
-                continue
-            filtered_list.append(peer)
-        return filtered_list
+        return self.__peers.get(self.__get_peer_key(peer_data))
+
+    def get_servers_list(self, max_length):
+        self.__ensure_loaded()
+        servers = self.__get_fresh_servers(max_length)
+        return list(reversed(servers))
+
+    def get_servers_list_expiry_time(self, max_length):
+        self.__ensure_loaded()
+        if not self.loaded:
+            # the list grows while loading, it must not be cached
+            return time.time()
+        fresh_servers = self.__freshness_by_type.get('server', [])
+        fresh_start = self.__get_fresh_start(fresh_servers, days_delta=settings.servers_timeout_days)
+        fresh_start = max(fresh_start, len(fresh_servers) - max_length)
+        if fresh_start >= len(fresh_servers):
+            return float('inf')
+        last_response, _ = fresh_servers[fresh_start]
+        return last_response + timedelta(days=settings.servers_timeout_days).total_seconds()
+
+    def __update_servers_version(self, peer):
+        if peer['type'] == 'server':
+            self.servers_version += 1
+
+    def __get_fresh_servers(self, max_length=None):
+        if not self.loaded:
+            servers = sorted(self.__get_early_fresh_servers(), key=lambda server: server['last_response'])
+            return servers if max_length is None else servers[max(0, len(servers) - max_length):]
+        fresh_servers = self.__freshness_by_type.get('server', [])
+        fresh_start = self.__get_fresh_start(fresh_servers, days_delta=settings.servers_timeout_days)
+        if max_length is not None:
+            fresh_start = max(fresh_start, len(fresh_servers) - max_length)
+        return [self.__peers[peer_key] for _, peer_key in fresh_servers[fresh_start:]]
+
+    def __get_early_fresh_servers(self):
+        return [server for server in self.__early_servers if self.__is_fresh(server)]
+
+    def __is_fresh(self, peer):
+        last_response = peer.get('last_response')
+        if last_response is None:
+            return False
+        return last_response >= time.time() - timedelta(days=settings.servers_timeout_days).total_seconds()
+
+    def __get_fresh_start(self, freshness, days_delta):
+        return bisect.bisect_left(freshness, (time.time() - timedelta(days=days_delta).total_seconds(),))
+
+    def __get_peer_key(self, peer):
+        return peer.get('type'), peer.get('host'), peer.get('port'), peer.get('pub_key')
+
+    def __pack_pub_key(self, pub_key):
+        if pub_key is None:
+            return None
+        return PubKeys().get_packed(pub_key, B58().pack)
+
+    def __unpack_pub_key(self, packed_pub_key):
+        if packed_pub_key is None:
+            return None
+        return PubKeys().intern(B58().unpack(packed_pub_key))
+
+    def __add_peer(self, peer):
+        peer_key = self.__get_peer_key(peer)
+        self.__peers[peer_key] = peer
+        self.__peers_by_type.setdefault(peer['type'], []).append(peer)
+        self.__index_freshness(peer)
+        self.__update_servers_version(peer)
+        return peer
+
+    def __index_freshness(self, peer):
+        if not self.loaded or peer.get('last_response') is None:
+            return
+        freshness = self.__freshness_by_type.setdefault(peer['type'], [])
+        bisect.insort(freshness, (peer['last_response'], self.__get_peer_key(peer)))
+
+    def __unindex_freshness(self, peer):
+        if not self.loaded or peer.get('last_response') is None:
+            return
+        freshness = self.__freshness_by_type[peer['type']]
+        item = (peer['last_response'], self.__get_peer_key(peer))
+        index = bisect.bisect_left(freshness, item)
+        if index < len(freshness) and freshness[index] == item:
+            del freshness[index]
+
+    def __ensure_loaded(self):
+        if self.loaded or self.__loading:
+            return
+        for _ in self.__loader:
+            pass
 
     def __load(self):
-        self.__peers = self.__read_file()
-        self.__unpack_peers_property()
-
-    def __save(self):
-        packed_peers = self.__pack_peers_property()
-        self.__save_file(packed_peers)
-
-    def __read_file(self):
-        with open(settings.peers_file, 'r') as f:
-            peers_list = json.loads(f.read())
-        return peers_list
-
-    def __save_file(self, packed_peers):
-        with open(settings.peers_file, 'w') as f:
-            f.write(json.dumps(packed_peers, indent=4))
-
-    def __unpack_peers_property(self):
-        for peer in self.__peers:
-            peer['pub_key'] = B58().unpack(peer['pub_key'])
-
-    def __pack_peers_property(self):
-        packed_peers = []
-        for peer in self.__peers:
-            copied_peer = peer.copy()
-            copied_peer['pub_key'] = B58().pack(copied_peer['pub_key'])
-            packed_peers.append(copied_peer)
-        return packed_peers
-
-    def __filter_peers_by_type(self, peers_filter):
-        filtered_peers = []
-        for peer in self.__peers:
-            if peer['type'] != peers_filter:
-                continue
-            filtered_peers.append(peer)
-        return filtered_peers
+        for index, packed_peer in enumerate(self.__storage.iter_load(), 1):
+            self.__load_peer(self.__unpack_peer_property(packed_peer))
+            if index % LOAD_CHUNK_LENGTH == 0:
+                yield
+        self.loaded = True
+        self.__index_all_freshness()
+        self.__early_servers = []
+        self.__changed_keys = set()
+        self.servers_version += 1
+        if self.__bootstrap_ready is not None:
+            self.__bootstrap_ready.set()
+        logger.info('peers loaded, {} peers'.format(len(self.__peers)))
+
+    def __load_peer(self, peer):
+        peer_key = self.__get_peer_key(peer)
+        loaded_peer = self.__peers.get(peer_key)
+        if loaded_peer is None:
+            loaded_peer = self.__add_peer(peer)
+        elif peer_key not in self.__changed_keys:
+            # a later log record of the same peer
+            loaded_peer.clear()
+            loaded_peer.update(peer)
+        if loaded_peer.get('delivery_strategy') is not None:
+            self.__strategies[loaded_peer['pub_key']] = loaded_peer['delivery_strategy']
+        if peer['type'] != 'server' or len(self.__early_servers) >= EARLY_SERVERS_LENGTH:
+            return
+        if self.__is_fresh(loaded_peer):
+            self.__early_servers.append(loaded_peer)
+            if self.__bootstrap_ready is not None:
+                self.__bootstrap_ready.set()
+
+    def __index_all_freshness(self):
+        for peer_type, peers in self.__peers_by_type.items():
+            self.__freshness_by_type[peer_type] = sorted(
+                (peer['last_response'], self.__get_peer_key(peer)) for peer in peers if peer.get('last_response') is not None)
+
+    def __save(self, peer):
+        if not self.loaded:
+            self.__changed_keys.add(self.__get_peer_key(peer))
+        if WorkerChannel().is_active():
+            WorkerChannel().send('peer', self.__pack_peer_property(peer))
+            return
+        self.__storage.put(self.__pack_peer_property(peer))
+
+    def __unpack_peer_property(self, packed_peer):
+        peer = dict(packed_peer)
+        if peer.get('last_response') is not None:
+            peer['last_response'] = self.__parse_time(peer['last_response'])
+        return peer
+
+    def __parse_time(self, value):
+        if settings.DATA_FORMAT in ISO_DATA_FORMATS:
+            return datetime.fromisoformat(value).timestamp()
+        return datetime.strptime(value, settings.DATA_FORMAT).timestamp()
+
+    def __pack_peer_property(self, peer):
+        copied_peer = dict(peer)
+        if copied_peer.get('last_response') is not None:
+            copied_peer['last_response'] = datetime.fromtimestamp(copied_peer['last_response']).strftime(settings.DATA_FORMAT)
+        return copied_peer
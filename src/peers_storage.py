@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+__author__ = 'Akinava'
+__author_email__ = 'akinava@gmail.com'
+__copyright__ = 'Copyright © 2019'
+__license__ = 'MIT License'
+__version__ = [0, 0]
+
+
+import os
+import time
+import json
+import atexit
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import settings
+from settings import logger
+from metrics import Metrics
+
+
+SNAPSHOT_CHUNK_LENGTH = 1 << 20
+SEPARATORS = frozenset(' \t\r\n,[')
+
+
+class PeersStorage:
+    # peers_file stays a plain json snapshot, changes go to an append-only log
+    # next to it and are folded into the snapshot on compaction
+    def __init__(self, peers_file, scheduled_flush=True):
+        self.peers_file = peers_file
+        self.scheduled_flush = scheduled_flush
+        self.log_file = peers_file + '.log'
+        self.__dirty_peers = {}
+        self.__log_length = 0
+        self.__flush_handle = None
+        self.__writer = ThreadPoolExecutor(max_workers=1)
+        self.__save_time = Metrics().histogram('peers_save_seconds')
+        atexit.register(self.close)
+
+    @staticmethod
+    def get_peer_key(peer):
+        return peer.get('type'), peer.get('host'), peer.get('port'), peer.get('pub_key')
+
+    def iter_load(self):
+        for packed_peer in self.__stream_snapshot():
+            yield packed_peer
+        self.__log_length = 0
+        for packed_peer in self.__read_log():
+            self.__log_length += 1
+            yield packed_peer
+
+    def put(self, packed_peer):
+        self.__dirty_peers[self.get_peer_key(packed_peer)] = packed_peer
+        if self.scheduled_flush:
+            self.__schedule_flush()
+
+    def flush(self):
+        self.__flush_handle = None
+        if not self.__dirty_peers:
+            return
+        packed_peers = list(self.__dirty_peers.values())
+        self.__dirty_peers = {}
+        self.__log_length += len(packed_peers)
+        compact = self.__log_length >= settings.peers_log_compact_size
+        if compact:
+            self.__log_length = 0
+        self.__writer.submit(self.__write, packed_peers, compact)
+
+    def close(self):
+        self.__writer.shutdown(wait=True)
+        if self.__dirty_peers:
+            self.__write(list(self.__dirty_peers.values()), compact=False)
+            self.__dirty_peers = {}
+
+    def __schedule_flush(self):
+        if self.__flush_handle is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()
+            return
+        self.__flush_handle = loop.call_later(settings.peers_flush_seconds, self.flush)
+
+    def __write(self, packed_peers, compact):
+        start_time = time.perf_counter()
+        try:
+            self.__append_log(packed_peers)
+            if compact:
+                self.__compact()
+        except OSError as e:
+            logger.error('peers storage write error {}'.format(e))
+        self.__save_time.observe(time.perf_counter() - start_time)
+
+    def __append_log(self, packed_peers):
+        lines = ''.join(json.dumps(packed_peer) + '\n' for packed_peer in packed_peers)
+        with open(self.log_file, 'a') as f:
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def __compact(self):
+        peers, _ = self.__read_peers()
+        tmp_file = self.peers_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            f.write(json.dumps(peers, indent=4))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.peers_file)
+        with open(self.log_file, 'w') as f:
+            f.flush()
+            os.fsync(f.fileno())
+        logger.info('peers storage compacted, {} peers'.format(len(peers)))
+
+    def __read_peers(self):
+        peers = {}
+        for packed_peer in self.__read_snapshot():
+            peers[self.get_peer_key(packed_peer)] = packed_peer
+        log_length = 0
+        for packed_peer in self.__read_log():
+            peers[self.get_peer_key(packed_peer)] = packed_peer
+            log_length += 1
+        return list(peers.values()), log_length
+
+    def __read_snapshot(self):
+        with open(self.peers_file, 'r') as f:
+            return json.loads(f.read())
+
+    def __stream_snapshot(self):
+        # the snapshot is one json list, records are decoded one by one
+        # from a sliding buffer instead of loading the whole file
+        decoder = json.JSONDecoder()
+        with open(self.peers_file, 'r') as f:
+            buffer = ''
+            position = 0
+            list_opened = False
+            while True:
+                while position < len(buffer) and buffer[position] in SEPARATORS:
+                    if buffer[position] == '[':
+                        list_opened = True
+                    position += 1
+                if position < len(buffer) and buffer[position] == ']':
+                    return
+                try:
+                    packed_peer, end = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    chunk = f.read(SNAPSHOT_CHUNK_LENGTH)
+                    if not chunk:
+                        if list_opened and buffer[position:].strip():
+                            raise
+                        return
+                    buffer = buffer[position:] + chunk
+                    position = 0
+                    continue
+                position = end
+                yield packed_peer
+
+    def __read_log(self):
+        if not os.path.exists(self.log_file):
+            return
+        with open(self.log_file, 'r') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # torn tail after a crash in the middle of an append
+                    logger.warning('peers storage skip broken log record')
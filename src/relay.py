@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+__author__ = 'Akinava'
+__author_email__ = 'akinava@gmail.com'
+__copyright__ = 'Copyright © 2019'
+__license__ = 'MIT License'
+__version__ = [0, 0]
+
+
+import asyncio
+from datagram import Datagram
+from crypt_tools import Tools as CryptTools
+from utilit import Singleton
+
+
+RELAY_MESSAGE_MAX_LENGTH = 1400
+
+RELAY_PROTOCOL = {
+    'package': [
+        {
+            'name': 'hpn_relay_request',
+            'package_id_marker': 0x60,
+            'define': [
+                'verify_package_length',
+                'verify_package_id_marker',
+                'verify_receiver_fingerprint',
+            ],
+            'response': 'hpn_relayed_message',
+            'structure': [
+                {'name': 'package_id_marker', 'length': 1, 'type': 'int'},
+                {'name': 'receiver_fingerprint', 'length': CryptTools.fingerprint_length},
+                {'name': 'relay_addr', 'length': 6, 'type': 'addr'},
+                {'name': 'relay_message', 'length': {'min': 0, 'max': RELAY_MESSAGE_MAX_LENGTH}}]
+        },
+        {
+            'name': 'hpn_relayed_message',
+            'package_id_marker': 0x61,
+            'define': [
+                'verify_package_length',
+                'verify_package_id_marker',
+                'verify_receiver_fingerprint',
+            ],
+            'response': 'handle_relayed_message',
+            'structure': [
+                {'name': 'package_id_marker', 'length': 1, 'type': 'int'},
+                {'name': 'receiver_fingerprint', 'length': CryptTools.fingerprint_length},
+                {'name': 'relay_addr', 'length': 6, 'type': 'addr'},
+                {'name': 'relay_message', 'length': {'min': 0, 'max': RELAY_MESSAGE_MAX_LENGTH}}]
+        },
+        {
+            'name': 'hpn_relay_probe',
+            'package_id_marker': 0x62,
+            'define': [
+                'verify_package_length',
+                'verify_package_id_marker',
+                'verify_receiver_fingerprint',
+            ],
+            'response': 'hpn_relay_probe_response',
+            'structure': [
+                {'name': 'package_id_marker', 'length': 1, 'type': 'int'},
+                {'name': 'receiver_fingerprint', 'length': CryptTools.fingerprint_length},
+                {'name': 'relay_addr', 'length': 6, 'type': 'addr'}]
+        },
+        {
+            'name': 'hpn_relay_probe_response',
+            'package_id_marker': 0x63,
+            'define': [
+                'verify_package_length',
+                'verify_package_id_marker',
+                'verify_receiver_fingerprint',
+            ],
+            'response': 'handle_relay_probe_response',
+            'structure': [
+                {'name': 'package_id_marker', 'length': 1, 'type': 'int'},
+                {'name': 'receiver_fingerprint', 'length': CryptTools.fingerprint_length},
+                {'name': 'relay_addr', 'length': 6, 'type': 'addr'},
+                {'name': 'relay_reachable', 'length': 1, 'type': 'int'}]
+        },
+    ],
+}
+
+
+class RelayDatagram(Datagram):
+    def __init__(self, connection, relay_addr, relay_message):
+        super(RelayDatagram, self).__init__(connection)
+        self.relay_addr = relay_addr
+        self.relay_message = relay_message
+
+
+class RelayProbeDatagram(Datagram):
+    def __init__(self, connection, relay_addr, relay_reachable=False):
+        super(RelayProbeDatagram, self).__init__(connection)
+        self.relay_addr = relay_addr
+        self.relay_reachable = relay_reachable
+
+
+class RelayProbes(Singleton):
+    # a neighbour is asked whether it has the peer in its pool before
+    # it becomes the relay of the peer
+    def __init__(self):
+        if hasattr(self, '_RelayProbes__futures'):
+            return
+        self.__futures = {}
+
+    def expect(self, relay_addr, target_addr):
+        future = self.__futures.get((relay_addr, target_addr))
+        if future is None or future.done():
+            future = asyncio.get_running_loop().create_future()
+            self.__futures[(relay_addr, target_addr)] = future
+        return future
+
+    def resolve(self, relay_addr, target_addr, reachable):
+        future = self.__futures.pop((relay_addr, target_addr), None)
+        if future is not None and not future.done():
+            future.set_result(reachable)
+
+    def forget(self, relay_addr, target_addr, future):
+        if self.__futures.get((relay_addr, target_addr)) is future:
+            del self.__futures[(relay_addr, target_addr)]
+
+
+class RelayTransport:
+    # the sendto of asyncio.DatagramTransport a connection uses, every
+    # datagram goes to the relay client wrapped in hpn_relay_request
+    def __init__(self, handler, relay_connection):
+        self.handler = handler
+        self.relay_connection = relay_connection
+
+    def sendto(self, data, addr=None):
+        if len(data) > RELAY_MESSAGE_MAX_LENGTH:
+            return
+        request = Datagram(self.relay_connection)
+        request.set_package_protocol({'response': 'hpn_relay_request'})
+        response = RelayDatagram(self.relay_connection, relay_addr=addr, relay_message=bytes(data))
+        self.handler.send(request=request, response=response)
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+__author__ = 'Akinava'
+__author_email__ = 'akinava@gmail.com'
+__copyright__ = 'Copyright © 2019'
+__license__ = 'MIT License'
+__version__ = [0, 0]
+
+
+import time
+from utilit import Singleton
+
+
+class ServersListCache(Singleton):
+    def __init__(self):
+        if hasattr(self, 'hits'):
+            return
+        self.hits = 0
+        self.misses = 0
+        self.__servers_version = None
+        self.__expiry_time = 0
+        self.__servers_list = None
+
+    def get(self, servers_version):
+        if self.__servers_list is None or servers_version != self.__servers_version or time.time() >= self.__expiry_time:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self.__servers_list
+
+    def put(self, servers_version, expiry_time, servers_list):
+        self.__servers_version = servers_version
+        self.__expiry_time = expiry_time
+        self.__servers_list = servers_list
+
+    def get_stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+__author__ = 'Akinava'
+__author_email__ = 'akinava@gmail.com'
+__copyright__ = 'Copyright © 2019'
+__license__ = 'MIT License'
+__version__ = [0, 0]
+
+
+import functools
+import threading
+from collections import deque
+from concurrent.futures import Future
+from utilit import Singleton
+from settings import logger
+
+
+class StateWriter(Singleton):
+    # the loop thread is the only writer of the pool and Peers, on the loop
+    # a mutation is a plain call; from another thread it is queued to the
+    # loop and its future is returned, the thread waits on it only if it
+    # needs its own write
+    def __init__(self):
+        if hasattr(self, '_StateWriter__queue'):
+            return
+        self.__queue = deque()
+        self.__lock = threading.Lock()
+        self.__loop = None
+        self.__writer_thread_id = None
+        self.__drain_scheduled = False
+
+    def start(self, loop):
+        self.__loop = loop
+        self.__writer_thread_id = threading.get_ident()
+
+    def is_writer(self):
+        if threading.get_ident() == self.__writer_thread_id:
+            return True
+        return self.__loop is None or self.__loop.is_closed()
+
+    def apply(self, function, *args, **kwargs):
+        if self.is_writer():
+            return function(*args, **kwargs)
+        future = Future()
+        with self.__lock:
+            self.__queue.append((future, function, args, kwargs))
+            drain_scheduled, self.__drain_scheduled = self.__drain_scheduled, True
+        if not drain_scheduled:
+            self.__loop.call_soon_threadsafe(self.__drain)
+        return future
+
+    def __drain(self):
+        with self.__lock:
+            queue, self.__queue = self.__queue, deque()
+            self.__drain_scheduled = False
+        for future, function, args, kwargs in queue:
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(function(*args, **kwargs))
+            except Exception as e:
+                logger.exception('state write {} failed'.format(function.__qualname__))
+                future.set_exception(e)
+
+
+def single_writer(method):
+    state_writer = StateWriter()
+
+    @functools.wraps(method)
+    def apply(*args, **kwargs):
+        if state_writer.is_writer():
+            return method(*args, **kwargs)
+        return state_writer.apply(method, *args, **kwargs)
+    return apply
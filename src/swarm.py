@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+__author__ = 'Akinava'
+__author_email__ = 'akinava@gmail.com'
+__copyright__ = 'Copyright © 2019'
+__license__ = 'MIT License'
+__version__ = [0, 0]
+
+
+import random
+import asyncio
+from peer_score import choose_weighted
+from clock import get_loop_time
+import settings
+from settings import logger
+
+
+class Backoff:
+    def __init__(self, base_seconds, max_seconds, min_seconds=0):
+        self.base_seconds = base_seconds
+        self.max_seconds = max_seconds
+        self.min_seconds = min_seconds
+        self.__failures = {}
+        self.__retry_time = {}
+
+    def is_ready(self, key):
+        return self.__retry_time.get(key, 0) <= get_loop_time()
+
+    def get_next_retry_time(self):
+        now = get_loop_time()
+        return min((retry_time for retry_time in self.__retry_time.values() if retry_time > now), default=None)
+
+    def failed(self, key):
+        failures = self.__failures.get(key, 0) + 1
+        self.__failures[key] = failures
+        delay = min(self.max_seconds, self.base_seconds * 2 ** min(failures - 1, 32))
+        self.__retry_time[key] = get_loop_time() + random.uniform(delay / 2, delay)
+
+    def succeeded(self, key):
+        self.__failures.pop(key, None)
+        if self.min_seconds:
+            # a key that answered is not asked again before min_seconds
+            self.__retry_time[key] = get_loop_time() + self.min_seconds
+        else:
+            self.__retry_time.pop(key, None)
+
+
+class SwarmMaintainer:
+    servers_key = 'servers'
+
+    def __init__(self, net_pool, connect_via_client, connect_via_server):
+        self.net_pool = net_pool
+        self.connect_via_client = connect_via_client
+        self.connect_via_server = connect_via_server
+        self.backoff = Backoff(
+            base_seconds=settings.swarm_backoff_base_seconds,
+            max_seconds=settings.swarm_backoff_max_seconds,
+            min_seconds=settings.peer_ping_time_seconds)
+        self.__attempts = set()
+        self.__attempt_keys = set()
+
+    async def serve(self, listener):
+        while not listener.is_closing():
+            self.__start_attempts()
+            await self.__wait(self.__get_wait_seconds())
+        for attempt in self.__attempts:
+            attempt.cancel()
+
+    def __start_attempts(self):
+        if self.net_pool.has_enough_client_connections():
+            return
+        clients_length = len(self.net_pool.get_all_client_connections())
+        attempts_length = min(
+            settings.peer_connections - clients_length - len(self.__attempts),
+            settings.swarm_max_in_flight - len(self.__attempts))
+        for _ in range(attempts_length):
+            if not self.__start_attempt():
+                break
+
+    def __start_attempt(self):
+        if self.net_pool.has_client_connection():
+            # only clients that are not in flight and not backing off are drawn
+            connection = choose_weighted(
+                [connection for connection in self.net_pool.get_all_client_connections()
+                 if self.__can_attempt(connection.get_remote_addr())],
+                lambda connection: connection.score)
+            if connection is None:
+                return False
+            self.__run_attempt(connection.get_remote_addr(), self.connect_via_client(connection))
+            return True
+        if self.net_pool.get_server_connections():
+            return False
+        if not self.__can_attempt(self.servers_key):
+            return False
+        self.__run_attempt(self.servers_key, self.connect_via_server(self.backoff))
+        return True
+
+    def __can_attempt(self, key):
+        return key not in self.__attempt_keys and self.backoff.is_ready(key)
+
+    def __run_attempt(self, key, coroutine):
+        attempt = asyncio.ensure_future(coroutine)
+        self.__attempts.add(attempt)
+        self.__attempt_keys.add(key)
+        attempt.add_done_callback(lambda attempt: self.__finish_attempt(key, attempt))
+
+    def __finish_attempt(self, key, attempt):
+        self.__attempts.discard(attempt)
+        self.__attempt_keys.discard(key)
+        if attempt.cancelled():
+            return
+        if attempt.exception() is not None:
+            logger.warning('swarm attempt via {} failed: {}'.format(key, attempt.exception()))
+            self.backoff.failed(key)
+        elif attempt.result():
+            self.backoff.succeeded(key)
+        else:
+            self.backoff.failed(key)
+
+    def __get_wait_seconds(self):
+        wait_seconds = settings.peer_ping_time_seconds
+        if self.net_pool.has_enough_client_connections():
+            return wait_seconds
+        next_retry_time = self.backoff.get_next_retry_time()
+        if next_retry_time is not None:
+            wait_seconds = min(wait_seconds, max(0, next_retry_time - get_loop_time()))
+        return wait_seconds
+
+    async def __wait(self, wait_seconds):
+        if self.__attempts:
+            await asyncio.wait(self.__attempts, timeout=wait_seconds, return_when=asyncio.FIRST_COMPLETED)
+        else:
+            await asyncio.sleep(wait_seconds)
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+__author__ = 'Akinava'
+__author_email__ = 'akinava@gmail.com'
+__copyright__ = 'Copyright © 2019'
+__license__ = 'MIT License'
+__version__ = [0, 0]
+
+
+import asyncio
+import math
+
+
+class Timer:
+    def __init__(self, tick, callback, args):
+        self.tick = tick
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class TimerWheel:
+    # levels of slots_length slots, a slot of level n spans slots_length ** n ticks,
+    # timers cascade to the lower level when its window comes
+    def __init__(self, tick_seconds=0.05, slots_length=64, levels_length=4):
+        self.tick_seconds = tick_seconds
+        self.slots_length = slots_length
+        self.__spans = [slots_length ** level for level in range(levels_length + 1)]
+        self.__levels = [[[] for _ in range(slots_length)] for _ in range(levels_length)]
+        self.__overflow = []
+        self.__timers_length = 0
+        self.__current_tick = None
+        self.__tick_handle = None
+
+    def __len__(self):
+        return self.__timers_length
+
+    def schedule(self, delay, callback, *args):
+        loop = asyncio.get_event_loop()
+        if self.__current_tick is None:
+            self.__current_tick = self.__get_loop_tick(loop)
+        tick = max(self.__current_tick + 1, math.ceil((loop.time() + delay) / self.tick_seconds))
+        timer = Timer(tick, callback, args)
+        self.__place(timer)
+        self.__timers_length += 1
+        self.__run_ticker(loop)
+        return timer
+
+    def __place(self, timer):
+        for level, slots in enumerate(self.__levels):
+            parent_span = self.__spans[level + 1]
+            if timer.tick // parent_span == self.__current_tick // parent_span:
+                slots[timer.tick // self.__spans[level] % self.slots_length].append(timer)
+                return
+        self.__overflow.append(timer)
+
+    def __get_loop_tick(self, loop):
+        return int(loop.time() / self.tick_seconds)
+
+    def __run_ticker(self, loop):
+        if self.__tick_handle is not None:
+            return
+        self.__tick_handle = loop.call_later(self.tick_seconds, self.__tick, loop)
+
+    def __tick(self, loop):
+        self.__tick_handle = None
+        loop_tick = self.__get_loop_tick(loop)
+        while self.__current_tick < loop_tick and self.__timers_length > 0:
+            self.__current_tick += 1
+            self.__cascade()
+            self.__fire_slot()
+        if self.__timers_length > 0:
+            self.__run_ticker(loop)
+        else:
+            self.__current_tick = None
+
+    def __cascade(self):
+        top_span = self.__spans[-1]
+        if self.__current_tick % top_span == 0 and self.__overflow:
+            overflow, self.__overflow = self.__overflow, []
+            self.__replace_timers(overflow)
+        for level in range(len(self.__levels) - 1, 0, -1):
+            span = self.__spans[level]
+            if self.__current_tick % span:
+                continue
+            slots = self.__levels[level]
+            slot_index = self.__current_tick // span % self.slots_length
+            slot, slots[slot_index] = slots[slot_index], []
+            self.__replace_timers(slot)
+
+    def __replace_timers(self, timers):
+        for timer in timers:
+            if timer.cancelled:
+                self.__timers_length -= 1
+                continue
+            self.__place(timer)
+
+    def __fire_slot(self):
+        slots = self.__levels[0]
+        slot_index = self.__current_tick % self.slots_length
+        slot = slots[slot_index]
+        if not slot:
+            return
+        slots[slot_index] = []
+        for timer in slot:
+            if timer.cancelled:
+                self.__timers_length -= 1
+                continue
+            if timer.tick > self.__current_tick:
+                self.__place(timer)
+                continue
+            self.__timers_length -= 1
+            timer.callback(*timer.args)
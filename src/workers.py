@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+__author__ = 'Akinava'
+__author_email__ = 'akinava@gmail.com'
+__copyright__ = 'Copyright © 2019'
+__license__ = 'MIT License'
+__version__ = [0, 0]
+
+
+import zlib
+import time
+import queue
+import asyncio
+import threading
+import multiprocessing
+from multiprocessing.connection import wait
+from utilit import Singleton
+from peers_storage import PeersStorage
+import settings
+from settings import logger
+
+
+class WorkerChannel(Singleton):
+    # SO_REUSEPORT spreads datagrams over workers by a kernel hash, so every
+    # remote address has one owner worker and the others forward to it
+    def __init__(self):
+        if hasattr(self, 'worker_index'):
+            return
+        self.worker_index = 0
+        self.workers_count = 1
+        self.other_client_connections = 0
+        self.__pipe = None
+        self.__outbox = queue.SimpleQueue()
+        self.__routes = {}
+        self.__callbacks = {}
+
+    def is_active(self):
+        return self.__pipe is not None
+
+    def attach(self, pipe, worker_index, workers_count):
+        self.__pipe = pipe
+        self.worker_index = worker_index
+        self.workers_count = workers_count
+        asyncio.get_running_loop().add_reader(pipe.fileno(), self.__receive)
+        threading.Thread(target=self.__send_outbox, name='worker_channel_sender', daemon=True).start()
+
+    def on(self, message_type, callback):
+        self.__callbacks[message_type] = callback
+
+    def send(self, message_type, *args):
+        # pipe.send blocks while the pipe is full, the loop only queues
+        if self.is_active():
+            self.__outbox.put((message_type, self.worker_index) + args)
+
+    def __send_outbox(self):
+        while True:
+            message = self.__outbox.get()
+            try:
+                self.__pipe.send(message)
+            except OSError as e:
+                logger.error('worker channel send error {}'.format(e))
+                return
+
+    def get_owner(self, remote_addr):
+        owner = self.__routes.get(remote_addr)
+        if owner is None:
+            owner = zlib.crc32('{}:{}'.format(*remote_addr).encode()) % self.workers_count
+        return owner
+
+    def is_owner(self, remote_addr):
+        return not self.is_active() or self.get_owner(remote_addr) == self.worker_index
+
+    def claim(self, remote_addr):
+        if not self.is_active():
+            return
+        self.__routes[remote_addr] = self.worker_index
+        self.send('claim', remote_addr)
+
+    def release(self, remote_addr):
+        if not self.is_active():
+            return
+        if self.__routes.get(remote_addr) == self.worker_index:
+            del self.__routes[remote_addr]
+            self.send('release', remote_addr)
+
+    def forward(self, raw_message, remote_addr):
+        self.send('datagram', self.get_owner(remote_addr), raw_message, remote_addr)
+
+    def __receive(self):
+        while self.__pipe.poll():
+            message_type, worker_index, *args = self.__pipe.recv()
+            if message_type == 'claim':
+                remote_addr, = args
+                self.__routes[remote_addr] = worker_index
+            elif message_type == 'release':
+                remote_addr, = args
+                if self.__routes.get(remote_addr) == worker_index:
+                    del self.__routes[remote_addr]
+            elif message_type == 'client_connections':
+                self.other_client_connections, = args
+            callback = self.__callbacks.get(message_type)
+            if callback is not None:
+                callback(*args)
+
+
+def run_worker(handler, protocol, pipe, worker_index, workers_count):
+    from client_host import Client
+    client = Client(handler=handler, protocol=protocol)
+    try:
+        asyncio.run(client.run_worker(pipe, worker_index, workers_count))
+    except KeyboardInterrupt:
+        pass
+
+
+class Workers:
+    def __init__(self, handler, protocol, workers_count):
+        self.handler = handler
+        self.protocol = protocol
+        self.workers_count = workers_count
+        self.__pipes = []
+        self.__processes = []
+        self.__client_connections = [0] * workers_count
+        self.__storage = None
+
+    def run(self):
+        context = multiprocessing.get_context('fork')
+        for worker_index in range(self.workers_count):
+            parent_pipe, worker_pipe = context.Pipe()
+            process = context.Process(
+                target=run_worker,
+                args=(self.handler, self.protocol, worker_pipe, worker_index, self.workers_count),
+                daemon=True)
+            process.start()
+            self.__pipes.append(parent_pipe)
+            self.__processes.append(process)
+        logger.info('{} workers started'.format(self.workers_count))
+        # the parent is the only writer of peers_file, workers send their changes
+        self.__storage = PeersStorage(settings.peers_file, scheduled_flush=False)
+        try:
+            self.__serve()
+        finally:
+            for process in self.__processes:
+                process.terminate()
+            self.__storage.close()
+
+    def __serve(self):
+        open_pipes = list(self.__pipes)
+        flush_time = time.monotonic() + settings.peers_flush_seconds
+        while open_pipes:
+            for pipe in wait(open_pipes, timeout=settings.peers_flush_seconds):
+                try:
+                    message = pipe.recv()
+                except EOFError:
+                    open_pipes.remove(pipe)
+                    continue
+                self.__dispatch(message)
+            if time.monotonic() >= flush_time:
+                self.__storage.flush()
+                flush_time = time.monotonic() + settings.peers_flush_seconds
+
+    def __dispatch(self, message):
+        message_type, worker_index, *args = message
+        if message_type == 'datagram':
+            owner, raw_message, remote_addr = args
+            self.__pipes[owner].send(('datagram', worker_index, raw_message, remote_addr))
+        elif message_type == 'peer':
+            packed_peer, = args
+            self.__storage.put(packed_peer)
+        elif message_type == 'client_connections':
+            self.__client_connections[worker_index], = args
+            total = sum(self.__client_connections)
+            for index, pipe in enumerate(self.__pipes):
+                pipe.send(('client_connections', worker_index, total - self.__client_connections[index]))
+        else:
+            self.__broadcast(message, worker_index)
+
+    def __broadcast(self, message, worker_index):
+        for index, pipe in enumerate(self.__pipes):
+            if index != worker_index:
+                pipe.send(message)
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+__author__ = 'Akinava'
+__author_email__ = 'akinava@gmail.com'
+__copyright__ = "Copyright © 2019"
+__license__ = "MIT License"
+__version__ = [0, 0]
+
+
+import sys
+import os
+import timeit
+from pathlib import Path
+path = Path(os.path.dirname(os.path.realpath(__file__))).parent
+sys.path.append(os.path.join(path, 'src'))
+
+
+import settings
+from admission import Admission
+from relay import RELAY_PROTOCOL
+from metrics import Metrics
+
+
+CALLS = 100000
+FINGERPRINT_LENGTH = 32
+PROTOCOL = {
+    'package': [
+        {
+            'name': 'bench_hello',
+            'package_id_marker': 0x80,
+            'structure': [
+                {'name': ('major_protocol_version_marker', 'minor_protocol_version_marker'), 'length': 1, 'type': 'markers'},
+                {'name': 'package_id_marker', 'length': 1, 'type': 'int'},
+                {'name': 'receiver_fingerprint', 'length': FINGERPRINT_LENGTH}]
+        },
+    ] + RELAY_PROTOCOL['package'],
+}
+
+
+def bench(name, messages, sources, known_source):
+    admission = Admission()
+    message_iter = [(messages[index % len(messages)], sources[index % len(sources)]) for index in range(CALLS)]
+    admitted = 0
+
+    def run():
+        nonlocal admitted
+        for raw_message, remote_addr in message_iter:
+            if admission.admit(raw_message, remote_addr, known_source):
+                admitted += 1
+
+    seconds = timeit.timeit(run, number=1)
+    print('{:<28} {:.3f} us per datagram, {} of {} admitted'.format(name, seconds / CALLS * 1e6, admitted, CALLS))
+
+
+if __name__ == '__main__':
+    settings.request_encrypted_protocol = False
+    Admission().compile(PROTOCOL)
+    valid = [bytes([0x00, 0x80]) + bytes(FINGERPRINT_LENGTH)]
+    junk = [bytes([0x00, 0x13]) + bytes(FINGERPRINT_LENGTH), b'\x00']
+    many_sources = [('10.0.{}.{}'.format(*divmod(number, 256)), 2004) for number in range(10000)]
+    bench('valid, many sources', valid, many_sources, known_source=False)
+    bench('junk, many sources', junk, many_sources, known_source=False)
+    bench('valid, one source flood', valid, [('10.1.0.1', 2004)], known_source=False)
+    bench('valid, known peer flood', valid, [('10.1.0.2', 2004)], known_source=True)
+    print({name: value for name, value in Metrics().get_snapshot().items() if name.startswith('datagrams_shed')})
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+__author__ = 'Akinava'
+__author_email__ = 'akinava@gmail.com'
+__copyright__ = "Copyright © 2019"
+__license__ = "MIT License"
+__version__ = [0, 0]
+
+
+import sys
+import os
+import time
+import timeit
+from pathlib import Path
+path = Path(os.path.dirname(os.path.realpath(__file__))).parent
+sys.path.append(os.path.join(path, 'src'))
+
+
+from client_net_pool import ClientNetPool
+from peer_score import PeerScore
+
+
+POOL_SIZES = [10, 100, 1000, 10000, 100000]
+LOOKUPS = 10000
+
+
+class BenchConnection:
+    def __init__(self, number, connection_type):
+        self.remote_addr = ('10.{}.{}.{}'.format(number >> 16 & 0xff, number >> 8 & 0xff, number & 0xff), 10000 + number % 50000)
+        self.fingerprint = number.to_bytes(32, 'big')
+        self.pub_key = self.fingerprint * 2
+        self.type = connection_type
+        self.received_message_time = time.time()
+        self.score = PeerScore()
+
+    def get_remote_addr(self):
+        return self.remote_addr
+
+    def get_pub_key(self):
+        return self.pub_key
+
+    def get_fingerprint(self):
+        return self.fingerprint
+
+
+def bench(pool_size):
+    net_pool = ClientNetPool()
+    for connection in list(net_pool.connections_list):
+        net_pool.disconnect(connection)
+    connections = [BenchConnection(number, 'client' if number % 10 else 'server') for number in range(pool_size)]
+    for connection in connections:
+        net_pool.add_connection(connection)
+    probe = connections[pool_size // 2]
+    return {
+        'by_fingerprint': timeit.timeit(lambda: net_pool.get_connection_by_fingerprint(probe.fingerprint), number=LOOKUPS),
+        'is_client': timeit.timeit(lambda: net_pool.is_client_connection(probe), number=LOOKUPS),
+        'random_client': timeit.timeit(net_pool.get_random_client_connection, number=LOOKUPS),
+        'has_enough': timeit.timeit(net_pool.has_enough_client_connections, number=LOOKUPS),
+    }
+
+
+if __name__ == '__main__':
+    for pool_size in POOL_SIZES:
+        result = bench(pool_size)
+        print('{:>7} connections: {}'.format(pool_size, ', '.join(
+            '{} {:.3f} us'.format(name, seconds / LOOKUPS * 1e6) for name, seconds in result.items())))
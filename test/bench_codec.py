@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+__author__ = 'Akinava'
+__author_email__ = 'akinava@gmail.com'
+__copyright__ = "Copyright © 2019"
+__license__ = "MIT License"
+__version__ = [0, 0]
+
+
+import sys
+import os
+import timeit
+from pathlib import Path
+path = Path(os.path.dirname(os.path.realpath(__file__))).parent
+sys.path.append(os.path.join(path, 'src'))
+sys.path.append(os.path.join(path, 'test'))
+
+
+from client_host import Client
+from datagram import Datagram
+from codec import Codecs
+from cryptotool import B58
+from test_peer import PROTOCOL, Handler
+
+
+CALLS = 100000
+
+
+def get_structure(protocol, name):
+    if name in protocol.get('list', {}):
+        return protocol['list'][name]['structure']
+    for package in protocol['package']:
+        if package['name'] == name:
+            return package['structure']
+
+
+def bench(handler, name, **kwargs):
+    structure = get_structure(handler.parser().protocol, name)
+    codec = Codecs().get_codec(name)
+    if codec is None:
+        print('{}: no codec compiled'.format(name))
+        return
+    message = handler.make_message_by_structure(structure=structure, **kwargs)
+    Codecs().verify(codec, codec.pack(codec.get_values(handler, **kwargs)), message)
+    if not codec.verified:
+        print('{}: codec does not match the parser'.format(name))
+        return
+    structure_time = timeit.timeit(lambda: handler.make_message_by_structure(structure=structure, **kwargs), number=CALLS)
+    codec_time = timeit.timeit(lambda: codec.pack(codec.get_values(handler, **kwargs)), number=CALLS)
+    print('{}: structure {:.0f} dgram/s, codec pack {:.0f} dgram/s'.format(
+        name, CALLS / structure_time, CALLS / codec_time))
+
+
+if __name__ == '__main__':
+    client = Client(handler=Handler, protocol=PROTOCOL)
+    handler = client.handler()
+    connection = client.net_pool.create_connection(('127.0.0.1', 2004), None)
+    connection.set_pub_key(handler.crypt_tools.get_pub_key())
+    request = Datagram(connection=connection)
+    request.set_package_protocol({'response': 'test_peer_time'})
+    response = Datagram(connection=connection)
+    server_data = {
+        'pub_key': B58().pack(handler.crypt_tools.get_pub_key()),
+        'protocol': 'udp',
+        'host': '127.0.0.1',
+        'port': 2003,
+    }
+    bench(handler, 'hpn_servers_list', server_data=server_data)
+    bench(handler, 'test_peer_time', request=request, response=response)
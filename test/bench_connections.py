@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+__author__ = 'Akinava'
+__author_email__ = 'akinava@gmail.com'
+__copyright__ = "Copyright © 2019"
+__license__ = "MIT License"
+__version__ = [0, 0]
+
+
+import sys
+import os
+import tracemalloc
+from pathlib import Path
+path = Path(os.path.dirname(os.path.realpath(__file__))).parent
+sys.path.append(os.path.join(path, 'src'))
+
+
+from connection import Connection
+from client_connection import ClientConnection, ConnectionType, SwarmStatus
+
+
+CONNECTIONS_LENGTH = 100000
+SERVERS_LENGTH = 10
+
+
+def make_connections(connection_class, connection_type, swarm_status):
+    # every neighbour is announced by each of SERVERS_LENGTH servers,
+    # so every server response carries its own copy of the pub key
+    connections = []
+    for number in range(CONNECTIONS_LENGTH):
+        connection = connection_class(
+            remote_addr=('10.{}.{}.{}'.format(number >> 16 & 0xff, number >> 8 & 0xff, number & 0xff), 10000 + number % 50000),
+            transport=None)
+        connection.set_pub_key((number % (CONNECTIONS_LENGTH // SERVERS_LENGTH)).to_bytes(64, 'big'))
+        connection.type = connection_type
+        connection.swarm_status = swarm_status
+        connections.append(connection)
+    return connections
+
+
+def measure(connection_class, connection_type, swarm_status):
+    tracemalloc.start()
+    connections = make_connections(connection_class, connection_type, swarm_status)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del connections
+    return size
+
+
+if __name__ == '__main__':
+    for name, connection_class, connection_type, swarm_status in (
+            ('Connection', Connection, 'client', 'in progress'),
+            ('ClientConnection', ClientConnection, ConnectionType.client, SwarmStatus.in_progress)):
+        size = measure(connection_class, connection_type, swarm_status)
+        print('{}: {} connections {:.1f} MB, {:.0f} bytes per connection'.format(
+            name, CONNECTIONS_LENGTH, size / 2 ** 20, size / CONNECTIONS_LENGTH))
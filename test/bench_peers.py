@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+__author__ = 'Akinava'
+__author_email__ = 'akinava@gmail.com'
+__copyright__ = "Copyright © 2019"
+__license__ = "MIT License"
+__version__ = [0, 0]
+
+
+import sys
+import os
+import json
+import time
+import atexit
+import asyncio
+import timeit
+import tempfile
+from pathlib import Path
+path = Path(os.path.dirname(os.path.realpath(__file__))).parent
+sys.path.append(os.path.join(path, 'src'))
+
+
+from cryptotool import B58
+from utilit import now
+import settings
+from peers import Peers
+
+
+PEERS_LENGTH = 100000
+SERVERS_LIST_LENGTH = 100
+CALLS = 1000
+
+
+def make_pub_key(number):
+    return number.to_bytes(64, 'big')
+
+
+def make_peers_file(peers_length):
+    peers = []
+    for number in range(peers_length):
+        peer = {
+            'protocol': 'udp',
+            'type': 'server' if number % 2 else 'client',
+            'pub_key': B58().pack(make_pub_key(number)),
+            'host': '10.{}.{}.{}'.format(number >> 16 & 0xff, number >> 8 & 0xff, number & 0xff),
+            'port': 10000 + number % 50000,
+        }
+        if number % 3:
+            peer['last_response'] = now()
+        peers.append(peer)
+    peers_file = tempfile.NamedTemporaryFile('w', suffix='.json', delete=False)
+    peers_file.write(json.dumps(peers))
+    peers_file.close()
+    return peers_file.name
+
+
+def make_servers_list(servers_length, offset):
+    servers_list = []
+    for number in range(offset, offset + servers_length):
+        servers_list.append({
+            'hpn_servers_addr': ('172.16.{}.{}'.format(number >> 8 & 0xff, number & 0xff), 2003),
+            'hpn_servers_pub_key': make_pub_key(number),
+            'hpn_servers_protocol': 'udp',
+        })
+    return servers_list
+
+
+def remove_peers_file(peers_file):
+    for file_name in (peers_file, peers_file + '.log'):
+        if os.path.exists(file_name):
+            os.remove(file_name)
+
+
+async def bench():
+    load_time = time.time()
+    peers = Peers()
+    peers.get_random_server_from_file()
+    print('load {} peers {:.3f} s'.format(PEERS_LENGTH, time.time() - load_time))
+
+    servers_lists = iter([make_servers_list(SERVERS_LIST_LENGTH, offset * SERVERS_LIST_LENGTH) for offset in range(CALLS)])
+    merge_time = timeit.timeit(lambda: peers.save_servers_list(next(servers_lists)), number=CALLS)
+    print('save_servers_list of {} servers {:.3f} ms'.format(SERVERS_LIST_LENGTH, merge_time / CALLS * 1e3))
+
+    random_time = timeit.timeit(peers.get_random_server_from_file, number=CALLS)
+    print('get_random_server_from_file {:.3f} us'.format(random_time / CALLS * 1e6))
+
+    servers_list_time = timeit.timeit(lambda: peers.get_servers_list(SERVERS_LIST_LENGTH), number=CALLS)
+    print('get_servers_list({}) {:.3f} us'.format(SERVERS_LIST_LENGTH, servers_list_time / CALLS * 1e6))
+
+
+if __name__ == '__main__':
+    settings.peers_file = make_peers_file(PEERS_LENGTH)
+    atexit.register(remove_peers_file, settings.peers_file)
+    asyncio.run(bench())
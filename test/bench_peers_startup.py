@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+__author__ = 'Akinava'
+__author_email__ = 'akinava@gmail.com'
+__copyright__ = "Copyright © 2019"
+__license__ = "MIT License"
+__version__ = [0, 0]
+
+
+import sys
+import os
+import json
+import time
+import asyncio
+import tempfile
+import multiprocessing
+from datetime import datetime
+from pathlib import Path
+path = Path(os.path.dirname(os.path.realpath(__file__))).parent
+sys.path.append(os.path.join(path, 'src'))
+
+
+from cryptotool import B58
+from utilit import now
+import settings
+
+
+PEERS_LENGTHS = (1000, 100000, 1000000)
+FRESH_SERVER_EVERY = 7
+
+
+def make_peers_file(peers_length):
+    fresh_time = now()
+    stale_time = '2000-01-01 00:00:00'
+    peers_file = tempfile.NamedTemporaryFile('w', suffix='.json', delete=False)
+    peers_file.write('[')
+    for number in range(peers_length):
+        peer = {
+            'protocol': 'udp',
+            'type': 'server' if number % 2 else 'client',
+            'pub_key': B58().pack(number.to_bytes(64, 'big')),
+            'host': '10.{}.{}.{}'.format(number >> 16 & 0xff, number >> 8 & 0xff, number & 0xff),
+            'port': 10000 + number % 50000,
+            'last_response': fresh_time if number % FRESH_SERVER_EVERY == 0 else stale_time,
+        }
+        peers_file.write(('' if number == 0 else ',') + json.dumps(peer))
+    peers_file.write(']')
+    peers_file.close()
+    return peers_file.name
+
+
+def load_eager(peers_file):
+    # what Peers did before: the whole file and every pub key up front
+    with open(peers_file, 'r') as f:
+        packed_peers = json.loads(f.read())
+    for packed_peer in packed_peers:
+        B58().unpack(packed_peer['pub_key'])
+        datetime.strptime(packed_peer['last_response'], settings.DATA_FORMAT)
+
+
+async def load_lazy(results):
+    from peers import Peers
+    start_time = time.perf_counter()
+    load_task = Peers().load_async()
+    await Peers().wait_bootstrap_ready()
+    server = Peers().get_random_server_from_file()
+    results['first_server'] = time.perf_counter() - start_time
+    Peers().get_pub_key(server)
+    await load_task
+    results['loaded'] = time.perf_counter() - start_time
+
+
+def measure(peers_length, results):
+    settings.peers_file = make_peers_file(peers_length)
+    try:
+        start_time = time.perf_counter()
+        load_eager(settings.peers_file)
+        results['eager'] = time.perf_counter() - start_time
+        asyncio.run(load_lazy(results))
+    finally:
+        os.remove(settings.peers_file)
+
+
+if __name__ == '__main__':
+    max_length = int(sys.argv[1]) if len(sys.argv) > 1 else PEERS_LENGTHS[-1]
+    context = multiprocessing.get_context('fork')
+    for peers_length in PEERS_LENGTHS:
+        if peers_length > max_length:
+            break
+        # Peers is a singleton, every size is loaded in a fresh process
+        results = context.Manager().dict()
+        process = context.Process(target=measure, args=(peers_length, results))
+        process.start()
+        process.join()
+        print('{} peers: eager load {:.3f} s, first fresh server {:.4f} s, lazy load complete {:.3f} s'.format(
+            peers_length, results['eager'], results['first_server'], results['loaded']))
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+__author__ = 'Akinava'
+__author_email__ = 'akinava@gmail.com'
+__copyright__ = "Copyright © 2019"
+__license__ = "MIT License"
+__version__ = [0, 0]
+
+
+import sys
+import os
+import time
+from pathlib import Path
+path = Path(os.path.dirname(os.path.realpath(__file__))).parent
+sys.path.append(os.path.join(path, 'src'))
+sys.path.append(os.path.join(path, 'test'))
+
+
+from simulator import Simulation, Nat
+
+
+CLIENTS_LENGTH = 300
+MAX_VIRTUAL_SECONDS = 600
+SCENARIOS = (
+    ('no nat', {None: 1}),
+    ('full cone', {Nat.full_cone: 1}),
+    ('restricted', {Nat.restricted: 1}),
+    ('port restricted', {Nat.port_restricted: 1}),
+    ('mixed', {None: 1, Nat.full_cone: 2, Nat.restricted: 2, Nat.port_restricted: 3, Nat.symmetric: 2}),
+    ('mixed, 5% loss, reorder', {None: 1, Nat.full_cone: 2, Nat.restricted: 2, Nat.port_restricted: 3, Nat.symmetric: 2}),
+)
+
+
+def format_seconds(value):
+    return '-' if value is None else '{:.1f}s'.format(value)
+
+
+if __name__ == '__main__':
+    clients_length = int(sys.argv[1]) if len(sys.argv) > 1 else CLIENTS_LENGTH
+    for name, nat_mix in SCENARIOS:
+        lossy = 'loss' in name
+        simulation = Simulation(
+            clients_length, nat_mix, seed=1,
+            loss=0.05 if lossy else 0.0,
+            reorder=0.1 if lossy else 0.0)
+        wall_start = time.perf_counter()
+        report = simulation.run(MAX_VIRTUAL_SECONDS)
+        print('{}: {}/{} done, time to done p50 {} p90 {} max {}, {:.1f} dgram per node, '
+              'punch success {:.0%}, {:.2f}s wall'.format(
+                  name, report['done'], report['clients'],
+                  format_seconds(report['time_to_done_p50']),
+                  format_seconds(report['time_to_done_p90']),
+                  format_seconds(report['time_to_done_max']),
+                  report['datagrams_per_node'], report['punch_success_rate'],
+                  time.perf_counter() - wall_start))
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+__author__ = 'Akinava'
+__author_email__ = 'akinava@gmail.com'
+__copyright__ = "Copyright © 2019"
+__license__ = "MIT License"
+__version__ = [0, 0]
+
+
+import sys
+import os
+import time
+import socket
+import asyncio
+import multiprocessing
+from pathlib import Path
+path = Path(os.path.dirname(os.path.realpath(__file__))).parent
+sys.path.append(os.path.join(path, 'src'))
+
+
+from batched_transport import create_batched_endpoint
+
+
+HOST = '127.0.0.1'
+RECEIVER_PORT = 2060
+DURATION_SECONDS = 3
+BURST_LENGTH = 64
+MESSAGE = b'x' * 128
+
+
+class CountProtocol(asyncio.DatagramProtocol):
+    def __init__(self):
+        self.received = 0
+
+    def datagram_received(self, raw_message, remote_addr):
+        self.received += 1
+
+
+def send_load(stop_time):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    while time.time() < stop_time:
+        for _ in range(BURST_LENGTH):
+            sock.sendto(MESSAGE, (HOST, RECEIVER_PORT))
+    sock.close()
+
+
+async def create_endpoint(batched, protocol_factory, port):
+    if batched:
+        return await create_batched_endpoint(protocol_factory, local_addr=(HOST, port))
+    loop = asyncio.get_running_loop()
+    return await loop.create_datagram_endpoint(protocol_factory, local_addr=(HOST, port))
+
+
+async def measure_receive(batched):
+    receiver, protocol = await create_endpoint(batched, CountProtocol, RECEIVER_PORT)
+    sender = multiprocessing.get_context('fork').Process(target=send_load, args=(time.time() + DURATION_SECONDS,))
+    cpu_start = time.process_time()
+    sender.start()
+    await asyncio.sleep(DURATION_SECONDS)
+    cpu_time = time.process_time() - cpu_start
+    received = protocol.received
+    sender.join()
+    receiver.close()
+    await asyncio.sleep(0)
+    return received / DURATION_SECONDS, cpu_time / max(received, 1)
+
+
+async def measure_send(batched):
+    # ping fan-out: one sendto per connection in a single loop iteration
+    receiver, protocol = await create_endpoint(batched, CountProtocol, RECEIVER_PORT)
+    sender, _ = await create_endpoint(batched, asyncio.DatagramProtocol, RECEIVER_PORT + 1)
+    sent = 0
+    cpu_start = time.process_time()
+    stop_time = time.time() + DURATION_SECONDS
+    while time.time() < stop_time:
+        for _ in range(BURST_LENGTH):
+            sender.sendto(MESSAGE, (HOST, RECEIVER_PORT))
+        sent += BURST_LENGTH
+        await asyncio.sleep(0)
+    cpu_time = time.process_time() - cpu_start
+    sender.close()
+    receiver.close()
+    await asyncio.sleep(0)
+    return sent / DURATION_SECONDS, cpu_time / sent
+
+
+if __name__ == '__main__':
+    for name, batched in (('asyncio transport', False), ('batched transport', True)):
+        for direction, measure in (('receive', measure_receive), ('send', measure_send)):
+            rate, cpu_per_packet = asyncio.run(measure(batched))
+            print('{} {}: {:.0f} packets/s, {:.2f} us cpu per packet'.format(
+                name, direction, rate, cpu_per_packet * 10 ** 6))
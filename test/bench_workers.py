@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+__author__ = 'Akinava'
+__author_email__ = 'akinava@gmail.com'
+__copyright__ = "Copyright © 2019"
+__license__ = "MIT License"
+__version__ = [0, 0]
+
+
+import sys
+import os
+import json
+import time
+import signal
+import socket
+import tempfile
+import multiprocessing
+from pathlib import Path
+path = Path(os.path.dirname(os.path.realpath(__file__))).parent
+sys.path.append(os.path.join(path, 'src'))
+
+
+import settings
+from workers import Workers
+
+
+HOST = '127.0.0.1'
+PORT = 2050
+UNREACHABLE_SERVER_PORT = 2051
+SOURCES_LENGTH = 64
+DURATION_SECONDS = 3
+COUNTER_STEP = 100
+PROTOCOL = {'package': []}
+context = multiprocessing.get_context('fork')
+handled = context.Value('L', 0)
+
+
+class BenchHandler:
+    # counts the datagrams the owner worker handles, after Admission and
+    # the WorkerChannel forwarding of the Client, the datagrams are empty
+    handled_in_worker = 0
+
+    def handle_datagram(self, raw_message, remote_addr):
+        BenchHandler.handled_in_worker += 1
+        if BenchHandler.handled_in_worker % COUNTER_STEP == 0:
+            with handled.get_lock():
+                handled.value += COUNTER_STEP
+        super(BenchHandler, self).handle_datagram(raw_message, remote_addr)
+
+
+def make_peers_file():
+    peers_file = tempfile.NamedTemporaryFile('w', suffix='.json', delete=False)
+    json.dump([{
+        'type': 'server',
+        'protocol': 'udp',
+        'host': HOST,
+        'port': UNREACHABLE_SERVER_PORT,
+        'pub_key': '1' * 44,
+    }], peers_file)
+    peers_file.close()
+    return peers_file.name
+
+
+def run_workers(workers_count):
+    try:
+        Workers(handler=BenchHandler, protocol=PROTOCOL, workers_count=workers_count).run()
+    except KeyboardInterrupt:
+        pass
+
+
+def send_load(stop_time):
+    sockets = [socket.socket(socket.AF_INET, socket.SOCK_DGRAM) for _ in range(SOURCES_LENGTH)]
+    while time.time() < stop_time:
+        for sock in sockets:
+            try:
+                sock.sendto(b'', (HOST, PORT))
+            except OSError:
+                pass
+    for sock in sockets:
+        sock.close()
+
+
+def measure(workers_count):
+    handled.value = 0
+    workers = context.Process(target=run_workers, args=(workers_count,))
+    workers.start()
+    time.sleep(1)
+    start_value = handled.value
+    stop_time = time.time() + DURATION_SECONDS
+    senders = [context.Process(target=send_load, args=(stop_time,)) for _ in range(2)]
+    for sender in senders:
+        sender.start()
+    for sender in senders:
+        sender.join()
+    received = handled.value - start_value
+    os.kill(workers.pid, signal.SIGINT)
+    workers.join()
+    return received / DURATION_SECONDS
+
+
+if __name__ == '__main__':
+    settings.local_host = HOST
+    settings.default_port = PORT
+    settings.peers_file = make_peers_file()
+    settings.batched_transport = False
+    settings.metrics_file = None
+    settings.metrics_port = None
+    # the bench floods from a few sources, the rate limits would shed it
+    settings.admission_source_rate = settings.admission_source_burst = 10 ** 9
+    settings.admission_global_rate = settings.admission_global_burst = 10 ** 9
+    max_workers = int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count()
+    workers_count = 1
+    try:
+        while workers_count <= max_workers:
+            print('{} workers: {:.0f} dgram/s handled by the owner worker'.format(workers_count, measure(workers_count)))
+            workers_count *= 2
+    finally:
+        for file_name in (settings.peers_file, settings.peers_file + '.log'):
+            if os.path.exists(file_name):
+                os.remove(file_name)
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+__author__ = 'Akinava'
+__author_email__ = 'akinava@gmail.com'
+__copyright__ = "Copyright © 2019"
+__license__ = "MIT License"
+__version__ = [0, 0]
+
+
+import sys
+import os
+from pathlib import Path
+path = Path(os.path.dirname(os.path.realpath(__file__))).parent
+sys.path.append(os.path.join(path, 'src'))
+
+
+import pytest
+from utilit import Singleton
+from state_writer import StateWriter
+
+
+def get_subclasses(base_class):
+    for subclass in base_class.__subclasses__():
+        yield subclass
+        yield from get_subclasses(subclass)
+
+
+@pytest.fixture(autouse=True)
+def singletons(monkeypatch):
+    # utilit.Singleton keeps one instance per process, every test gets its
+    # own Peers, Delivery, Keepalive and the rest; StateWriter is shared,
+    # single_writer took it when the modules were imported
+    instances = {}
+
+    def get_instance(singleton_class, *args, **kwargs):
+        instance = instances.get(singleton_class)
+        if instance is None:
+            instance = object.__new__(singleton_class)
+            instances[singleton_class] = instance
+        return instance
+
+    for singleton_class in set(get_subclasses(Singleton)):
+        if singleton_class is not StateWriter:
+            monkeypatch.setattr(singleton_class, '__new__', staticmethod(get_instance))
+    return instances
+
+
+@pytest.fixture
+def peers_file(tmp_path, monkeypatch):
+    peers_file = tmp_path / 'peers.json'
+    peers_file.write_text('[]')
+    monkeypatch.setattr('settings.peers_file', str(peers_file))
+    return str(peers_file)
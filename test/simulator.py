@@ -0,0 +1,433 @@
+# -*- coding: utf-8 -*-
+__author__ = 'Akinava'
+__author_email__ = 'akinava@gmail.com'
+__copyright__ = "Copyright © 2019"
+__license__ = "MIT License"
+__version__ = [0, 0]
+
+
+import os
+import json
+import random
+import asyncio
+import itertools
+import selectors
+import tempfile
+import contextvars
+from datetime import datetime
+import settings
+from utilit import Singleton
+from cryptotool import B58
+from host import Host
+from handler import Handler
+from datagram import Datagram
+from protocol import PROTOCOL
+from net_pool import NetPool
+from client_host import Client
+from peers import Peers
+from metrics import Metrics
+
+
+SWARM_PROTOCOL = {'package': []}
+
+
+class VirtualSelector(selectors.SelectSelector):
+    # nothing is ever ready, waiting for the next timer moves the clock
+    def __init__(self, clock):
+        super(VirtualSelector, self).__init__()
+        self.clock = clock
+
+    def select(self, timeout=None):
+        if timeout is not None and timeout > 0:
+            self.clock.now += timeout
+        return []
+
+
+class VirtualClock(asyncio.SelectorEventLoop):
+    # the asyncio loop of the simulation, loop.time() is virtual and the
+    # Client timers, sleeps and wheels run without waiting; the swarm
+    # backoff, FingerprintCache and Admission read it through get_loop_time
+    def __init__(self):
+        self.now = 0.0
+        super(VirtualClock, self).__init__(selector=VirtualSelector(self))
+
+    def time(self):
+        return self.now
+
+
+class NodeState:
+    # utilit.Singleton keeps one instance per process, in the simulator
+    # every node gets its own Peers, Delivery, Keepalive, Metrics and the
+    # rest; a callback of the node runs in its context and finds them there
+    current = contextvars.ContextVar('node_state', default=None)
+    shared = None
+
+    def __init__(self, node=None):
+        self.node = node
+        self.instances = {}
+        self.context = contextvars.copy_context()
+        self.context.run(self.current.set, self)
+
+    def run(self, callback, *args):
+        return self.context.run(callback, *args)
+
+    @classmethod
+    def install(cls):
+        if cls.shared is not None:
+            return
+        cls.shared = NodeState()
+        for singleton_class in cls.__get_subclasses(Singleton):
+            singleton_class.__new__ = staticmethod(cls.__get_instance)
+
+    @classmethod
+    def __get_subclasses(cls, base_class):
+        for subclass in base_class.__subclasses__():
+            yield subclass
+            yield from cls.__get_subclasses(subclass)
+
+    @staticmethod
+    def __get_instance(singleton_class, *args, **kwargs):
+        state = NodeState.current.get() or NodeState.shared
+        instance = state.instances.get(singleton_class)
+        if instance is None:
+            instance = object.__new__(singleton_class)
+            state.instances[singleton_class] = instance
+        return instance
+
+
+class Nat:
+    # full cone, restricted and port restricted keep one public port per
+    # internal endpoint, symmetric takes a new one for every destination
+    full_cone = 'full cone'
+    restricted = 'restricted'
+    port_restricted = 'port restricted'
+    symmetric = 'symmetric'
+
+    def __init__(self, nat_type, public_host, random_generator):
+        self.nat_type = nat_type
+        self.public_host = public_host
+        self.random = random_generator
+        self.__mappings = {}
+        self.__internal_by_port = {}
+        self.__permissions = {}
+
+    def translate_outbound(self, internal_addr, remote_addr):
+        mapping_key = (internal_addr, remote_addr) if self.nat_type == self.symmetric else internal_addr
+        public_port = self.__mappings.get(mapping_key)
+        if public_port is None:
+            public_port = self.__allocate_port()
+            self.__mappings[mapping_key] = public_port
+            self.__internal_by_port[public_port] = internal_addr
+        self.__permissions.setdefault(public_port, set()).add(remote_addr)
+        return self.public_host, public_port
+
+    def translate_inbound(self, public_port, remote_addr):
+        internal_addr = self.__internal_by_port.get(public_port)
+        if internal_addr is None:
+            return None
+        if self.nat_type == self.full_cone:
+            return internal_addr
+        permissions = self.__permissions.get(public_port, ())
+        if self.nat_type == self.restricted:
+            if any(host == remote_addr[0] for host, _ in permissions):
+                return internal_addr
+            return None
+        if remote_addr in permissions:
+            return internal_addr
+        return None
+
+    def __allocate_port(self):
+        while True:
+            public_port = self.random.randint(1024, 65535)
+            if public_port not in self.__internal_by_port:
+                return public_port
+
+
+class Network:
+    def __init__(self, clock, seed=0, latency=0.03, jitter=0.01, loss=0.0, reorder=0.0):
+        self.clock = clock
+        self.random = random.Random(seed)
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.reorder = reorder
+        self.sent = 0
+        self.delivered = 0
+        self.__endpoints = {}
+        self.__nats = {}
+        self.__host_counter = itertools.count(1)
+        # arrivals run outside of any node, the receiver context is entered on delivery
+        self.__context = contextvars.Context()
+
+    def add_nat(self, nat_type):
+        public_host = '203.0.{}.{}'.format(*divmod(next(self.__host_counter), 256))
+        nat = Nat(nat_type, public_host, self.random)
+        self.__nats[public_host] = nat
+        return nat
+
+    def create_endpoint(self, protocol, node_state, nat=None, port=2004):
+        host_number = next(self.__host_counter)
+        if nat is None:
+            host = '198.51.{}.{}'.format(*divmod(host_number, 256))
+        else:
+            host = '10.{}.{}.{}'.format(host_number >> 16 & 0xff, host_number >> 8 & 0xff, host_number & 0xff)
+        transport = SimTransport(self, (host, port), protocol, node_state, nat)
+        self.__endpoints[(host, port)] = transport
+        protocol.connection_made(transport)
+        return transport
+
+    def send(self, transport, data, remote_addr):
+        self.sent += 1
+        if transport.nat is None:
+            source_addr = transport.local_addr
+        else:
+            source_addr = transport.nat.translate_outbound(transport.local_addr, remote_addr)
+        if self.random.random() < self.loss:
+            return
+        delay = self.latency + self.random.uniform(0, self.jitter)
+        if self.random.random() < self.reorder:
+            delay += self.random.uniform(0, self.latency * 2)
+        self.clock.call_later(delay, self.__arrive, bytes(data), source_addr, remote_addr, context=self.__context)
+
+    def __arrive(self, data, source_addr, remote_addr):
+        nat = self.__nats.get(remote_addr[0])
+        if nat is None:
+            endpoint_addr = remote_addr
+        else:
+            endpoint_addr = nat.translate_inbound(remote_addr[1], source_addr)
+        transport = self.__endpoints.get(endpoint_addr)
+        if transport is None or transport.is_closing():
+            return
+        self.delivered += 1
+        transport.node_state.run(transport.protocol.datagram_received, data, source_addr)
+
+
+class SimTransport:
+    # the part of asyncio.DatagramTransport the listener code uses
+    def __init__(self, network, local_addr, protocol, node_state, nat):
+        self.network = network
+        self.local_addr = local_addr
+        self.protocol = protocol
+        self.node_state = node_state
+        self.nat = nat
+        self.sent = 0
+        self.__closing = False
+
+    def sendto(self, data, addr=None):
+        if self.__closing:
+            return
+        self.sent += 1
+        self.network.send(self, data, addr)
+
+    def get_extra_info(self, name, default=None):
+        if name == 'sockname':
+            return self.local_addr
+        return default
+
+    def is_closing(self):
+        return self.__closing
+
+    def close(self):
+        self.__closing = True
+
+
+HPN_SERVER_RESPONSE = next(
+    package['response'] for package in PROTOCOL['package'] if package['name'] == 'hpn_neighbours_client_request')
+
+
+class HpnServerDatagram(Datagram):
+    def __init__(self, connection, clients):
+        super(HpnServerDatagram, self).__init__(connection)
+        self.clients = clients
+
+
+class HpnServerClients(Singleton):
+    def __init__(self):
+        if hasattr(self, 'clients'):
+            return
+        self.clients = []
+        self.addrs = set()
+        self.random = random.Random(0)
+
+
+class HpnServerHandler(Handler):
+    # the part of the hpn server the swarm needs: the requester gets a list
+    # of known clients and every listed client gets the requester
+    neighbours_length = 4
+
+    def send_neighbours(self, request):
+        server_clients = HpnServerClients()
+        requester = request.connection
+        requester.set_pub_key(request.unpack_message['requester_pub_key'])
+        requester.set_encrypt_marker(request.unpack_message['encrypted_request_marker'])
+        neighbours = [client for client in server_clients.clients if client.get_remote_addr() != requester.get_remote_addr()]
+        neighbours = server_clients.random.sample(neighbours, min(self.neighbours_length, len(neighbours)))
+        self.send(request=request, response=HpnServerDatagram(requester, neighbours))
+        for neighbour in neighbours:
+            self.send(request=request, response=HpnServerDatagram(neighbour, [requester]))
+        if requester.get_remote_addr() not in server_clients.addrs:
+            server_clients.addrs.add(requester.get_remote_addr())
+            server_clients.clients.append(requester)
+
+    def get_disconnect_flag(self, **kwargs):
+        return 0
+
+    def get_hpn_clients_list(self, **kwargs):
+        structure = self.parser().protocol['list']['hpn_clients_list']['structure']
+        return [self.make_message_by_structure(structure=structure, client_data=client)
+                for client in kwargs['response'].clients]
+
+    def get_hpn_clients_addr(self, **kwargs):
+        return kwargs['client_data'].get_remote_addr()
+
+    def get_hpn_clients_pub_key(self, **kwargs):
+        return kwargs['client_data'].get_pub_key()
+
+
+setattr(HpnServerHandler, HPN_SERVER_RESPONSE, HpnServerHandler.send_neighbours)
+
+
+class SimListener:
+    # the listener of the host is an endpoint of the simulated network
+    def __init__(self, network, node_state, nat=None, **kwargs):
+        self.network = network
+        self.node_state = node_state
+        self.nat = nat
+        super(SimListener, self).__init__(**kwargs)
+
+    async def create_default_listener(self):
+        self.listen()
+
+    def listen(self):
+        self.default_listener = self.network.create_endpoint(self.handler(), self.node_state, nat=self.nat)
+
+
+class SimHost(SimListener, Host):
+    pass
+
+
+class SimClient(SimListener, Client):
+    pass
+
+
+class SwarmHandler:
+    def init(self):
+        NodeState.current.get().node.swarm_done()
+
+
+class SimNode:
+    def __init__(self, simulation, nat_type, work_dir, node_index):
+        self.simulation = simulation
+        self.nat_type = nat_type
+        self.peers_file = os.path.join(work_dir, 'peers{}.json'.format(node_index))
+        self.shadow_file = os.path.join(work_dir, 'shadow{}'.format(node_index))
+        self.state = NodeState(self)
+        self.client = None
+        self.start_time = None
+        self.done_time = None
+
+    def is_done(self):
+        return self.done_time is not None
+
+    def start(self):
+        self.state.run(self.__start)
+
+    def __start(self):
+        # settings are module wide, everything that reads them is created
+        # here before another node runs
+        settings.peers_file = self.peers_file
+        settings.shadow_file = self.shadow_file
+        with open(self.peers_file, 'w') as f:
+            json.dump([self.simulation.server_peer], f)
+        simulation = self.simulation
+        nat = None if self.nat_type is None else simulation.network.add_nat(self.nat_type)
+        self.client = SimClient(
+            simulation.network, self.state, nat=nat, handler=SwarmHandler, protocol=SWARM_PROTOCOL)
+        Peers()
+        self.start_time = simulation.clock.time()
+        asyncio.ensure_future(self.client.run())
+
+    def swarm_done(self):
+        if self.is_done():
+            return
+        self.done_time = self.simulation.clock.time()
+        self.simulation.swarm_done()
+
+    def get_sent(self):
+        listener = getattr(self.client, 'default_listener', None)
+        return 0 if listener is None else listener.sent
+
+    def get_counter_sum(self, name):
+        return sum(value for key, value in Metrics().get_snapshot().items() if key.startswith(name))
+
+
+class Simulation:
+    def __init__(self, clients_length, nat_mix, seed=0, latency=0.03, jitter=0.01, loss=0.0, reorder=0.0,
+                 start_spread=5):
+        NodeState.install()
+        settings.workers = 1
+        settings.batched_transport = False
+        settings.metrics_file = None
+        settings.metrics_port = None
+        self.clock = VirtualClock()
+        self.network = Network(self.clock, seed=seed, latency=latency, jitter=jitter, loss=loss, reorder=reorder)
+        self.random = random.Random(seed)
+        self.work_dir = tempfile.mkdtemp()
+        self.done_length = 0
+        self.server_state = NodeState()
+        self.server = self.server_state.run(self.__create_server)
+        self.server_peer = self.server_state.run(self.__get_server_peer)
+        self.clients = []
+        nat_types = list(nat_mix)
+        weights = [nat_mix[nat_type] for nat_type in nat_types]
+        for node_index in range(clients_length):
+            nat_type = self.random.choices(nat_types, weights)[0]
+            node = SimNode(self, nat_type, self.work_dir, node_index)
+            self.clock.call_later(self.random.uniform(0, start_spread), node.start)
+            self.clients.append(node)
+
+    def __create_server(self):
+        settings.shadow_file = os.path.join(self.work_dir, 'server_shadow')
+        server = SimHost(self.network, self.server_state, net_pool=NetPool, handler=HpnServerHandler, protocol=PROTOCOL)
+        server.listen()
+        return server
+
+    def __get_server_peer(self):
+        host, port = self.server.default_listener.local_addr
+        pub_key = self.server.handler().crypt_tools.get_pub_key()
+        return {
+            'type': 'server',
+            'protocol': 'udp',
+            'host': host,
+            'port': port,
+            'pub_key': B58().pack(pub_key),
+            'last_response': datetime.now().strftime(settings.DATA_FORMAT),
+        }
+
+    def swarm_done(self):
+        # counted by the nodes, the loop is not scanned after every event
+        self.done_length += 1
+        if self.done_length == len(self.clients):
+            self.clock.stop()
+
+    def run(self, max_seconds):
+        stop_timer = self.clock.call_at(max_seconds, self.clock.stop)
+        self.clock.run_forever()
+        stop_timer.cancel()
+        return self.get_report()
+
+    def get_report(self):
+        started_clients = [client for client in self.clients if client.start_time is not None]
+        done_times = sorted(client.done_time - client.start_time for client in started_clients if client.is_done())
+        punch_delivered = sum(client.state.run(client.get_counter_sum, 'punch_delivered') for client in started_clients)
+        punch_lost = sum(client.state.run(client.get_counter_sum, 'punch_lost') for client in started_clients)
+        return {
+            'clients': len(self.clients),
+            'done': len(done_times),
+            'time_to_done_p50': done_times[len(done_times) // 2] if done_times else None,
+            'time_to_done_p90': done_times[int(len(done_times) * 0.9)] if done_times else None,
+            'time_to_done_max': done_times[-1] if done_times else None,
+            'datagrams_per_node': sum(client.get_sent() for client in started_clients) / len(self.clients),
+            'punch_success_rate': punch_delivered / max(punch_delivered + punch_lost, 1),
+            'virtual_seconds': self.clock.time(),
+        }
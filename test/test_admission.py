@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+__author__ = 'Akinava'
+__author_email__ = 'akinava@gmail.com'
+__copyright__ = "Copyright © 2019"
+__license__ = "MIT License"
+__version__ = [0, 0]
+
+
+import pytest
+from admission import Admission
+
+
+FINGERPRINT_LENGTH = 32
+PROTOCOL = {
+    'package': [
+        {
+            'name': 'test_fixed',
+            'package_id_marker': 0x80,
+            'structure': [
+                {'name': ('major_protocol_version_marker', 'minor_protocol_version_marker'), 'length': 1, 'type': 'markers'},
+                {'name': 'package_id_marker', 'length': 1, 'type': 'int'},
+                {'name': 'receiver_fingerprint', 'length': FINGERPRINT_LENGTH}]
+        },
+        {
+            'name': 'test_variable',
+            'package_id_marker': 0x81,
+            'structure': [
+                {'name': ('major_protocol_version_marker', 'minor_protocol_version_marker'), 'length': 1, 'type': 'markers'},
+                {'name': 'package_id_marker', 'length': 1, 'type': 'int'},
+                {'name': 'receiver_fingerprint', 'length': FINGERPRINT_LENGTH},
+                {'name': 'test_message', 'length': {'min': 1, 'max': 100}}]
+        },
+    ],
+}
+SOURCE = ('10.0.0.1', 2004)
+
+
+def make_message(package_id, length):
+    return bytes([0x00, package_id]) + bytes(length - 2)
+
+
+@pytest.fixture
+def admission(monkeypatch):
+    monkeypatch.setattr('settings.request_encrypted_protocol', False)
+    monkeypatch.setattr('settings.admission_source_rate', 10 ** 9)
+    monkeypatch.setattr('settings.admission_source_burst', 10 ** 9)
+    monkeypatch.setattr('settings.admission_global_rate', 10 ** 9)
+    monkeypatch.setattr('settings.admission_global_burst', 10 ** 9)
+    monkeypatch.setattr('settings.admission_sources_max', 4)
+    Admission().compile(PROTOCOL)
+    return Admission()
+
+
+def test_known_layouts_are_admitted(admission):
+    assert admission.admit(make_message(0x80, 2 + FINGERPRINT_LENGTH), SOURCE, known_source=False)
+    assert admission.admit(make_message(0x81, 2 + FINGERPRINT_LENGTH + 1), SOURCE, known_source=False)
+    # a variable length field leaves the top length open
+    assert admission.admit(make_message(0x81, 2 + FINGERPRINT_LENGTH + 1000), SOURCE, known_source=False)
+
+
+def test_short_and_unknown_packages_are_dropped(admission):
+    assert not admission.admit(make_message(0x80, 2 + FINGERPRINT_LENGTH - 1), SOURCE, known_source=False)
+    assert not admission.admit(make_message(0x80, 2 + FINGERPRINT_LENGTH + 1), SOURCE, known_source=False)
+    assert not admission.admit(make_message(0x82, 2 + FINGERPRINT_LENGTH), SOURCE, known_source=False)
+
+
+def test_empty_datagram_skips_layout_check(admission):
+    assert admission.admit(b'', SOURCE, known_source=False)
+
+
+def test_encrypted_protocol_skips_package_id(admission, monkeypatch):
+    monkeypatch.setattr('settings.request_encrypted_protocol', True)
+    assert admission.admit(make_message(0x82, 2 + FINGERPRINT_LENGTH), SOURCE, known_source=False)
+    assert not admission.admit(make_message(0x82, 2 + FINGERPRINT_LENGTH - 1), SOURCE, known_source=False)
+
+
+def test_source_rate_is_limited(admission, monkeypatch):
+    monkeypatch.setattr('settings.admission_source_rate', 0)
+    monkeypatch.setattr('settings.admission_source_burst', 2)
+    message = make_message(0x80, 2 + FINGERPRINT_LENGTH)
+    other_source = ('10.0.0.2', 2004)
+    assert [admission.admit(message, SOURCE, known_source=True) for _ in range(3)] == [True, True, False]
+    assert admission.admit(message, other_source, known_source=True)
+
+
+def test_global_rate_spares_known_sources(monkeypatch):
+    monkeypatch.setattr('settings.admission_source_rate', 10 ** 9)
+    monkeypatch.setattr('settings.admission_source_burst', 10 ** 9)
+    monkeypatch.setattr('settings.admission_global_rate', 0)
+    monkeypatch.setattr('settings.admission_global_burst', 2)
+    admission = Admission()
+    admission.compile(PROTOCOL)
+    message = make_message(0x80, 2 + FINGERPRINT_LENGTH)
+    strangers = [('10.0.1.{}'.format(number), 2004) for number in range(3)]
+    assert [admission.admit(message, stranger, known_source=False) for stranger in strangers] == [True, True, False]
+    assert admission.admit(message, SOURCE, known_source=True)
+
+
+def test_tokens_refill_on_the_loop_clock(admission, monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr('admission.get_loop_time', lambda: clock[0])
+    monkeypatch.setattr('settings.admission_source_rate', 1)
+    monkeypatch.setattr('settings.admission_source_burst', 1)
+    message = make_message(0x80, 2 + FINGERPRINT_LENGTH)
+    assert admission.admit(message, SOURCE, known_source=True)
+    assert not admission.admit(message, SOURCE, known_source=True)
+    clock[0] += 1
+    assert admission.admit(message, SOURCE, known_source=True)
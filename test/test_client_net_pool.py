@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+__author__ = 'Akinava'
+__author_email__ = 'akinava@gmail.com'
+__copyright__ = "Copyright © 2019"
+__license__ = "MIT License"
+__version__ = [0, 0]
+
+
+from client_net_pool import ClientNetPool
+from client_connection import ClientConnection, ConnectionType
+
+
+def make_connection(net_pool, number, connection_type=ConnectionType.client):
+    connection = net_pool.create_connection(('10.0.0.{}'.format(number), 2004), None)
+    connection.set_pub_key(number.to_bytes(64, 'big'))
+    connection.type = connection_type
+    return connection
+
+
+def test_add_connection_indexes_addr_fingerprint_and_type():
+    net_pool = ClientNetPool()
+    client = make_connection(net_pool, 1)
+    server = make_connection(net_pool, 2, ConnectionType.server)
+    net_pool.add_connection(client)
+    net_pool.add_connection(server)
+    assert net_pool.get_connection_by_addr(client.get_remote_addr()) is client
+    assert net_pool.get_connection_by_fingerprint(client.get_fingerprint()) is client
+    assert net_pool.create_connection(client.get_remote_addr(), None) is client
+    assert net_pool.get_all_client_connections() == [client]
+    assert net_pool.get_server_connections() == [server]
+    assert net_pool.is_client_connection(client)
+    assert not net_pool.is_client_connection(server)
+    assert len(net_pool.connections_list) == 2
+
+
+def test_add_connection_keeps_the_pooled_connection():
+    net_pool = ClientNetPool()
+    connection = make_connection(net_pool, 1)
+    net_pool.add_connection(connection)
+    duplicate = ClientConnection(remote_addr=connection.get_remote_addr(), transport=None)
+    duplicate.set_pub_key(connection.get_pub_key())
+    duplicate.type = ConnectionType.client
+    net_pool.add_connection(duplicate)
+    assert net_pool.get_connection_by_addr(connection.get_remote_addr()) is connection
+    assert net_pool.get_all_client_connections() == [connection]
+
+
+def test_disconnect_removes_every_index():
+    net_pool = ClientNetPool()
+    connections = [make_connection(net_pool, number) for number in range(1, 4)]
+    for connection in connections:
+        net_pool.add_connection(connection)
+    net_pool.disconnect(connections[0])
+    assert net_pool.get_connection_by_addr(connections[0].get_remote_addr()) is None
+    assert net_pool.get_connection_by_fingerprint(connections[0].get_fingerprint()) is None
+    assert sorted(net_pool.get_all_client_connections(), key=id) == sorted(connections[1:], key=id)
+    assert len(net_pool.connections_list) == 2
+
+
+def test_set_connection_type_moves_group():
+    net_pool = ClientNetPool()
+    connection = make_connection(net_pool, 1)
+    net_pool.add_connection(connection)
+    net_pool.set_connection_type(connection, ConnectionType.server)
+    assert net_pool.get_all_client_connections() == []
+    assert net_pool.get_server_connections() == [connection]
+
+
+def test_pending_connection_is_found_but_not_counted():
+    net_pool = ClientNetPool()
+    connection = make_connection(net_pool, 1)
+    net_pool.add_pending_connection(connection)
+    assert net_pool.is_pending_connection(connection)
+    assert net_pool.create_connection(connection.get_remote_addr(), None) is connection
+    assert net_pool.get_connection_by_fingerprint(connection.get_fingerprint()) is connection
+    assert net_pool.get_connection_by_addr(connection.get_remote_addr()) is None
+    assert net_pool.get_all_client_connections() == []
+    assert not net_pool.has_client_connection()
+
+
+def test_confirm_moves_pending_connection_in_pool():
+    net_pool = ClientNetPool()
+    connection = make_connection(net_pool, 1)
+    net_pool.add_pending_connection(connection)
+    net_pool.confirm_connection(connection)
+    assert not net_pool.is_pending_connection(connection)
+    assert net_pool.get_all_client_connections() == [connection]
+    assert net_pool.get_connection_by_fingerprint(connection.get_fingerprint()) is connection
+
+
+def test_disconnect_drops_pending_connection():
+    net_pool = ClientNetPool()
+    connection = make_connection(net_pool, 1)
+    net_pool.add_pending_connection(connection)
+    net_pool.disconnect(connection)
+    assert not net_pool.is_pending_connection(connection)
+    assert net_pool.get_connection_by_fingerprint(connection.get_fingerprint()) is None
+    net_pool.confirm_connection(connection)
+    assert net_pool.get_all_client_connections() == []
+
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+__author__ = 'Akinava'
+__author_email__ = 'akinava@gmail.com'
+__copyright__ = "Copyright © 2019"
+__license__ = "MIT License"
+__version__ = [0, 0]
+
+
+import socket
+import struct
+import pytest
+from cryptotool import B58
+from client_handler import ClientHandler
+from codec import Codecs
+
+
+PUB_KEY_LENGTH = 64
+SERVERS_LIST_STRUCTURE = [
+    {'name': 'hpn_servers_pub_key', 'length': PUB_KEY_LENGTH},
+    {'name': 'hpn_servers_protocol', 'length': 3, 'type': 'str'},
+    {'name': 'hpn_servers_addr', 'length': 6, 'type': 'addr'}]
+PROTOCOL = {
+    'package': [
+        {
+            'name': 'test_fixed',
+            'package_id_marker': 0x80,
+            'structure': [
+                {'name': ('major_protocol_version_marker', 'minor_protocol_version_marker'), 'length': 1, 'type': 'markers'},
+                {'name': 'package_id_marker', 'length': 1, 'type': 'int'},
+                {'name': 'test_flag', 'length': 1, 'type': 'bool'}]
+        },
+        {
+            'name': 'test_variable',
+            'package_id_marker': 0x81,
+            'structure': [
+                {'name': 'package_id_marker', 'length': 1, 'type': 'int'},
+                {'name': 'test_message', 'length': {'min': 1, 'max': 100}}]
+        },
+    ],
+    'list': {
+        'hpn_servers_list': {
+            'length': {'min': 0, 'max': 10},
+            'structure': SERVERS_LIST_STRUCTURE,
+        },
+    },
+    'marker': [
+        {'name': 'major_protocol_version_marker', 'start_bit': 0, 'length': 4, 'type': 'int_marker'},
+        {'name': 'minor_protocol_version_marker', 'start_bit': 4, 'length': 4, 'type': 'int_marker'},
+    ],
+}
+SERVER_DATA = {
+    'pub_key': B58().pack(bytes(range(PUB_KEY_LENGTH))),
+    'protocol': 'udp',
+    'host': '10.0.0.1',
+    'port': 2004,
+}
+
+
+class FixedHandler:
+    def get_major_protocol_version_marker(self, **kwargs):
+        return 1
+
+    def get_minor_protocol_version_marker(self, **kwargs):
+        return 2
+
+    def get_package_id_marker(self, **kwargs):
+        return 0x80
+
+    def get_test_flag(self, **kwargs):
+        return True
+
+
+class Parser:
+    def __init__(self, protocol):
+        self.protocol = protocol
+
+
+class ServersListHandler(ClientHandler):
+    # make_message_by_structure stands for the protocol parser, it counts
+    # the calls and can be made to disagree with the codec
+    def __init__(self, parser_message=None):
+        self.parser_message = parser_message
+        self.structure_calls = 0
+
+    def parser(self):
+        return Parser(PROTOCOL)
+
+    def make_message_by_structure(self, structure, **kwargs):
+        self.structure_calls += 1
+        if self.parser_message is not None:
+            return self.parser_message
+        return get_server_message(kwargs['server_data'])
+
+
+def get_server_message(server_data):
+    return B58().unpack(server_data['pub_key']) + server_data['protocol'].encode() + \
+        socket.inet_aton(server_data['host']) + struct.pack('>H', server_data['port'])
+
+
+@pytest.fixture(autouse=True)
+def codecs():
+    Codecs().compile(PROTOCOL)
+
+
+def test_fixed_layouts_are_compiled():
+    assert Codecs().get_codec('test_fixed') is not None
+    assert Codecs().get_codec('hpn_servers_list') is not None
+    assert Codecs().get_codec('test_variable') is None
+
+
+def test_pack_fixed_layout():
+    codec = Codecs().get_codec('test_fixed')
+    assert codec.pack(codec.get_values(FixedHandler())) == bytes([0x12, 0x80, 0x01])
+
+
+def test_verify_keeps_matching_codec():
+    codec = Codecs().get_codec('test_fixed')
+    Codecs().verify(codec, codec.pack(codec.get_values(FixedHandler())), bytes([0x12, 0x80, 0x01]))
+    assert codec.verified
+    assert Codecs().get_codec('test_fixed') is codec
+
+
+def test_verify_disables_codec_that_does_not_match():
+    codec = Codecs().get_codec('test_fixed')
+    Codecs().verify(codec, codec.pack(codec.get_values(FixedHandler())), bytes([0x12, 0x80, 0x00]))
+    assert not codec.verified
+    assert Codecs().get_codec('test_fixed') is None
+
+
+def test_pack_server_uses_codec_once_verified():
+    handler = ServersListHandler()
+    assert handler.pack_server(SERVER_DATA) == get_server_message(SERVER_DATA)
+    assert Codecs().get_codec('hpn_servers_list').verified
+    assert handler.pack_server(SERVER_DATA) == get_server_message(SERVER_DATA)
+    assert handler.structure_calls == 1
+
+
+def test_pack_server_falls_back_to_parser():
+    parser_message = b'parser' + get_server_message(SERVER_DATA)
+    handler = ServersListHandler(parser_message=parser_message)
+    assert handler.pack_server(SERVER_DATA) == parser_message
+    assert Codecs().get_codec('hpn_servers_list') is None
+    assert handler.pack_server(SERVER_DATA) == parser_message
+    assert handler.structure_calls == 2
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+__author__ = 'Akinava'
+__author_email__ = 'akinava@gmail.com'
+__copyright__ = "Copyright © 2019"
+__license__ = "MIT License"
+__version__ = [0, 0]
+
+
+import asyncio
+import pytest
+from delivery import Delivery
+from peer_score import PeerScore
+
+
+TIMEOUT_SECONDS = 0.1
+
+
+class DeliveryConnection:
+    # the part of ClientConnection Delivery reads
+    def __init__(self, remote_addr, received=False):
+        self.remote_addr = remote_addr
+        self.received = received
+        self.sent_length = 0
+        self.score = PeerScore()
+
+    def get_remote_addr(self):
+        return self.remote_addr
+
+    def message_was_never_received(self):
+        return not self.received
+
+    def last_sent_message_is_over_ping_time(self):
+        return True
+
+    def send(self):
+        self.sent_length += 1
+
+
+@pytest.fixture(autouse=True)
+def delivery_settings(monkeypatch):
+    monkeypatch.setattr('settings.peer_timeout_seconds', TIMEOUT_SECONDS)
+    monkeypatch.setattr('settings.peer_ping_time_seconds', 1)
+
+
+def deliver_batch(connections, answer_later=(), timeout=None):
+    async def run():
+        loop = asyncio.get_running_loop()
+        for connection, verified in answer_later:
+            loop.call_later(TIMEOUT_SECONDS / 4, answer, connection, verified)
+        return await Delivery().deliver_batch([(connection, connection.send) for connection in connections], timeout)
+
+    def answer(connection, verified):
+        connection.received = verified
+        Delivery().received(connection.get_remote_addr())
+
+    return asyncio.run(run())
+
+
+def test_batch_reports_delivered_and_lost():
+    answering = DeliveryConnection(('10.0.0.1', 2004))
+    silent = DeliveryConnection(('10.0.0.2', 2004))
+    delivered = deliver_batch([answering, silent], answer_later=[(answering, True)])
+    assert delivered == [True, False]
+    assert answering.sent_length == 1
+    assert silent.sent_length == 1
+    assert answering.score.get_weight() > silent.score.get_weight()
+
+
+def test_connection_that_already_answered_is_not_sent_again():
+    connection = DeliveryConnection(('10.0.0.1', 2004), received=True)
+    assert deliver_batch([connection]) == [True]
+    assert connection.sent_length == 0
+
+
+def test_unverified_datagram_does_not_deliver():
+    # the handler did not verify the datagram, the waiter stays until expiry
+    connection = DeliveryConnection(('10.0.0.1', 2004))
+    assert deliver_batch([connection], answer_later=[(connection, False)]) == [False]
+
+
+def test_batch_expires_on_own_timeout(monkeypatch):
+    monkeypatch.setattr('settings.peer_timeout_seconds', 1)
+    connection = DeliveryConnection(('10.0.0.1', 2004))
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        start_time = loop.time()
+        delivered = await Delivery().deliver_batch([(connection, connection.send)], timeout=TIMEOUT_SECONDS / 2)
+        return delivered, loop.time() - start_time
+
+    delivered, seconds = asyncio.run(run())
+    assert delivered == [False]
+    assert TIMEOUT_SECONDS / 2 <= seconds < 1
+
+
+def test_waiters_are_removed_after_batch():
+    connection = DeliveryConnection(('10.0.0.1', 2004))
+    deliver_batch([connection])
+    assert Delivery()._Delivery__waiters == {}
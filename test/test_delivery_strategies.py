@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+__author__ = 'Akinava'
+__author_email__ = 'akinava@gmail.com'
+__copyright__ = "Copyright © 2019"
+__license__ = "MIT License"
+__version__ = [0, 0]
+
+
+import asyncio
+import pytest
+from client_handler import ClientHandler
+from client_net_pool import ClientNetPool
+from client_connection import ClientConnection, ConnectionType
+from datagram import Datagram
+from delivery import Delivery
+from metrics import Metrics
+from peers import Peers
+from relay import RelayProbeDatagram
+
+
+TIER_TIMEOUT_SECONDS = 0.1
+ANSWER_SECONDS = 0.01
+RELAY_ADDR = ('10.0.1.1', 2004)
+
+
+class Network:
+    # the peers that answer a direct, a predicted or a relayed datagram
+    def __init__(self):
+        self.direct = set()
+        self.via_relay = set()
+        self.answered = set()
+
+
+class ProbeResponse:
+    def __init__(self, connection, relay_addr, relay_reachable):
+        self.connection = connection
+        self.unpack_message = {'relay_addr': relay_addr, 'relay_reachable': int(relay_reachable)}
+
+
+class StrategyHandler(ClientHandler):
+    # the datagrams of the handler go to Network instead of the transport
+    def __init__(self, net_pool, network):
+        self.net_pool = net_pool
+        self.network = network
+        self.transport = None
+
+    def send(self, request, response):
+        response.package_protocol = {'name': 'test_punch'}
+        addr = response.connection.get_remote_addr()
+        loop = asyncio.get_running_loop()
+        if isinstance(response, RelayProbeDatagram):
+            reachable = response.relay_addr in self.network.via_relay
+            loop.call_later(ANSWER_SECONDS, self.handle_relay_probe_response,
+                            ProbeResponse(response.connection, response.relay_addr, reachable))
+            return
+        if response.connection.relay is not None:
+            if addr in self.network.via_relay:
+                loop.call_later(ANSWER_SECONDS, self.answer, addr)
+            return
+        if addr in self.network.direct:
+            loop.call_later(ANSWER_SECONDS, self.answer, addr)
+
+    def answer(self, addr):
+        self.network.answered.add(addr)
+        Delivery().received(addr)
+
+
+@pytest.fixture(autouse=True)
+def strategy_settings(monkeypatch, peers_file):
+    monkeypatch.setattr('settings.delivery_tier_timeout_seconds', TIER_TIMEOUT_SECONDS)
+    monkeypatch.setattr('settings.peer_timeout_seconds', 1)
+    monkeypatch.setattr('settings.peer_ping_time_seconds', 1)
+    monkeypatch.setattr('settings.port_prediction_range', 1)
+    monkeypatch.setattr('settings.relay_choice_attempts', 4)
+    monkeypatch.setattr('settings.relay_probe_timeout_seconds', TIER_TIMEOUT_SECONDS)
+
+
+@pytest.fixture
+def network(monkeypatch):
+    network = Network()
+    monkeypatch.setattr(
+        ClientConnection, 'message_was_never_received',
+        lambda connection: connection.get_remote_addr() not in network.answered)
+    return network
+
+
+def make_connection(net_pool, addr, number):
+    connection = net_pool.create_connection(addr, None)
+    connection.set_pub_key(number.to_bytes(64, 'big'))
+    connection.type = ConnectionType.client
+    return connection
+
+
+def deliver(network, addrs, on_start=None):
+    async def run():
+        net_pool = ClientNetPool()
+        handler = StrategyHandler(net_pool, network)
+        relay_connection = make_connection(net_pool, RELAY_ADDR, 1000)
+        net_pool.add_connection(relay_connection)
+        network.answered.add(RELAY_ADDR)
+        connections = [make_connection(net_pool, addr, number) for number, addr in enumerate(addrs, 1)]
+        if on_start is not None:
+            on_start(net_pool)
+        delivered = await handler._ClientHandler__delivered_by_strategies(Datagram(relay_connection), connections)
+        strategies = [Peers().get_delivery_strategy(connection) for connection in connections]
+        return delivered, strategies, net_pool
+
+    return asyncio.run(run())
+
+
+def get_delivered_count(strategy):
+    return Metrics().counter('punch_strategy_delivered', strategy=strategy).get_value()
+
+
+def test_every_strategy_is_tried_in_order(network):
+    direct_addr, predicted_addr, relayed_addr, lost_addr = [('10.0.0.{}'.format(number), 5000) for number in range(1, 5)]
+    network.direct.update({direct_addr, (predicted_addr[0], predicted_addr[1] + 1)})
+    network.via_relay.add(relayed_addr)
+    delivered, strategies, net_pool = deliver(network, [direct_addr, predicted_addr, relayed_addr, lost_addr])
+    assert delivered == [True, True, True, False]
+    assert strategies == ['direct', 'port prediction', 'relay', None]
+    assert net_pool.get_connection_by_addr(relayed_addr).relay is not None
+    assert net_pool.get_connection_by_addr(lost_addr) is None
+
+
+def test_remembered_strategy_is_tried_first(network):
+    relayed_addr = ('10.0.0.1', 5000)
+    network.via_relay.add(relayed_addr)
+    deliver(network, [relayed_addr])
+    assert get_delivered_count('relay') == 1
+    network.answered.discard(relayed_addr)
+    delivered, strategies, _ = deliver(network, [relayed_addr])
+    assert delivered == [True]
+    assert strategies == ['relay']
+    assert get_delivered_count('relay') == 2
+    assert Metrics().counter('punch_strategy_lost', strategy='direct').get_value() == 1
+
+
+def test_peer_that_came_in_by_itself_is_direct(network):
+    # the peer punched us while port prediction was timing out, the relay
+    # would have reached it too but it is not asked
+    addr = ('10.0.0.1', 5000)
+    network.via_relay.add(addr)
+
+    def came_in(net_pool):
+        connection = ClientConnection(remote_addr=addr, transport=None)
+        connection.set_pub_key((1).to_bytes(64, 'big'))
+        connection.type = ConnectionType.client
+        asyncio.get_running_loop().call_later(TIER_TIMEOUT_SECONDS * 1.5, net_pool.add_connection, connection)
+
+    delivered, strategies, net_pool = deliver(network, [addr], on_start=came_in)
+    assert delivered == [True]
+    assert strategies == ['direct']
+    assert net_pool.get_connection_by_addr(addr).relay is None
+    assert get_delivered_count('relay') == 0
+    assert get_delivered_count('direct') == 1
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+__author__ = 'Akinava'
+__author_email__ = 'akinava@gmail.com'
+__copyright__ = "Copyright © 2019"
+__license__ = "MIT License"
+__version__ = [0, 0]
+
+
+import pytest
+from fingerprint_cache import FingerprintCache
+
+
+class KeyConnection:
+    def __init__(self, number):
+        self.pub_key = number.to_bytes(64, 'big')
+
+    def get_pub_key(self):
+        return self.pub_key
+
+    def get_encrypt_marker(self):
+        return 0
+
+
+def make_fingerprint(number):
+    return number.to_bytes(32, 'big')
+
+
+@pytest.fixture(autouse=True)
+def cache_settings(monkeypatch):
+    monkeypatch.setattr('settings.fingerprint_cache_size', 2)
+    monkeypatch.setattr('settings.fingerprint_unknown_cache_size', 2)
+    monkeypatch.setattr('settings.fingerprint_unknown_ttl_seconds', 60)
+
+
+def test_known_fingerprint_is_a_hit():
+    connection = KeyConnection(1)
+    FingerprintCache().put(make_fingerprint(1), connection)
+    key_material, cached = FingerprintCache().get(make_fingerprint(1))
+    assert cached
+    assert key_material.connection is connection
+    assert key_material.pub_key == connection.get_pub_key()
+
+
+def test_missing_fingerprint_is_a_miss():
+    assert FingerprintCache().get(make_fingerprint(1)) == (None, False)
+
+
+def test_unknown_fingerprint_is_cached_until_ttl(monkeypatch):
+    FingerprintCache().put_unknown(make_fingerprint(1))
+    assert FingerprintCache().get(make_fingerprint(1)) == (None, True)
+    monkeypatch.setattr('settings.fingerprint_unknown_ttl_seconds', -1)
+    FingerprintCache().put_unknown(make_fingerprint(2))
+    assert FingerprintCache().get(make_fingerprint(2)) == (None, False)
+
+
+def test_known_fingerprints_are_evicted_least_recently_used():
+    for number in range(1, 4):
+        if number == 3:
+            FingerprintCache().get(make_fingerprint(1))
+        FingerprintCache().put(make_fingerprint(number), KeyConnection(number))
+    assert FingerprintCache().get(make_fingerprint(1))[1]
+    assert not FingerprintCache().get(make_fingerprint(2))[1]
+    assert FingerprintCache().get(make_fingerprint(3))[1]
+
+
+def test_unknown_flood_does_not_evict_known():
+    FingerprintCache().put(make_fingerprint(1), KeyConnection(1))
+    for number in range(100, 110):
+        FingerprintCache().put_unknown(make_fingerprint(number))
+    assert FingerprintCache().get(make_fingerprint(1))[0] is not None
+    assert not FingerprintCache().get(make_fingerprint(100))[1]
+
+
+def test_put_and_invalidate_drop_unknown_entry():
+    FingerprintCache().put_unknown(make_fingerprint(1))
+    FingerprintCache().put(make_fingerprint(1), KeyConnection(1))
+    assert FingerprintCache().get(make_fingerprint(1))[0] is not None
+    FingerprintCache().invalidate(make_fingerprint(1))
+    assert FingerprintCache().get(make_fingerprint(1)) == (None, False)
+
+
+def test_unknown_ttl_follows_the_loop_clock(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr('fingerprint_cache.get_loop_time', lambda: clock[0])
+    FingerprintCache().put_unknown(make_fingerprint(1))
+    clock[0] += 59
+    assert FingerprintCache().get(make_fingerprint(1)) == (None, True)
+    clock[0] += 2
+    assert FingerprintCache().get(make_fingerprint(1)) == (None, False)
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+__author__ = 'Akinava'
+__author_email__ = 'akinava@gmail.com'
+__copyright__ = "Copyright © 2019"
+__license__ = "MIT License"
+__version__ = [0, 0]
+
+
+import asyncio
+from client_net_pool import ClientNetPool
+from client_connection import ConnectionType
+from keepalive import Keepalive
+
+
+def make_connection(net_pool, number):
+    connection = net_pool.create_connection(('10.0.0.{}'.format(number), 2004), None)
+    connection.set_pub_key(number.to_bytes(64, 'big'))
+    connection.type = ConnectionType.client
+    return connection
+
+
+def test_keepalive_disconnects_silent_connection(monkeypatch):
+    # the timeout of a pooled connection is kept by Keepalive
+    monkeypatch.setattr('settings.peer_timeout_seconds', 0.2)
+    monkeypatch.setattr('settings.peer_ping_time_seconds', 0.1)
+
+    async def run():
+        net_pool = ClientNetPool()
+        pings = []
+        Keepalive().start(send_ping=pings.append, disconnect=net_pool.disconnect)
+        silent = make_connection(net_pool, 1)
+        answering = make_connection(net_pool, 2)
+        net_pool.add_connection(silent)
+        net_pool.add_connection(answering)
+        for _ in range(8):
+            await asyncio.sleep(0.05)
+            Keepalive().received(answering.get_remote_addr())
+        return net_pool, pings, silent, answering
+
+    net_pool, pings, silent, answering = asyncio.run(run())
+    assert net_pool.get_all_client_connections() == [answering]
+    assert silent in pings
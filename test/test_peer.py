@@ -15,7 +15,9 @@ sys.path.append(os.path.join(path, 'src'))
 
 
 from client_host import Client
+from workers import Workers
 from datagram import Datagram
+import settings
 from settings import logger
 from utilit import now
 from crypt_tools import Tools as CryptTools
@@ -113,9 +115,12 @@ class Handler:
 
 if __name__ == '__main__':
     logger.info('test client start')
-    test_client = Client(handler=Handler, protocol=PROTOCOL)
     try:
-        asyncio.run(test_client.run())
+        if settings.workers > 1:
+            Workers(handler=Handler, protocol=PROTOCOL, workers_count=settings.workers).run()
+        else:
+            test_client = Client(handler=Handler, protocol=PROTOCOL)
+            asyncio.run(test_client.run())
     except KeyboardInterrupt:
         logger.info('test client interrupted')
     logger.info('test client shutdown')
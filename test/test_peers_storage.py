@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+__author__ = 'Akinava'
+__author_email__ = 'akinava@gmail.com'
+__copyright__ = "Copyright © 2019"
+__license__ = "MIT License"
+__version__ = [0, 0]
+
+
+import json
+from peers_storage import PeersStorage
+
+
+def make_peer(number, **kwargs):
+    peer = {
+        'type': 'client',
+        'protocol': 'udp',
+        'host': '10.0.0.{}'.format(number),
+        'port': 2004,
+        'pub_key': 'key{}'.format(number),
+    }
+    peer.update(kwargs)
+    return peer
+
+
+def load(peers_file):
+    return list(PeersStorage(peers_file).iter_load())
+
+
+def test_load_streams_snapshot(peers_file):
+    peers = [make_peer(number) for number in range(3)]
+    with open(peers_file, 'w') as f:
+        f.write(json.dumps(peers, indent=4))
+    assert load(peers_file) == peers
+
+
+def test_log_is_replayed_after_snapshot(peers_file):
+    with open(peers_file, 'w') as f:
+        f.write(json.dumps([make_peer(1)]))
+    storage = PeersStorage(peers_file)
+    storage.put(make_peer(1, last_response='2020-01-01 00:00:00'))
+    storage.put(make_peer(2))
+    storage.close()
+    assert load(peers_file) == [make_peer(1), make_peer(1, last_response='2020-01-01 00:00:00'), make_peer(2)]
+
+
+def test_torn_log_record_is_skipped(peers_file):
+    # a crash in the middle of an append leaves half a line at the tail
+    storage = PeersStorage(peers_file)
+    storage.put(make_peer(1))
+    storage.close()
+    with open(peers_file + '.log', 'a') as f:
+        f.write(json.dumps(make_peer(2))[:10])
+    assert load(peers_file) == [make_peer(1)]
+
+
+def test_put_keeps_last_record_of_peer_until_flush(peers_file):
+    storage = PeersStorage(peers_file, scheduled_flush=False)
+    storage.put(make_peer(1))
+    storage.put(make_peer(1, port=2005))
+    storage.put(make_peer(1, last_response='2020-01-01 00:00:00'))
+    assert load(peers_file) == []
+    storage.flush()
+    storage.close()
+    assert load(peers_file) == [make_peer(1, last_response='2020-01-01 00:00:00'), make_peer(1, port=2005)]
+
+
+def test_compaction_folds_log_into_snapshot(peers_file, monkeypatch):
+    monkeypatch.setattr('settings.peers_log_compact_size', 3)
+    with open(peers_file, 'w') as f:
+        f.write(json.dumps([make_peer(1), make_peer(2)]))
+    storage = PeersStorage(peers_file)
+    storage.put(make_peer(1, last_response='2020-01-01 00:00:00'))
+    storage.put(make_peer(3))
+    storage.put(make_peer(4))
+    storage.close()
+    with open(peers_file, 'r') as f:
+        snapshot = json.loads(f.read())
+    with open(peers_file + '.log', 'r') as f:
+        assert f.read() == ''
+    assert snapshot == [make_peer(1, last_response='2020-01-01 00:00:00'), make_peer(2), make_peer(3), make_peer(4)]
+    assert load(peers_file) == snapshot
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+__author__ = 'Akinava'
+__author_email__ = 'akinava@gmail.com'
+__copyright__ = "Copyright © 2019"
+__license__ = "MIT License"
+__version__ = [0, 0]
+
+
+import json
+import time
+from datetime import datetime, timedelta
+import pytest
+import settings
+from cryptotool import B58
+from client_handler import ClientHandler
+from peer_score import PeerScore
+from peers import Peers
+from servers_list_cache import ServersListCache
+
+
+SERVERS_LIST_MAX_LENGTH = 2
+
+
+class Parser:
+    protocol = {'list': {'hpn_servers_list': {'length': {'min': 0, 'max': SERVERS_LIST_MAX_LENGTH}}}}
+
+
+class ServersListHandler(ClientHandler):
+    # a packed server is its address, the cache keeps what pack_server made
+    def __init__(self):
+        pass
+
+    def parser(self):
+        return Parser()
+
+    def pack_server(self, server_data):
+        return server_data['host'], server_data['port']
+
+
+class ServerConnection:
+    def __init__(self, number):
+        self.number = number
+        self.score = PeerScore()
+
+    def get_pub_key(self):
+        return self.number.to_bytes(64, 'big')
+
+    def get_remote_addr(self):
+        return get_server_addr(self.number)
+
+
+def get_server_addr(number):
+    return '10.0.0.{}'.format(number), 2004
+
+
+def make_server(number, last_response):
+    host, port = get_server_addr(number)
+    return {
+        'type': 'server',
+        'protocol': 'udp',
+        'host': host,
+        'port': port,
+        'pub_key': B58().pack(number.to_bytes(64, 'big')),
+        'last_response': datetime.fromtimestamp(last_response).strftime(settings.DATA_FORMAT),
+    }
+
+
+@pytest.fixture
+def servers(peers_file):
+    # three fresh servers, the one with the highest number answered last
+    now = time.time()
+    with open(peers_file, 'w') as f:
+        json.dump([make_server(number, now - 100 * (4 - number)) for number in range(1, 4)], f)
+    return now
+
+
+def test_cache_misses_on_new_version_and_expiry(monkeypatch):
+    cache = ServersListCache()
+    assert cache.get(1) is None
+    cache.put(servers_version=1, expiry_time=time.time() + 60, servers_list=['server'])
+    assert cache.get(1) == ['server']
+    assert cache.get(2) is None
+    monkeypatch.setattr('time.time', lambda: cache._ServersListCache__expiry_time)
+    assert cache.get(1) is None
+    assert cache.get_stats() == {'hits': 1, 'misses': 3}
+
+
+def test_servers_list_is_packed_once(servers):
+    handler = ServersListHandler()
+    assert handler.get_hpn_servers_list() == [get_server_addr(3), get_server_addr(2)]
+    assert handler.get_hpn_servers_list() == [get_server_addr(3), get_server_addr(2)]
+    assert ServersListCache().get_stats() == {'hits': 1, 'misses': 1}
+
+
+def test_server_response_invalidates_list(servers):
+    handler = ServersListHandler()
+    handler.get_hpn_servers_list()
+    Peers().update_peer_last_response_field(ServerConnection(1))
+    assert handler.get_hpn_servers_list() == [get_server_addr(1), get_server_addr(3)]
+    assert ServersListCache().get_stats() == {'hits': 0, 'misses': 2}
+
+
+def test_new_server_invalidates_list(servers):
+    handler = ServersListHandler()
+    handler.get_hpn_servers_list()
+    Peers().save_servers_list([{
+        'hpn_servers_addr': get_server_addr(4),
+        'hpn_servers_pub_key': (4).to_bytes(64, 'big'),
+        'hpn_servers_protocol': 'udp'}])
+    # the new server has not answered yet, it is not fresh
+    assert handler.get_hpn_servers_list() == [get_server_addr(3), get_server_addr(2)]
+    assert ServersListCache().get_stats() == {'hits': 0, 'misses': 2}
+
+
+def test_list_expires_with_its_oldest_server(servers, monkeypatch):
+    handler = ServersListHandler()
+    handler.get_hpn_servers_list()
+    # server 2 answered 200 seconds ago and goes stale first
+    timeout_seconds = timedelta(days=settings.servers_timeout_days).total_seconds()
+    monkeypatch.setattr('time.time', lambda: servers + timeout_seconds - 150)
+    assert handler.get_hpn_servers_list() == [get_server_addr(3)]
+    assert ServersListCache().get_stats() == {'hits': 0, 'misses': 2}
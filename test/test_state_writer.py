@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+__author__ = 'Akinava'
+__author_email__ = 'akinava@gmail.com'
+__copyright__ = "Copyright © 2019"
+__license__ = "MIT License"
+__version__ = [0, 0]
+
+
+import random
+import asyncio
+import threading
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+import pytest
+from client_net_pool import ClientNetPool
+from client_connection import ConnectionType
+from peers import Peers
+from state_writer import StateWriter
+from blocking_executor import BlockingExecutor
+
+
+SERVERS_LENGTH = 16
+RESPONSES_LENGTH = 50
+NEIGHBOURS_LENGTH = 16
+UNIVERSE_LENGTH = 1000
+THREADS_LENGTH = 8
+
+
+def make_addr(number):
+    return '10.{}.{}.{}'.format(number >> 16 & 0xff, number >> 8 & 0xff, number & 0xff), 2004 + number % 1000
+
+
+def make_pub_key(number):
+    return number.to_bytes(64, 'big')
+
+
+def is_delivered(number):
+    # every neighbour has one fate, so the final pool does not depend
+    # on the order the server responses were applied in
+    return number % 3 != 0
+
+
+def add_write(writes, write):
+    # a write made on the loop has already run, one from a thread is queued
+    if isinstance(write, Future):
+        writes.append(write)
+
+
+def handle_server_response(net_pool, neighbours):
+    # what ClientHandler.hpn_servers_request and the delivery batch do,
+    # a thread waits for its own writes before it reads them back
+    writes = []
+    for number in neighbours:
+        connection = net_pool.create_connection(make_addr(number), None)
+        connection.set_pub_key(make_pub_key(number))
+        connection.type = ConnectionType.client
+        add_write(writes, net_pool.add_connection(connection))
+    for write in writes:
+        write.result()
+    writes = []
+    for number in neighbours:
+        connection = net_pool.get_connection_by_addr(make_addr(number))
+        if connection is None:
+            continue
+        if is_delivered(number):
+            add_write(writes, Peers().add_client_peer(connection))
+        else:
+            add_write(writes, net_pool.disconnect(connection))
+    return writes
+
+
+async def serve_server(net_pool, executor, server_random, from_thread):
+    loop = asyncio.get_running_loop()
+    for _ in range(RESPONSES_LENGTH):
+        neighbours = server_random.sample(range(UNIVERSE_LENGTH), NEIGHBOURS_LENGTH)
+        if from_thread:
+            writes = await loop.run_in_executor(executor, handle_server_response, net_pool, neighbours)
+        else:
+            writes = handle_server_response(net_pool, neighbours)
+        for write in writes:
+            await asyncio.wrap_future(write)
+        await asyncio.sleep(0)
+
+
+async def stress():
+    StateWriter().start(asyncio.get_running_loop())
+    Peers().load_async()
+    await Peers().wait_bootstrap_ready()
+    net_pool = ClientNetPool()
+    seen_numbers = set()
+    servers = []
+    with ThreadPoolExecutor(max_workers=THREADS_LENGTH) as executor:
+        for server_number in range(SERVERS_LENGTH):
+            seen_random = random.Random(server_number)
+            for _ in range(RESPONSES_LENGTH):
+                seen_numbers.update(seen_random.sample(range(UNIVERSE_LENGTH), NEIGHBOURS_LENGTH))
+            servers.append(serve_server(
+                net_pool, executor, random.Random(server_number), from_thread=server_number % 2 == 0))
+        await asyncio.gather(*servers)
+    return net_pool, seen_numbers
+
+
+def test_concurrent_server_responses(peers_file):
+    net_pool, seen_numbers = asyncio.run(stress())
+    expected_addrs = {make_addr(number) for number in seen_numbers if is_delivered(number)}
+    pool_addrs = Counter(connection.get_remote_addr() for connection in net_pool.connections_list)
+    client_addrs = Counter(connection.get_remote_addr() for connection in net_pool.get_all_client_connections())
+    assert max(pool_addrs.values()) == 1
+    assert max(client_addrs.values()) == 1
+    assert set(pool_addrs) == expected_addrs
+    assert set(client_addrs) == expected_addrs
+    for connection in net_pool.connections_list:
+        assert net_pool.get_connection_by_fingerprint(connection.get_fingerprint()) is connection
+    peer_addrs = Counter((peer['host'], peer['port']) for peer in Peers()._Peers__peers_by_type.get('client', []))
+    assert max(peer_addrs.values()) == 1
+    assert set(peer_addrs) == expected_addrs
+
+
+def test_apply_on_writer_runs_inline():
+    assert StateWriter().apply(lambda value: value + 1, 1) == 2
+
+
+def test_apply_from_thread_does_not_wait_for_loop():
+    async def run():
+        StateWriter().start(asyncio.get_running_loop())
+        calls = []
+        applied = threading.Event()
+
+        def write_from_thread():
+            # the loop is blocked in this test, the write only gets queued
+            future = StateWriter().apply(calls.append, 'write')
+            applied.set()
+            return future
+
+        futures = []
+        thread = threading.Thread(target=lambda: futures.append(write_from_thread()))
+        thread.start()
+        assert applied.wait(timeout=5)
+        thread.join()
+        future, = futures
+        assert not future.done()
+        assert calls == []
+        await asyncio.wrap_future(future)
+        assert calls == ['write']
+
+    asyncio.run(run())
+
+
+def test_apply_from_thread_reports_error():
+    def fail():
+        raise ValueError('write failed')
+
+    async def run():
+        StateWriter().start(asyncio.get_running_loop())
+        future = await asyncio.get_running_loop().run_in_executor(None, StateWriter().apply, fail)
+        await asyncio.wrap_future(future)
+
+    with pytest.raises(ValueError):
+        asyncio.run(run())
+
+
+def test_blocking_work_writes_through_the_loop(peers_file):
+    async def run():
+        StateWriter().start(asyncio.get_running_loop())
+        net_pool = ClientNetPool()
+
+        def blocking_work():
+            connection = net_pool.create_connection(make_addr(1), None)
+            connection.set_pub_key(make_pub_key(1))
+            connection.type = ConnectionType.client
+            write = net_pool.add_connection(connection)
+            assert isinstance(write, Future)
+            return write
+
+        write = await BlockingExecutor().run(blocking_work)
+        await asyncio.wrap_future(write)
+        return net_pool
+
+    net_pool = asyncio.run(run())
+    assert [connection.get_remote_addr() for connection in net_pool.get_all_client_connections()] == [make_addr(1)]
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+__author__ = 'Akinava'
+__author_email__ = 'akinava@gmail.com'
+__copyright__ = "Copyright © 2019"
+__license__ = "MIT License"
+__version__ = [0, 0]
+
+
+import asyncio
+import pytest
+from swarm import Backoff, SwarmMaintainer
+from peer_score import PeerScore
+
+
+PING_TIME_SECONDS = 0.1
+RUN_SECONDS = 0.5
+
+
+class SwarmConnection:
+    def __init__(self, number):
+        self.remote_addr = ('10.0.0.{}'.format(number), 2004)
+        self.score = PeerScore()
+
+    def get_remote_addr(self):
+        return self.remote_addr
+
+
+class SwarmNetPool:
+    # the part of ClientNetPool SwarmMaintainer reads, the pool never fills up
+    def __init__(self, clients):
+        self.clients = clients
+
+    def has_enough_client_connections(self):
+        return False
+
+    def has_client_connection(self):
+        return len(self.clients) > 0
+
+    def get_all_client_connections(self):
+        return self.clients
+
+    def get_server_connections(self):
+        return []
+
+
+class Listener:
+    def __init__(self, loop, seconds):
+        self.close_time = loop.time() + seconds
+        self.loop = loop
+
+    def is_closing(self):
+        return self.loop.time() >= self.close_time
+
+
+@pytest.fixture(autouse=True)
+def swarm_settings(monkeypatch):
+    monkeypatch.setattr('settings.peer_ping_time_seconds', PING_TIME_SECONDS)
+    monkeypatch.setattr('settings.peer_connections', 10)
+    monkeypatch.setattr('settings.swarm_max_in_flight', 4)
+    monkeypatch.setattr('settings.swarm_backoff_base_seconds', PING_TIME_SECONDS)
+    monkeypatch.setattr('settings.swarm_backoff_max_seconds', 1)
+
+
+def serve(clients, connect_via_client, connect_via_server=None):
+    async def run():
+        maintainer = SwarmMaintainer(
+            net_pool=SwarmNetPool(clients),
+            connect_via_client=connect_via_client,
+            connect_via_server=connect_via_server)
+        await maintainer.serve(Listener(asyncio.get_running_loop(), RUN_SECONDS))
+
+    asyncio.run(run())
+
+
+def count_calls(calls, connection):
+    return sum(1 for called in calls if called is connection)
+
+
+def test_answered_client_is_asked_once_per_ping_time():
+    clients = [SwarmConnection(number) for number in range(3)]
+    calls = []
+
+    async def connect_via_client(connection):
+        calls.append(connection)
+        return True
+
+    serve(clients, connect_via_client)
+    max_calls = RUN_SECONDS / PING_TIME_SECONDS + 1
+    for connection in clients:
+        assert 1 <= count_calls(calls, connection) <= max_calls
+
+
+def test_client_in_flight_is_not_asked_again():
+    clients = [SwarmConnection(number) for number in range(3)]
+    calls = []
+
+    async def connect_via_client(connection):
+        calls.append(connection)
+        await asyncio.sleep(RUN_SECONDS * 2)
+        return True
+
+    serve(clients, connect_via_client)
+    assert sorted(calls, key=id) == sorted(clients, key=id)
+
+
+def test_silent_client_backs_off():
+    clients = [SwarmConnection(number) for number in range(3)]
+    calls = []
+
+    async def connect_via_client(connection):
+        calls.append(connection)
+        return False
+
+    serve(clients, connect_via_client)
+    # the delays of the failures are 0.05-0.1, 0.1-0.2 and 0.2-0.4 seconds
+    for connection in clients:
+        assert 1 <= count_calls(calls, connection) <= 4
+
+
+def test_backoff_paces_succeeded_key(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr('swarm.get_loop_time', lambda: clock[0])
+    backoff = Backoff(base_seconds=1, max_seconds=8, min_seconds=2)
+    backoff.failed('key')
+    assert not backoff.is_ready('key')
+    clock[0] += 1
+    assert backoff.is_ready('key')
+    backoff.succeeded('key')
+    assert not backoff.is_ready('key')
+    assert backoff.get_next_retry_time() == clock[0] + 2
+    clock[0] += 2
+    assert backoff.is_ready('key')
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+__author__ = 'Akinava'
+__author_email__ = 'akinava@gmail.com'
+__copyright__ = "Copyright © 2019"
+__license__ = "MIT License"
+__version__ = [0, 0]
+
+
+import asyncio
+from timer_wheel import TimerWheel
+
+
+TICK_SECONDS = 0.01
+
+
+def run_wheel(wheel, delays, wait_seconds, cancel=()):
+    async def run():
+        loop = asyncio.get_running_loop()
+        start_time = loop.time()
+        fired = []
+        timers = [wheel.schedule(delay, lambda delay: fired.append((delay, loop.time() - start_time)), delay)
+                  for delay in delays]
+        for index in cancel:
+            timers[index].cancel()
+        await asyncio.sleep(wait_seconds)
+        return fired
+
+    return asyncio.run(run())
+
+
+def test_timers_fire_in_order_and_never_early():
+    wheel = TimerWheel(tick_seconds=TICK_SECONDS)
+    delays = [0.08, 0.01, 0.05, 0.03, 0.05]
+    fired = run_wheel(wheel, delays, wait_seconds=0.3)
+    assert [delay for delay, _ in fired] == sorted(delays)
+    for delay, fire_time in fired:
+        assert fire_time >= delay
+    assert len(wheel) == 0
+
+
+def test_cancelled_timer_does_not_fire():
+    wheel = TimerWheel(tick_seconds=TICK_SECONDS)
+    fired = run_wheel(wheel, [0.02, 0.04], wait_seconds=0.2, cancel=[0])
+    assert [delay for delay, _ in fired] == [0.04]
+    assert len(wheel) == 0
+
+
+def test_timers_cascade_from_upper_levels_and_overflow():
+    # a slot of the first level is a tick, of the second 4 ticks and
+    # beyond 16 ticks the timer waits in the overflow list
+    wheel = TimerWheel(tick_seconds=TICK_SECONDS, slots_length=4, levels_length=2)
+    delays = [0.02, 0.07, 0.15, 0.33]
+    fired = run_wheel(wheel, delays, wait_seconds=0.6)
+    assert [delay for delay, _ in fired] == delays
+    for delay, fire_time in fired:
+        assert fire_time >= delay
+    assert len(wheel) == 0
+
+
+def test_timer_scheduled_from_callback():
+    wheel = TimerWheel(tick_seconds=TICK_SECONDS)
+
+    async def run():
+        fired = []
+
+        def fire(count):
+            fired.append(count)
+            if count < 3:
+                wheel.schedule(0.01, fire, count + 1)
+
+        wheel.schedule(0.01, fire, 1)
+        await asyncio.sleep(0.3)
+        return fired
+
+    assert asyncio.run(run()) == [1, 2, 3]